@@ -0,0 +1,133 @@
+"""データ取得(FetchController)の速さを、Fitbit APIの代わりのサーバー(fitbit_simulator.py)で計測する
+
+取得エンジン(thread/async)・取得モード(daily/range)・同時リクエスト数の組み合わせごとに、
+空のデータベースへ同じ期間を取得し、1秒あたりの日数とリクエスト数、429の数を表示する。
+サーバーはこのプロセスの中で起動し、データベースは一時フォルダに作る。
+
+使い方(リポジトリのルートで実行):
+    python benchmarks/fetch_benchmark.py [--days 90] [--latency-ms 50] [--concurrency 1,4,10,20]
+                                         [--engines thread,async] [--modes daily,range] [--output result.json]
+    レート制限の動きを見るとき: --rate-limit 150 --window 10
+"""
+import argparse
+from datetime import date, datetime, timedelta
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fitbit_simulator
+from fitbit_app.controllers.fetch_controller import FetchController
+from fitbit_app.metrics import Metrics
+from fitbit_app.models.credential import Credential
+from fitbit_app.models.database import Database
+
+CLIENT_ID = 'SIMULATOR'
+
+def bench_fetch(api_endpoint: str, simulator, engine: str, mode: str, concurrency: int,
+                start_date: date, end_date: date) -> dict:
+    """空のデータベースに期間を取得し、速さを返す"""
+    cwd = os.getcwd()
+    work_dir = tempfile.mkdtemp(prefix='fitbit_fetch_bench_')
+    stats_before = dict(simulator.stats)
+    try:
+        os.chdir(work_dir)
+        Credential.client_id = CLIENT_ID
+        Credential.client_secret = 'secret'
+        Credential.access_token = 'access-token'
+        Credential.refresh_token = 'refresh-token'
+        Credential.expires_at = ''
+
+        controller = FetchController(
+            None, start_date, end_date, None, None,
+            fetch_mode=mode, sync_missing_only=False, fetch_engine=engine,
+            api_endpoint=api_endpoint, concurrency=concurrency
+        )
+
+        with Metrics.capture() as run:
+            started = time.perf_counter()
+            controller.fetch()
+            seconds = time.perf_counter() - started
+        counters = run.records()['counters']
+    finally:
+        Database.close()
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    days = (end_date - start_date).days + 1
+    server = {name: simulator.stats[name] - stats_before[name] for name in simulator.stats}
+    return {
+        'engine': engine,
+        'mode': mode,
+        'concurrency': concurrency,
+        'days': days,
+        'seconds': round(seconds, 4),
+        'days_per_second': round(days / seconds, 2),
+        'requests': server['requests'],
+        'requests_per_second': round(server['requests'] / seconds, 2),
+        'responses_429': server['responses_429'],
+        'token_refreshes': server['token_refreshes'],
+        'rows_written': counters.get('db.rows_written', 0),
+    }
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='データ取得の速さを計測する')
+    parser.add_argument('--days', type=int, default=90, help='取得する日数(既定: 90)')
+    parser.add_argument('--engines', default='thread,async', help='取得エンジン(カンマ区切り、既定: thread,async)')
+    parser.add_argument('--modes', default='daily,range', help='取得モード(カンマ区切り、既定: daily,range)')
+    parser.add_argument('--concurrency', default='1,4,10,20', help='同時リクエスト数(カンマ区切り、既定: 1,4,10,20)')
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='サーバーの応答までの遅延(ミリ秒、既定: 50)')
+    parser.add_argument('--jitter-ms', type=float, default=10.0, help='遅延のばらつき(ミリ秒、既定: 10)')
+    parser.add_argument('--rate-limit', type=int, default=100000, help='時間枠あたりのリクエスト数の上限(既定: 100000)')
+    parser.add_argument('--window', type=float, default=3600, help='レート制限の時間枠(秒、既定: 3600)')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='ランダムに429を返す割合(0~1)')
+    parser.add_argument('--token-ttl', type=float, default=0.0, help='アクセストークンの有効期限(秒、0なら期限切れにしない)')
+    parser.add_argument('--output', help='結果を保存するJSONファイル')
+    args = parser.parse_args(argv)
+
+    end_date = date(2024, 12, 31)
+    start_date = end_date - timedelta(days=args.days - 1)
+
+    simulator = fitbit_simulator.FitbitSimulator(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        rate_limit=args.rate_limit, window_seconds=args.window,
+        throttle_rate=args.throttle_rate, token_ttl=args.token_ttl
+    )
+    api_endpoint = fitbit_simulator.start(simulator)
+    Metrics.enabled = True
+
+    results = []
+    try:
+        print(f"{'engine':<8}{'mode':<7}{'conc':>5}{'days':>6}{'seconds':>9}{'days/s':>9}{'req/s':>8}{'429':>5}")
+        for engine in args.engines.split(','):
+            for mode in args.modes.split(','):
+                for concurrency in (int(value) for value in args.concurrency.split(',')):
+                    result = bench_fetch(api_endpoint, simulator, engine, mode, concurrency, start_date, end_date)
+                    results.append(result)
+                    print(
+                        f"{engine:<8}{mode:<7}{concurrency:>5}{result['days']:>6}{result['seconds']:>9.2f}"
+                        f"{result['days_per_second']:>9.1f}{result['requests_per_second']:>8.1f}"
+                        f"{result['responses_429']:>5}"
+                    )
+    finally:
+        fitbit_simulator.stop()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'benchmark': 'fetch',
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'settings': vars(args),
+                'results': results,
+            }, f, ensure_ascii=False, indent=2)
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
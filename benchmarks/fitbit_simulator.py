@@ -0,0 +1,337 @@
+"""負荷試験用のFitbit APIの代わりのサーバー(CherryPy)
+
+アプリが使うエンドポイントだけを実装し、日付ごとに決まった合成データ(generate_data.py と同じ作り方)を返す。
+- 歩数: activities/steps/date/{日付}/1d/15min.json(intraday_time_series)、activities/steps/date/{開始日}/{終了日}.json
+- 睡眠: sleep/date/{日付}.json(get_sleep)、sleep/date/{開始日}/{終了日}.json
+- トークンの更新: POST /oauth2/token
+レート制限のヘッダー(Fitbit-Rate-Limit-*)を返し、上限を超えたら429を返す。応答の遅延、ランダムな429、
+アクセストークンの期限切れ(401 expired_token)も再現できる。
+
+使い方(リポジトリのルートで実行):
+    python benchmarks/fitbit_simulator.py [--port 8080] [--latency-ms 50] [--rate-limit 150] [--window 3600]
+    python main.py sync --api-endpoint http://127.0.0.1:8080 --start 2024-01-01 --end 2024-03-31
+"""
+import argparse
+from datetime import date, datetime, timedelta
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+
+import cherrypy
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from generate_data import SleepGenerator
+
+class RateWindow:
+    """Fitbit APIと同じく、時間枠ごとのリクエスト数を数える"""
+
+    def __init__(self, limit: int, window_seconds: float):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.count = 0
+        self.reset_at = time.monotonic() + window_seconds
+        self._lock = threading.Lock()
+
+    def take(self) -> tuple:
+        """1リクエスト分を数える
+
+        Returns:
+            tuple: (受け付けたか, 残りリクエスト数, リセットまでの秒数)
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now >= self.reset_at:
+                self.count = 0
+                self.reset_at = now + self.window_seconds
+
+            reset_in = max(1, int(self.reset_at - now + 0.999))
+            if self.count >= self.limit:
+                return False, 0, reset_in
+
+            self.count += 1
+            return True, self.limit - self.count, reset_in
+
+class FitbitSimulator:
+    """Fitbit APIの代わりに応答する(CherryPyのアプリ)"""
+
+    def __init__(self, seed=1, latency_ms=0.0, jitter_ms=0.0, rate_limit=150, window_seconds=3600,
+                 throttle_rate=0.0, token_ttl=0.0):
+        """
+        Args:
+            seed (int): 合成データの乱数のシード(同じ日付には同じデータを返す)
+            latency_ms (float): 応答までの遅延(ミリ秒)
+            jitter_ms (float): 遅延のばらつき(ミリ秒、一様分布)
+            rate_limit (int): 時間枠あたりのリクエスト数の上限
+            window_seconds (float): レート制限の時間枠(秒)
+            throttle_rate (float): 上限に関係なく429を返す割合(0~1)
+            token_ttl (float): アクセストークンの有効期限(秒)。0なら期限切れにしない
+        """
+        self.seed = seed
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_window = RateWindow(rate_limit, window_seconds)
+        self.throttle_rate = throttle_rate
+        self.token_ttl = token_ttl
+
+        # アクセストークン → 期限(最初に使われたときから token_ttl 秒)
+        self._token_expires = {}
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+
+        # 応答の数(ベンチマークで集計する)
+        self.stats = {'requests': 0, 'responses_429': 0, 'responses_401': 0, 'token_refreshes': 0}
+
+    @cherrypy.expose
+    def default(self, *path, **params):
+        """/{バージョン}/user/-/... のリクエストを振り分ける"""
+        if path[:2] == ('oauth2', 'token'):
+            return self._token()
+
+        self._count('requests')
+        self._sleep_latency()
+
+        error = self._check_token() or self._check_rate_limit()
+        if error:
+            return error
+
+        # path: (バージョン, 'user', '-', リソース..., 'date', 日付, ...)
+        if len(path) < 5 or path[1] != 'user' or 'date' not in path:
+            return self._error(404, 'not_found', 'Unknown resource')
+
+        date_index = path.index('date')
+        resource = '/'.join(path[3:date_index])
+        args = [part[:-len('.json')] if part.endswith('.json') else part for part in path[date_index + 1:]]
+
+        try:
+            # get_sleep は月日を0で埋めない(例: 2024-1-5)
+            dates = [datetime.strptime(arg, '%Y-%m-%d').date() for arg in args if arg.count('-') == 2]
+        except ValueError:
+            return self._error(400, 'validation', f'Invalid date: {"/".join(args)}')
+
+        if resource == 'activities/steps':
+            if len(args) == 3 and args[1] == '1d' and len(dates) == 1:
+                return self._json(self.steps_intraday(dates[0]))
+            if len(args) == 2 and len(dates) == 2:
+                return self._json(self.steps_range(*dates))
+
+        if resource == 'sleep':
+            if len(args) == 1 and len(dates) == 1:
+                return self._json(self.sleep_day(dates[0]))
+            if len(args) == 2 and len(dates) == 2:
+                return self._json(self.sleep_range(*dates))
+
+        return self._error(404, 'not_found', f'Unknown resource: {resource}')
+
+    def steps_intraday(self, current_date: date) -> dict:
+        step_count, _ = self._day(current_date)
+
+        # 1日の歩数を15分ごとに振り分ける(夜は歩かない)
+        rng = random.Random(f'{self.seed}-{current_date.isoformat()}-intraday')
+        weights = [0 if i < 28 or i > 90 else rng.random() for i in range(96)]
+        total_weight = sum(weights) or 1
+        dataset = [
+            {'time': f'{i // 4:02}:{i % 4 * 15:02}:00', 'value': int(step_count * weight / total_weight)}
+            for i, weight in enumerate(weights)
+        ]
+
+        return {
+            'activities-steps': [{'dateTime': current_date.isoformat(), 'value': str(step_count)}],
+            'activities-steps-intraday': {'dataset': dataset, 'datasetInterval': 15, 'datasetType': 'minute'},
+        }
+
+    def steps_range(self, start_date: date, end_date: date) -> dict:
+        return {
+            'activities-steps': [
+                {'dateTime': current_date.isoformat(), 'value': str(self._day(current_date)[0])}
+                for current_date in self._dates(start_date, end_date)
+            ]
+        }
+
+    def sleep_day(self, current_date: date) -> dict:
+        sleep = self._sleep_logs(current_date)
+        return {
+            'sleep': sleep,
+            'summary': {
+                'totalSleepRecords': len(sleep),
+                'totalMinutesAsleep': sum(sleep_log['minutesAsleep'] for sleep_log in sleep),
+                'totalTimeInBed': sum(sleep_log['timeInBed'] for sleep_log in sleep),
+            },
+        }
+
+    def sleep_range(self, start_date: date, end_date: date) -> dict:
+        if (end_date - start_date).days >= 100:
+            return self._error(400, 'validation', 'The date range must be 100 days or less')
+
+        # 期間APIは新しい日付から順に返す
+        sleep = []
+        for current_date in reversed(self._dates(start_date, end_date)):
+            sleep.extend(self._sleep_logs(current_date))
+        return {'sleep': sleep}
+
+    def _sleep_logs(self, current_date: date) -> list:
+        """1日分の睡眠記録(APIと同じく、新しい記録から順に並べる)"""
+        _, sleep_logs = self._day(current_date)
+
+        sleep = []
+        for log_id, levels_data in enumerate(sleep_logs):
+            start = datetime.strptime(levels_data[0]['dateTime'], '%Y-%m-%dT%H:%M:%S.%f')
+            seconds = sum(segment['seconds'] for segment in levels_data)
+            classic = levels_data[0]['level'] in ('asleep', 'restless', 'awake')
+            sleep.append({
+                'dateOfSleep': current_date.isoformat(),
+                'logId': int(current_date.strftime('%Y%m%d')) * 10 + log_id,
+                'startTime': levels_data[0]['dateTime'],
+                'endTime': (start + timedelta(seconds=seconds)).strftime('%Y-%m-%dT%H:%M:%S.000'),
+                'duration': seconds * 1000,
+                'minutesAsleep': sum(
+                    segment['seconds'] for segment in levels_data if segment['level'] not in ('wake', 'awake')
+                ) // 60,
+                'timeInBed': seconds // 60,
+                'isMainSleep': log_id == 0,
+                'type': 'classic' if classic else 'stages',
+                'levels': {'data': levels_data},
+            })
+
+        sleep.sort(key=lambda sleep_log: sleep_log['startTime'], reverse=True)
+        return sleep
+
+    def _day(self, current_date: date) -> tuple:
+        # 日付ごとに乱数を作り直すので、リクエストの順番によらず同じデータになる
+        return SleepGenerator(random.Random(f'{self.seed}-{current_date.isoformat()}')).day(current_date)
+
+    def _dates(self, start_date: date, end_date: date) -> list:
+        return [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+
+    def _token(self):
+        """トークンの更新(リフレッシュトークンは確認しない)"""
+        if cherrypy.request.method != 'POST':
+            return self._error(405, 'request', 'Method Not Allowed')
+
+        self._count('token_refreshes')
+        return self._json({
+            'access_token': uuid.uuid4().hex,
+            'refresh_token': uuid.uuid4().hex,
+            'expires_in': 28800,
+            'token_type': 'Bearer',
+            'user_id': 'SIMULATOR',
+            'scope': 'activity sleep',
+        })
+
+    def _check_token(self):
+        """アクセストークンが無い・期限切れなら401を返す"""
+        authorization = cherrypy.request.headers.get('Authorization', '')
+        if not authorization.startswith('Bearer '):
+            self._count('responses_401')
+            return self._error(401, 'invalid_token', 'Access token missing')
+
+        if not self.token_ttl:
+            return None
+
+        access_token = authorization[len('Bearer '):]
+        with self._lock:
+            expires_at = self._token_expires.setdefault(access_token, time.monotonic() + self.token_ttl)
+
+        if time.monotonic() >= expires_at:
+            self._count('responses_401')
+            return self._error(401, 'expired_token', f'Access token expired: {access_token}')
+        return None
+
+    def _check_rate_limit(self):
+        """レート制限のヘッダーを付け、上限を超えていたら429を返す"""
+        accepted, remaining, reset_in = self.rate_window.take()
+
+        headers = cherrypy.response.headers
+        headers['Fitbit-Rate-Limit-Limit'] = str(self.rate_window.limit)
+        headers['Fitbit-Rate-Limit-Remaining'] = str(remaining)
+        headers['Fitbit-Rate-Limit-Reset'] = str(reset_in)
+
+        with self._lock:
+            throttled = self._rng.random() < self.throttle_rate
+
+        if not accepted or throttled:
+            self._count('responses_429')
+            headers['Retry-After'] = str(reset_in if not accepted else 1)
+            return self._error(429, 'request', 'Too Many Requests')
+        return None
+
+    def _sleep_latency(self):
+        if self.latency_ms or self.jitter_ms:
+            with self._lock:
+                jitter = self._rng.uniform(-self.jitter_ms, self.jitter_ms)
+            time.sleep(max(0.0, self.latency_ms + jitter) / 1000)
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _json(self, body: dict) -> bytes:
+        cherrypy.response.headers['Content-Type'] = 'application/json'
+        return json.dumps(body).encode('utf8')
+
+    def _error(self, status: int, error_type: str, message: str) -> bytes:
+        cherrypy.response.status = status
+        return self._json({'errors': [{'errorType': error_type, 'message': message}], 'success': False})
+
+def start(simulator: FitbitSimulator, port: int = 0, thread_pool: int = 64, block: bool = False) -> str:
+    """サーバーを起動する
+
+    Args:
+        simulator (FitbitSimulator): 応答するアプリ
+        port (int): ポート番号(0なら空いているポート)
+        thread_pool (int): 同時に処理するリクエスト数(ベンチマークの同時リクエスト数より大きくする)
+        block (bool): Trueなら終了するまで戻らない
+
+    Returns:
+        str: APIのURL(例: http://127.0.0.1:8080)
+    """
+    cherrypy.config.update({
+        'server.socket_host': '127.0.0.1',
+        'server.socket_port': port,
+        'server.thread_pool': thread_pool,
+        'server.socket_queue_size': thread_pool,
+        'engine.autoreload.on': False,
+        'log.screen': block,
+        'checker.on': False,
+    })
+    cherrypy.tree.mount(simulator, '/', {'/': {'tools.encode.on': False}})
+    cherrypy.engine.start()
+
+    host, bound_port = cherrypy.server.bound_addr
+    url = f'http://{host}:{bound_port}'
+
+    if block:
+        print(f'Fitbit simulator: {url}')
+        cherrypy.engine.block()
+    return url
+
+def stop():
+    """サーバーを止める"""
+    cherrypy.engine.exit()
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='負荷試験用のFitbit APIの代わりのサーバー')
+    parser.add_argument('--port', type=int, default=8080, help='ポート番号(既定: 8080)')
+    parser.add_argument('--seed', type=int, default=1, help='合成データの乱数のシード(既定: 1)')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='応答までの遅延(ミリ秒)')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='遅延のばらつき(ミリ秒)')
+    parser.add_argument('--rate-limit', type=int, default=150, help='時間枠あたりのリクエスト数の上限(既定: 150)')
+    parser.add_argument('--window', type=float, default=3600, help='レート制限の時間枠(秒、既定: 3600)')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='上限に関係なく429を返す割合(0~1)')
+    parser.add_argument('--token-ttl', type=float, default=0.0, help='アクセストークンの有効期限(秒、0なら期限切れにしない)')
+    args = parser.parse_args(argv)
+
+    simulator = FitbitSimulator(
+        seed=args.seed, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        rate_limit=args.rate_limit, window_seconds=args.window,
+        throttle_rate=args.throttle_rate, token_ttl=args.token_ttl
+    )
+    start(simulator, port=args.port, block=True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
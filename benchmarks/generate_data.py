@@ -0,0 +1,251 @@
+"""ベンチマーク用に、Client ID ごとのデータベースに合成データを作る
+
+睡眠はFitbit APIの levels.data と同じ形の区間を作り、アプリと同じ FetchModel.insert_day_records で保存する。
+- 主睡眠: 就寝時刻と睡眠時間がばらつく夜の睡眠(多くはステージ、一部はクラシックの記録)
+- 分割睡眠: 夜中に起きて2つの記録に分かれる日
+- 昼寝: 午後の短いクラシックの記録
+- 記録なし: 端末を着けていなかった日
+歩数は1日の合計と、15分ごとの歩数(1日ずつ取得したときと同じく step_intraday テーブル)を作る。
+
+--legacy を付けると、移行前の形式(sleep_data テーブルに睡眠記録のリストを文字列で保存、15分ごとの歩数なし)で作る。
+その場合は、最初にデータベースを開いたときに sleep_segment テーブルへ移行される。
+
+使い方(リポジトリのルートで実行):
+    python benchmarks/generate_data.py --data-dir /tmp/bench --years 3 [--client-id BENCH] [--seed 1] [--legacy]
+"""
+import argparse
+from datetime import date, datetime, time, timedelta
+import math
+import os
+import random
+import sqlite3
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from fitbit_app.models.credential import Credential
+from fitbit_app.models.database import Database
+from fitbit_app.models.fetch_model import FetchModel
+from fitbit_app.models.step_intraday import StepIntraday
+
+# 1日あたりの割合
+NO_DATA_RATE = 0.03     # 睡眠の記録が無い
+CLASSIC_RATE = 0.12     # 主睡眠がクラシックの記録(ステージを判定できなかった夜)
+SPLIT_RATE = 0.05       # 主睡眠が2つの記録に分かれる
+NAP_RATE = 0.10         # 昼寝がある
+NO_STEPS_RATE = 0.02    # 歩数が0(端末を着けていない)
+
+# 1回に書き込む日数
+WRITE_BATCH_DAYS = 200
+
+DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.000'
+
+class SleepGenerator:
+    """1日分の睡眠記録(levels.data のリスト)と歩数を作る"""
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+
+    def day(self, current_date: date) -> tuple:
+        """
+        Args:
+            current_date (date): 日付(起床日)
+
+        Returns:
+            tuple: (歩数, 睡眠記録ごとの levels.data のリスト(開始時刻順))
+        """
+        return self.steps(current_date), self.sleep_logs(current_date)
+
+    def steps(self, current_date: date) -> int:
+        if self.rng.random() < NO_STEPS_RATE:
+            return 0
+
+        # 休日は少なめ、夏と冬は少なめ
+        mean = 6500 if current_date.weekday() >= 5 else 8500
+        mean *= 1 + 0.15 * math.cos((current_date.timetuple().tm_yday - 120) / 365 * 2 * math.pi)
+        return max(0, int(self.rng.gauss(mean, mean * 0.35)))
+
+    def step_intraday(self, step_count: int) -> list:
+        """1日の歩数を15分ごとに振り分ける(7時~22時半に歩き、朝夕の通勤時間帯が多い)"""
+        rush_slots = set(range(30, 36)) | set(range(70, 76))
+        weights = [
+            0.0 if slot < 28 or slot > 90 else self.rng.random() * (3 if slot in rush_slots else 1)
+            for slot in range(StepIntraday.SLOTS)
+        ]
+        total_weight = sum(weights)
+        return [int(step_count * weight / total_weight) for weight in weights]
+
+    def sleep_logs(self, current_date: date) -> list:
+        if self.rng.random() < NO_DATA_RATE:
+            return []
+
+        # 就寝は前日の23:30ごろ、睡眠時間は7時間ごろ
+        bedtime = datetime.combine(current_date, time()) + timedelta(minutes=self.rng.gauss(-30, 50))
+        duration = max(3 * 3600, self.rng.gauss(7 * 3600, 50 * 60))
+        classic = self.rng.random() < CLASSIC_RATE
+
+        if self.rng.random() < SPLIT_RATE:
+            # 夜中に30~90分起きていて、記録が2つに分かれる
+            first = duration * self.rng.uniform(0.3, 0.6)
+            gap = self.rng.uniform(30, 90) * 60
+            sleep_logs = [
+                self.sleep_log(bedtime, first, classic),
+                self.sleep_log(bedtime + timedelta(seconds=first + gap), duration - first, classic),
+            ]
+        else:
+            sleep_logs = [self.sleep_log(bedtime, duration, classic)]
+
+        if self.rng.random() < NAP_RATE:
+            nap_start = datetime.combine(current_date, time(13)) + timedelta(minutes=self.rng.uniform(0, 180))
+            sleep_logs.append(self.sleep_log(nap_start, self.rng.uniform(20, 90) * 60, classic=True))
+
+        return sleep_logs
+
+    def sleep_log(self, start: datetime, duration: float, classic: bool) -> list:
+        """1つの睡眠記録の levels.data を作る
+
+        Args:
+            start (datetime): 開始時刻
+            duration (float): 睡眠時間(秒)
+            classic (bool): Trueならクラシック(asleep/restless/awake)、Falseならステージ(wake/light/deep/rem)
+        """
+        segments = []
+        current = start.replace(microsecond=0)
+        end = start + timedelta(seconds=duration)
+
+        while current < end:
+            level, seconds = self.classic_segment() if classic else self.stage_segment((current - start).total_seconds())
+            seconds = min(seconds, max(30, int((end - current).total_seconds()) // 30 * 30))
+            segments.append({'dateTime': current.strftime(DATETIME_FORMAT), 'level': level, 'seconds': seconds})
+            current += timedelta(seconds=seconds)
+
+        return segments
+
+    def stage_segment(self, elapsed: float) -> tuple:
+        """ステージの区間(区間は30秒単位。前半は深い睡眠、後半はレム睡眠が多い)"""
+        progress = min(1.0, elapsed / (7 * 3600))
+        weights = {
+            'light': 0.5,
+            'deep': 0.25 * (1 - progress),
+            'rem': 0.1 + 0.25 * progress,
+            'wake': 0.12,
+        }
+        level = self.rng.choices(list(weights), weights=list(weights.values()))[0]
+        minutes = {
+            'light': (5, 40),
+            'deep': (5, 30),
+            'rem': (5, 30),
+            'wake': (0.5, 6),
+        }[level]
+        return level, int(self.rng.uniform(*minutes) * 2) * 30 or 30
+
+    def classic_segment(self) -> tuple:
+        """クラシックの区間(区間は60秒単位)"""
+        level = self.rng.choices(('asleep', 'restless', 'awake'), weights=(0.8, 0.15, 0.05))[0]
+        minutes = {'asleep': (5, 60), 'restless': (1, 5), 'awake': (1, 3)}[level]
+        return level, int(self.rng.uniform(*minutes)) * 60
+
+def generate(data_dir: str, client_id: str, start_date: date, end_date: date, seed: int = 1, legacy: bool = False) -> dict:
+    """合成データを data_dir/database/{client_id}.db に作る(同じ日付のデータは上書き)
+
+    Returns:
+        dict: 作った日数と睡眠区間の数
+    """
+    os.makedirs(os.path.join(data_dir, 'database'), exist_ok=True)
+    db_path = os.path.join(data_dir, 'database', f'{client_id}.db')
+
+    generator = SleepGenerator(random.Random(seed))
+    records = []
+    current_date = start_date
+    while current_date <= end_date:
+        step_count, sleep_logs = generator.day(current_date)
+        records.append({
+            'date': current_date.isoformat(), 'step_count': step_count, 'sleep_logs': sleep_logs,
+            'step_intraday': generator.step_intraday(step_count) if step_count else None,
+        })
+        current_date += timedelta(days=1)
+
+    if legacy:
+        _write_legacy(db_path, records)
+    else:
+        _write_current(data_dir, client_id, records)
+
+    return {
+        'db_path': os.path.abspath(db_path),
+        'days': len(records),
+        'sleep_logs': sum(len(record['sleep_logs']) for record in records),
+        'segments': sum(len(sleep_log) for record in records for sleep_log in record['sleep_logs']),
+    }
+
+def _write_current(data_dir: str, client_id: str, records: list):
+    """アプリが取得したときと同じ形式で保存する"""
+    cwd = os.getcwd()
+    Credential.client_id = client_id
+    os.chdir(data_dir)
+    try:
+        model = FetchModel()
+        try:
+            for i in range(0, len(records), WRITE_BATCH_DAYS):
+                model.insert_day_records(records[i:i + WRITE_BATCH_DAYS])
+        finally:
+            model.close()
+            Database.close()
+    finally:
+        os.chdir(cwd)
+
+def _write_legacy(db_path: str, records: list):
+    """移行前の形式で保存する(睡眠記録のリストを str() した文字列)"""
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute('''
+            CREATE TABLE step_data (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date TEXT NOT NULL UNIQUE,
+                step_count INT
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE sleep_data (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date TEXT NOT NULL UNIQUE,
+                sleep_data TEXT
+            )
+        ''')
+        conn.executemany(
+            'INSERT INTO step_data (date, step_count) VALUES (?, ?)',
+            [(record['date'], record['step_count']) for record in records]
+        )
+        conn.executemany(
+            'INSERT INTO sleep_data (date, sleep_data) VALUES (?, ?)',
+            [(record['date'], str(record['sleep_logs'])) for record in records]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='ベンチマーク用の合成データを作る')
+    parser.add_argument('--data-dir', required=True, help='database/ を作るフォルダ')
+    parser.add_argument('--client-id', default='BENCH', help='データベースのファイル名にするClient ID(既定: BENCH)')
+    parser.add_argument('--start', default='2021-01-01', help='開始日(YYYY-MM-DD、既定: 2021-01-01)')
+    parser.add_argument('--years', type=int, default=3, help='年数(既定: 3)')
+    parser.add_argument('--seed', type=int, default=1, help='乱数のシード(既定: 1)')
+    parser.add_argument('--legacy', action='store_true', help='移行前の形式(sleep_data テーブル)で作る')
+    args = parser.parse_args(argv)
+
+    start_date = date.fromisoformat(args.start)
+    end_date = start_date.replace(year=start_date.year + args.years) - timedelta(days=1)
+
+    result = generate(args.data_dir, args.client_id, start_date, end_date, seed=args.seed, legacy=args.legacy)
+    print(
+        f"{result['db_path']}: {result['days']} days, "
+        f"{result['sleep_logs']} sleep logs, {result['segments']} segments"
+    )
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
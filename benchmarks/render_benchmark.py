@@ -0,0 +1,287 @@
+"""グラフ出力の処理(データベースの読み込み・変換・描画・PDF保存)の時間を計測する
+
+generate_data.py で作ったデータベースを一時フォルダにコピーして計測する(キャッシュは使わない)。
+各処理の時間はアプリの計測(fitbit_app.metrics)の区間をそのまま使う。
+- 1か月ごと: db.read, transform.*, render.*(Figureの作成)、render.savefig
+- 1年ごと: 月ごとの合計と、1年分をまとめて読み込み・変換したときの時間
+結果はJSONで保存し、--baseline で前回の結果と比べて遅くなっていれば失敗にする。
+
+使い方(リポジトリのルートで実行):
+    python benchmarks/generate_data.py --data-dir /tmp/bench --years 3
+    python benchmarks/render_benchmark.py --data-dir /tmp/bench [--repeat 3] [--output result.json]
+                                          [--baseline previous.json --threshold 1.25]
+
+終了コード:
+    0: 成功 / 1: 前回の結果より遅くなった処理がある
+"""
+import argparse
+from datetime import datetime
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from fitbit_app.metrics import Metrics
+from fitbit_app.models.credential import Credential
+from fitbit_app.models.database import Database
+from fitbit_app.models.sleep_segment import SleepSegment
+
+# 比べる処理(短すぎてばらつく処理は、前回との比較で無視する)
+MIN_COMPARE_SECONDS = 0.005
+
+# 表示する区間と列の見出し
+PHASE_LABELS = {
+    'db.read': 'read',
+    'transform.sleep_frame': 'sleep_frame',
+    'transform.sleep_24h': 'sleep_24h',
+    'transform.steps': 'step_frame',
+    'transform.step_hourly': 'step_hourly',
+    'render.sleep': 'plot_sleep',
+    'render.heatmap': 'plot_heatmap',
+    'render.steps': 'plot_steps',
+    'render.layout': 'layout',
+    'render.savefig': 'savefig',
+    'total': 'total',
+}
+
+def bench_migrate(db_path: str) -> float:
+    """移行前の形式のデータベースなら、sleep_segment テーブルへの移行時間を返す(移行済みならNone)"""
+    conn = sqlite3.connect(db_path)
+    try:
+        if conn.execute('PRAGMA user_version').fetchone()[0] >= SleepSegment.SCHEMA_VERSION:
+            return None
+        started = time.perf_counter()
+        SleepSegment.migrate(conn)
+        return time.perf_counter() - started
+    finally:
+        conn.close()
+
+def list_months(db_path: str) -> list:
+    """データのある(年, 月)のリスト"""
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute("SELECT DISTINCT substr(date, 1, 7) FROM step_data ORDER BY 1").fetchall()
+    finally:
+        conn.close()
+    return [tuple(int(part) for part in row[0].split('-')) for row in rows]
+
+def bench_month(year: int, month: int) -> dict:
+    """1か月分を描画してPDFに保存し、区間ごとの秒数を返す"""
+    # グラフ出力のモジュールはデータベースの移行後に読み込む(読み込み時間は計測しない)
+    from fitbit_app.controllers.output_month_controller import OutputMonthController
+
+    with Metrics.capture() as run:
+        started = time.perf_counter()
+        controller = OutputMonthController(None, year, month, None)
+        fig = controller.build_figure()
+        controller.save_pdf(fig)
+        total = time.perf_counter() - started
+
+    phases = _sum_spans(run.records()['spans'])
+    phases['total'] = total
+    return phases
+
+def bench_year_transform(year: int) -> dict:
+    """1年分をまとめて読み込み・変換し、区間ごとの秒数を返す(データ量に対する変換の伸び方を見る)"""
+    from fitbit_app.models.output_month_service import OutputMonthService
+
+    with Metrics.capture() as run:
+        started = time.perf_counter()
+        OutputMonthService().retrieve_month_data(f'{year}-01-01', f'{year}-12-31')
+        total = time.perf_counter() - started
+
+    phases = _sum_spans(run.records()['spans'])
+    phases['total'] = total
+    return phases
+
+def bench_year_stream(year: int) -> dict:
+    """1年分を1か月ずつ読み込み・変換し(iter_month_data)、区間ごとの秒数を返す"""
+    from fitbit_app.models.output_month_service import OutputMonthService
+
+    with Metrics.capture() as run:
+        started = time.perf_counter()
+        for _ in OutputMonthService().iter_month_data(f'{year}-01-01', f'{year}-12-31'):
+            pass
+        total = time.perf_counter() - started
+
+    phases = _sum_spans(run.records()['spans'])
+    phases['total'] = total
+    return phases
+
+def _sum_spans(spans: list) -> dict:
+    phases = {}
+    for span in spans:
+        phases[span['name']] = phases.get(span['name'], 0.0) + span['seconds']
+    return phases
+
+def _median_phases(samples: list) -> dict:
+    """繰り返した結果を区間ごとの中央値にする"""
+    names = sorted(set().union(*samples))
+    return {name: round(statistics.median(sample.get(name, 0.0) for sample in samples), 6) for name in names}
+
+def run_benchmark(data_dir: str, client_id: str, repeat: int, months=None) -> dict:
+    source = os.path.join(data_dir, 'database', f'{client_id}.db')
+    if not os.path.exists(source):
+        raise Exception(f'データベースがありません: {source}(先に generate_data.py を実行してください)')
+
+    cwd = os.getcwd()
+    work_dir = tempfile.mkdtemp(prefix='fitbit_render_bench_')
+    try:
+        # 元のデータベースは変えない(移行・PDFの保存は一時フォルダで行う)
+        os.makedirs(os.path.join(work_dir, 'database'))
+        db_path = os.path.join(work_dir, 'database', f'{client_id}.db')
+        shutil.copyfile(source, db_path)
+
+        os.chdir(work_dir)
+        Credential.client_id = client_id
+        Metrics.enabled = True
+
+        migrate_seconds = bench_migrate(db_path)
+        months = months or list_months(db_path)
+
+        month_results = {}
+        for year, month in months:
+            samples = [bench_month(year, month) for _ in range(repeat)]
+            month_results[f'{year}-{month:02}'] = _median_phases(samples)
+
+        year_results = {}
+        for year in sorted({year for year, _ in months}):
+            months_of_year = [phases for key, phases in month_results.items() if key.startswith(f'{year}-')]
+            samples = [bench_year_transform(year) for _ in range(repeat)]
+            stream_samples = [bench_year_stream(year) for _ in range(repeat)]
+            year_results[str(year)] = {
+                'months': len(months_of_year),
+                'monthly_sum': _sum_phases(months_of_year),
+                'year_transform': _median_phases(samples),
+                'year_stream': _median_phases(stream_samples),
+            }
+    finally:
+        Database.close()
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'benchmark': 'render',
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'environment': _environment(),
+        'client_id': client_id,
+        'repeat': repeat,
+        'migrate_seconds': round(migrate_seconds, 6) if migrate_seconds is not None else None,
+        'months': month_results,
+        'years': year_results,
+    }
+
+def _sum_phases(phases_list: list) -> dict:
+    total = {}
+    for phases in phases_list:
+        for name, seconds in phases.items():
+            total[name] = total.get(name, 0.0) + seconds
+    return {name: round(seconds, 6) for name, seconds in total.items()}
+
+def _environment() -> dict:
+    import matplotlib
+    import numpy
+    import pandas
+
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': numpy.__version__,
+        'pandas': pandas.__version__,
+        'matplotlib': matplotlib.__version__,
+    }
+
+def compare(result: dict, baseline: dict, threshold: float) -> list:
+    """前回の結果より threshold 倍以上遅くなった処理を返す(1年ごとの月の合計と1年分の変換・月ごとの変換で比べる)
+
+    Returns:
+        list: (年, 区間, 前回の秒数, 今回の秒数) のリスト
+    """
+    regressions = []
+    for year, year_result in result['years'].items():
+        base_year = baseline.get('years', {}).get(year)
+        if not base_year:
+            continue
+        for group in ('monthly_sum', 'year_transform', 'year_stream'):
+            for name, seconds in year_result.get(group, {}).items():
+                base_seconds = base_year.get(group, {}).get(name)
+                if base_seconds is None or base_seconds < MIN_COMPARE_SECONDS:
+                    continue
+                if seconds > base_seconds * threshold:
+                    regressions.append((year, f'{group}.{name}', base_seconds, seconds))
+    return regressions
+
+def print_summary(result: dict):
+    if result['migrate_seconds'] is not None:
+        print(f"migrate: {result['migrate_seconds'] * 1000:.1f} ms")
+
+    phases = tuple(PHASE_LABELS)
+    print(f"{'year':<6}{'months':>7}" + ''.join(f'{label:>14}' for label in PHASE_LABELS.values()))
+    for year, year_result in result['years'].items():
+        monthly_sum = year_result['monthly_sum']
+        print(
+            f"{year:<6}{year_result['months']:>7}"
+            + ''.join(f"{monthly_sum.get(name, 0.0) * 1000:>12.1f}ms" for name in phases)
+        )
+        for label, group in (('1 year', 'year_transform'), ('stream', 'year_stream')):
+            year_phases = year_result[group]
+            print(
+                f"{'':<6}{label:>7}"
+                + ''.join(f"{year_phases[name] * 1000:>12.1f}ms" if name in year_phases else f"{'':>14}"
+                          for name in phases)
+            )
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='グラフ出力の処理時間を計測する')
+    parser.add_argument('--data-dir', required=True, help='generate_data.py で作ったフォルダ')
+    parser.add_argument('--client-id', default='BENCH', help='Client ID(既定: BENCH)')
+    parser.add_argument('--repeat', type=int, default=3, help='1か月あたりの計測回数(中央値を使う)')
+    parser.add_argument('--months', type=int, help='計測する月数(省略時はすべての月)')
+    parser.add_argument('--output', help='結果を保存するJSONファイル')
+    parser.add_argument('--baseline', help='比べる前回の結果のJSONファイル')
+    parser.add_argument('--threshold', type=float, default=1.25, help='遅くなったとみなす倍率(既定: 1.25)')
+    args = parser.parse_args(argv)
+
+    months = None
+    if args.months:
+        source = os.path.join(args.data_dir, 'database', f'{args.client_id}.db')
+        months = list_months(source)[:args.months] if os.path.exists(source) else None
+
+    result = run_benchmark(args.data_dir, args.client_id, args.repeat, months)
+    print_summary(result)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.threshold)
+        for year, name, base_seconds, seconds in regressions:
+            print(f"NG: {year} {name}: {base_seconds * 1000:.1f} ms -> {seconds * 1000:.1f} ms")
+        if regressions:
+            return 1
+        print("OK")
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
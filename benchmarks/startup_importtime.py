@@ -0,0 +1,122 @@
+"""GUIの起動時に読み込むモジュールの時間を計測し、予算を超えていないか確認する
+
+python -X importtime で画面のモジュールを読み込み、出力をパッケージごとに集計する。
+グラフ出力用の重いモジュール(pandas, matplotlib など)が起動時に読み込まれていたら失敗にする。
+
+使い方(リポジトリのルートで実行):
+    python benchmarks/startup_importtime.py [--repeat 5] [--budget-ms 400] [--top 15]
+
+終了コード:
+    0: 予算内 / 1: 重いモジュールを読み込んでいる、または予算を超えた
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# 最初の画面を表示するまでと、画面を切り替えるときに読み込むモジュール
+STARTUP_MODULES = (
+    'main',
+    'fitbit_app.controllers.view_controller',
+    'fitbit_app.views.auth_view',
+    'fitbit_app.views.main_view',
+    'fitbit_app.views.fetch_view',
+    'fitbit_app.views.output_month_view',
+)
+
+# 起動時に読み込んではいけないモジュール(グラフ出力・取得のときに読み込む)
+FORBIDDEN_PACKAGES = (
+    'numpy',
+    'pandas',
+    'matplotlib',
+    'seaborn',
+    'jpholiday',
+    'pyarrow',
+    'aiohttp',
+    'cherrypy',
+)
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def run_importtime(modules=STARTUP_MODULES) -> list:
+    """別プロセスで -X importtime を実行し、計測結果を返す
+
+    Returns:
+        list: (モジュール名, 自身の時間[us], 累計時間[us], 階層) のリスト
+    """
+    code = '; '.join(f'import {module}' for module in modules)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True
+    )
+    return parse_importtime(result.stderr)
+
+def parse_importtime(output: str) -> list:
+    """-X importtime の出力を解析する
+
+    出力の形式:
+        import time: self [us] | cumulative | imported package
+        import time:       378 |     273139 | fitbit_app.views.auth_view
+    """
+    records = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        records.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return records
+
+def summarize(records: list) -> dict:
+    """パッケージごとの自身の時間の合計と、起動時に読み込んだ禁止パッケージを返す"""
+    by_package = {}
+    for name, self_us, _, _ in records:
+        package = name.split('.')[0]
+        by_package[package] = by_package.get(package, 0) + self_us
+
+    return {
+        'total_us': sum(self_us for _, self_us, _, _ in records),
+        'by_package': by_package,
+        'forbidden': sorted(package for package in by_package if package in FORBIDDEN_PACKAGES),
+    }
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='GUI起動時のimport時間を計測する')
+    parser.add_argument('--repeat', type=int, default=5, help='計測回数(中央値を使う)')
+    parser.add_argument('--budget-ms', type=float, help='import時間の合計の上限(ミリ秒)。省略時は確認しない')
+    parser.add_argument('--top', type=int, default=15, help='表示するパッケージ数')
+    args = parser.parse_args(argv)
+
+    summaries = [summarize(run_importtime()) for _ in range(args.repeat)]
+    median_total_ms = statistics.median(summary['total_us'] for summary in summaries) / 1000
+
+    # パッケージごとの時間も回ごとの中央値にする
+    packages = set().union(*(summary['by_package'] for summary in summaries))
+    by_package_ms = {
+        package: statistics.median(summary['by_package'].get(package, 0) for summary in summaries) / 1000
+        for package in packages
+    }
+
+    print(f"startup import time (median of {args.repeat}): {median_total_ms:.1f} ms")
+    for package, ms in sorted(by_package_ms.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {package:<30} {ms:8.1f} ms")
+
+    failed = False
+
+    forbidden = sorted(set().union(*(summary['forbidden'] for summary in summaries)))
+    if forbidden:
+        print(f"NG: heavy packages imported at startup: {', '.join(forbidden)}")
+        failed = True
+
+    if args.budget_ms is not None and median_total_ms > args.budget_ms:
+        print(f"NG: {median_total_ms:.1f} ms exceeds the budget of {args.budget_ms:.1f} ms")
+        failed = True
+
+    if not failed:
+        print("OK")
+
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,384 @@
+"""コマンドラインからデータ取得とグラフ出力を行う(画面を使わない)
+
+使い方:
+    python main.py sync [--client-id ID ...] [--start YYYY-MM-DD] [--end YYYY-MM-DD] [--days N] [--refetch]
+    python main.py export [--client-id ID ...] --start YYYY-MM [--end YYYY-MM] [--combine] [--profile]
+    python main.py rebuild-summary [--client-id ID ...]  (日ごとの集計を保存済みのデータから作り直す)
+    python main.py analyze [--client-id ID ...] [--start YYYY-MM-DD] [--end YYYY-MM-DD] [--days N] [--output FILE]
+    python main.py export-data [--client-id ID ...] [--format parquet|arrow|csv] [--start YYYY-MM] [--end YYYY-MM] [--full]
+    python main.py --metrics sync ...  (処理ごとの時間と件数を metrics/ にJSON Linesで書き出す)
+
+トークンは画面で「クライアント情報を保存する」をオンにして認証したときに database/tokens.json に保存される。
+--client-id を省略すると、sync はトークンを保存してあるすべてのClient ID、
+トークンを使わないコマンド(export など)はデータベース(database/{Client ID}.db)があるすべてのClient IDを順に処理する。
+進捗と結果は標準出力に1行1つのJSONで出力する。
+"""
+import argparse
+from datetime import date, datetime, timedelta
+import os
+import signal
+
+# 終了コード
+EXIT_OK = 0      # すべて成功
+EXIT_ERROR = 1   # 取得・出力に失敗したClient IDがある
+EXIT_USAGE = 2   # 引数の誤り(argparse と同じ)
+EXIT_AUTH = 3    # トークンが無いClient IDがある
+EXIT_CANCELLED = 130  # Ctrl+C でキャンセルした(取得済みの日は保存してある)
+
+class TokenNotFoundError(Exception):
+    """トークンが保存されていない"""
+    pass
+
+def main(argv=None) -> int:
+    """コマンドラインのエントリーポイント
+
+    Args:
+        argv (list): 引数のリスト(Noneなら sys.argv[1:])
+
+    Returns:
+        int: 終了コード
+    """
+    parser = _create_parser()
+    args = parser.parse_args(argv)
+
+    try:
+        args.start, args.end = args.parse_period(args)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # database/, graph/, error_log/ はカレントディレクトリに作られるので、cron などからはデータフォルダを指定する
+    if args.data_dir:
+        os.chdir(args.data_dir)
+
+    from .controllers.cancel_token import CancelToken, CancelledError
+    from .metrics import Metrics
+    from .controllers.progress_reporter import JsonLinesProgressReporter
+    from .models.auth_model import AuthModel
+    from .models.credential import Credential
+    from .models.database import Database
+
+    if args.metrics:
+        Metrics.enabled = True
+
+    # Ctrl+C で処理を止めずにキャンセルする(取得済みの日を保存してから終わる)
+    args.cancel_token = CancelToken()
+    signal.signal(signal.SIGINT, lambda signum, frame: args.cancel_token.cancel())
+
+    # 省略時は、トークンを使うコマンドならトークンを保存してある、使わないコマンドならデータベースがあるClient ID
+    if args.client_id:
+        client_ids = args.client_id
+    elif args.needs_token:
+        client_ids = AuthModel().list_token_client_ids()
+        if not client_ids:
+            JsonLinesProgressReporter().emit({
+                'event': 'error',
+                'task': args.command,
+                'message': 'トークンが保存されていません。画面で「クライアント情報を保存する」をオンにして認証してください。',
+            })
+            return EXIT_AUTH
+    else:
+        client_ids = Database.list_client_ids()
+        if not client_ids:
+            JsonLinesProgressReporter().emit({
+                'event': 'error',
+                'task': args.command,
+                'message': 'データベースがありません。先にデータを取得してください。',
+            })
+            return EXIT_ERROR
+
+    exit_code = EXIT_OK
+    for client_id in client_ids:
+        reporter = JsonLinesProgressReporter(context={'client_id': client_id})
+        try:
+            if args.needs_token:
+                _load_account(client_id)
+            else:
+                Credential.client_id = client_id
+            result = args.run(args, reporter)
+            if Metrics.enabled:
+                result['metrics_path'] = Metrics.last_path
+            reporter.emit({'event': 'result', 'task': args.command, 'status': 'ok', **result})
+        except CancelledError as e:
+            reporter.emit({'event': 'cancelled', 'task': args.command, 'message': str(e)})
+            return EXIT_CANCELLED
+        except TokenNotFoundError as e:
+            reporter.emit({'event': 'error', 'task': args.command, 'message': str(e)})
+            exit_code = max(exit_code, EXIT_AUTH)
+        except Exception as e:
+            reporter.emit({'event': 'error', 'task': args.command, 'message': str(e)})
+            exit_code = max(exit_code, EXIT_ERROR)
+
+    return exit_code
+
+def _create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='fitbit_app', description='Fitbitのデータ取得とグラフ出力(画面なし)')
+    parser.add_argument('--data-dir', help='database/ と graph/ を置くフォルダ(省略時はカレントディレクトリ)')
+    parser.add_argument('--metrics', action='store_true', help='処理ごとの時間と件数を metrics/ に書き出す')
+
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    parser.set_defaults(needs_token=True)
+
+    # データ取得
+    sync_parser = subparsers.add_parser('sync', help='歩数と睡眠のデータを取得する')
+    _add_client_id_argument(sync_parser, needs_token=True)
+    sync_parser.add_argument('--start', help='開始日(YYYY-MM-DD)。省略時は終了日から --days 日前')
+    sync_parser.add_argument('--end', help='終了日(YYYY-MM-DD)。省略時は今日')
+    sync_parser.add_argument('--days', type=int, default=7, help='--start を省略したときの日数(既定: 7)')
+    sync_parser.add_argument('--refetch', action='store_true', help='取得済みの日も取得し直す')
+    sync_parser.add_argument(
+        '--mode', choices=('daily', 'range'), default='daily',
+        help='取得モード(既定: daily。range はリクエストが少ないが15分ごとの歩数を保存しない)'
+    )
+    sync_parser.add_argument('--engine', choices=('thread', 'async'), default='thread', help='取得エンジン(既定: thread)')
+    sync_parser.add_argument('--concurrency', type=int, help='同時リクエスト数(省略時は取得エンジンの既定値)')
+    sync_parser.add_argument(
+        '--api-endpoint',
+        help='Fitbit APIの代わりにリクエストを送るURL(負荷試験用。例: http://127.0.0.1:8080)'
+    )
+    sync_parser.set_defaults(parse_period=_parse_sync_period, run=_run_sync)
+
+    # グラフ出力(データベースだけを使うので、トークンは無くてもよい)
+    export_parser = subparsers.add_parser('export', help='月ごとのグラフをPDFに出力する')
+    _add_client_id_argument(export_parser)
+    export_parser.add_argument('--start', required=True, help='開始月(YYYY-MM)')
+    export_parser.add_argument('--end', help='終了月(YYYY-MM)。省略時は開始月だけ')
+    export_parser.add_argument('--combine', action='store_true', help='1つのPDFにまとめる')
+    export_parser.add_argument('--workers', type=int, help='描画するプロセス数(省略時はコア数)')
+    export_parser.add_argument(
+        '--profile', action='store_true',
+        help='cProfileで計測して metrics/ に .prof を保存する(1か月だけ出力するとき)'
+    )
+    export_parser.set_defaults(parse_period=_parse_export_period, run=_run_export, needs_token=False)
+
+    # 夜ごとの睡眠指標
+    analyze_parser = subparsers.add_parser('analyze', help='夜ごとの睡眠指標と移動平均をCSVに出力する')
+    _add_client_id_argument(analyze_parser)
+    analyze_parser.add_argument('--start', help='開始日(YYYY-MM-DD)。省略時は終了日から --days 日前')
+    analyze_parser.add_argument('--end', help='終了日(YYYY-MM-DD)。省略時は今日')
+    analyze_parser.add_argument('--days', type=int, default=28, help='--start を省略したときの日数(既定: 28)')
+    analyze_parser.add_argument(
+        '--output', help='出力するCSVファイル(省略時は analytics/{Client ID}/sleep_{開始日}_{終了日}.csv)'
+    )
+    analyze_parser.set_defaults(parse_period=_parse_sync_period, run=_run_analyze, needs_token=False)
+
+    # 保存済みのデータを年/月ごとのファイルに書き出す(前回から変わった月だけ)
+    export_data_parser = subparsers.add_parser(
+        'export-data', help='歩数と睡眠区間を年/月ごとの Parquet・Arrow IPC・CSV に書き出す'
+    )
+    _add_client_id_argument(export_data_parser)
+    export_data_parser.add_argument(
+        '--format', choices=('parquet', 'arrow', 'csv'), default='parquet',
+        help='出力形式(既定: parquet。parquet・arrow は pyarrow が必要)'
+    )
+    export_data_parser.add_argument('--start', help='開始月(YYYY-MM)。省略時はデータがある最初の月')
+    export_data_parser.add_argument('--end', help='終了月(YYYY-MM)。省略時はデータがある最後の月')
+    export_data_parser.add_argument('--full', action='store_true', help='前回から変わっていない月も書き直す')
+    export_data_parser.add_argument(
+        '--output', help='出力先のフォルダ(省略時は exports/{Client ID}/{出力形式})'
+    )
+    export_data_parser.set_defaults(parse_period=_parse_month_period, run=_run_export_data, needs_token=False)
+
+    # 日ごとの集計の作り直し(データベースだけを使うので、トークンは無くてもよい)
+    rebuild_parser = subparsers.add_parser('rebuild-summary', help='保存済みのデータから日ごとの集計を作り直す')
+    _add_client_id_argument(rebuild_parser)
+    rebuild_parser.set_defaults(parse_period=_parse_no_period, run=_run_rebuild_summary, needs_token=False)
+
+    return parser
+
+def _add_client_id_argument(parser: argparse.ArgumentParser, needs_token: bool = False):
+    parser.add_argument(
+        '--client-id', action='append',
+        help='処理するClient ID(複数指定可)。省略時は' + (
+            'トークンを保存してあるすべてのClient ID' if needs_token else 'データベースがあるすべてのClient ID'
+        )
+    )
+
+def _parse_sync_period(args) -> tuple:
+    """sync・analyze の期間を (開始日, 終了日) の date にする"""
+    end = datetime.strptime(args.end, '%Y-%m-%d').date() if args.end else date.today()
+    if args.start:
+        start = datetime.strptime(args.start, '%Y-%m-%d').date()
+    else:
+        if args.days < 1:
+            raise ValueError('--days は1以上を指定してください。')
+        start = end - timedelta(days=args.days - 1)
+
+    if start > end:
+        raise ValueError('終了日が開始日より前です。')
+
+    return start, end
+
+def _parse_export_period(args) -> tuple:
+    """export の期間を ((開始年, 開始月), (終了年, 終了月)) にする"""
+    start = datetime.strptime(args.start, '%Y-%m')
+    end = datetime.strptime(args.end, '%Y-%m') if args.end else start
+
+    if start > end:
+        raise ValueError('終了月が開始月より前です。')
+
+    # 複数の月はワーカープロセスで描画するので、cProfileで計測できない
+    if args.profile and (start != end or args.combine):
+        raise ValueError('--profile は1か月だけ出力するときに指定してください。')
+
+    return (start.year, start.month), (end.year, end.month)
+
+def _parse_month_period(args) -> tuple:
+    """export-data の期間を ((開始年, 開始月), (終了年, 終了月)) にする(省略した側はNone)"""
+    start = datetime.strptime(args.start, '%Y-%m') if args.start else None
+    end = datetime.strptime(args.end, '%Y-%m') if args.end else None
+
+    if start and end and start > end:
+        raise ValueError('終了月が開始月より前です。')
+
+    return (start.year, start.month) if start else None, (end.year, end.month) if end else None
+
+def _parse_no_period(args) -> tuple:
+    """期間を指定しないコマンド"""
+    return None, None
+
+def _load_account(client_id: str):
+    """保存してあるトークンを Credential にセットする
+
+    Raises:
+        TokenNotFoundError: トークンが保存されていないとき
+    """
+    from .models.auth_model import AuthModel
+    from .models.credential import Credential
+
+    auth_model = AuthModel()
+    token = auth_model.load_token(client_id)
+
+    # client_secret はトークンと一緒に保存したものか、クライアント情報のJSONファイルのものを使う
+    credentials = auth_model.load_credentials()
+    client_secret = token.get('client_secret') or (
+        credentials.get('client_secret') if credentials.get('client_id') == client_id else None
+    )
+
+    if not token.get('refresh_token') or not client_secret:
+        raise TokenNotFoundError(
+            f'{client_id} のトークンが保存されていません。'
+            f'画面で「クライアント情報を保存する」をオンにして認証してください。'
+        )
+
+    Credential.client_id = client_id
+    Credential.client_secret = client_secret
+    Credential.access_token = token['access_token']
+    Credential.refresh_token = token['refresh_token']
+    Credential.expires_at = token.get('expires_at') or ''
+
+def _run_sync(args, reporter) -> dict:
+    from .controllers.fetch_controller import FetchController
+
+    fetch_controller = FetchController(
+        None, args.start, args.end, None, None,
+        fetch_mode=args.mode,
+        sync_missing_only=not args.refetch,
+        fetch_engine=args.engine,
+        progress=reporter,
+        cancel_token=args.cancel_token,
+        api_endpoint=args.api_endpoint,
+        concurrency=args.concurrency
+    )
+    fetch_controller.fetch()
+
+    return {'start': args.start.isoformat(), 'end': args.end.isoformat()}
+
+def _run_export(args, reporter) -> dict:
+    from .controllers.output_batch_controller import OutputBatchController
+    from .controllers.output_month_controller import OutputMonthController
+    from .models.credential import Credential
+    from .models.database import Database
+
+    if not os.path.exists(Database.path()):
+        raise Exception('データベースがありません。先にデータを取得してください。')
+
+    (start_year, start_month), (end_year, end_month) = args.start, args.end
+
+    # 1か月だけならプロセスプールを使わずに描画する
+    if (start_year, start_month) == (end_year, end_month) and not args.combine:
+        reporter.start('export', 1)
+        output_month_controller = OutputMonthController(
+            None, start_year, start_month, None, cancel_token=args.cancel_token
+        )
+        result = {'skipped': []}
+        if args.profile:
+            from .metrics import Metrics
+            with Metrics.profile(f'export_{Credential.client_id}_{start_year}-{start_month:02}') as profile_path:
+                result['pdf_paths'] = [output_month_controller.export_pdf()]
+            result['profile_path'] = profile_path
+        else:
+            result['pdf_paths'] = [output_month_controller.export_pdf()]
+        reporter.advance()
+        reporter.finish()
+        return result
+
+    output_batch_controller = OutputBatchController(
+        None, start_year, start_month, end_year, end_month, None, None,
+        combine=args.combine, max_workers=args.workers, progress=reporter,
+        cancel_token=args.cancel_token
+    )
+    pdf_paths = output_batch_controller.export()
+
+    return {'pdf_paths': pdf_paths, 'skipped': output_batch_controller.errors}
+
+def _run_export_data(args, reporter) -> dict:
+    from .controllers.data_export_controller import DataExportController
+    from .models.credential import Credential
+    from .models.database import Database
+
+    if not os.path.exists(Database.path()):
+        raise Exception('データベースがありません。先にデータを取得してください。')
+
+    data_export_controller = DataExportController(
+        args.output or os.path.join('exports', Credential.client_id, args.format),
+        export_format=args.format,
+        start_month=args.start,
+        end_month=args.end,
+        full=args.full,
+        progress=reporter,
+        cancel_token=args.cancel_token
+    )
+    return data_export_controller.export()
+
+def _run_rebuild_summary(args, reporter) -> dict:
+    from .models.database import Database
+    from .models.fetch_model import FetchModel
+
+    if not os.path.exists(Database.path()):
+        raise Exception('データベースがありません。先にデータを取得してください。')
+
+    fetch_model = FetchModel()
+    try:
+        days = fetch_model.rebuild_daily_summary()
+    finally:
+        fetch_model.close()
+
+    return {'days': days}
+
+def _run_analyze(args, reporter) -> dict:
+    from .models.credential import Credential
+    from .models.database import Database
+    from .models.sleep_metrics_service import SleepMetricsService
+
+    if not os.path.exists(Database.path()):
+        raise Exception('データベースがありません。先にデータを取得してください。')
+
+    sleep_metrics_service = SleepMetricsService()
+    sleep_metrics_service.retrieve_metrics(args.start.isoformat(), args.end.isoformat())
+    nights = sleep_metrics_service.nights
+
+    output_path = args.output or os.path.join(
+        'analytics', Credential.client_id, f'sleep_{args.start.isoformat()}_{args.end.isoformat()}.csv'
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    nights.join(sleep_metrics_service.rolling).to_csv(output_path, float_format='%.4g')
+
+    # 期間の平均(睡眠記録がある夜だけ)
+    averages = nights[list(SleepMetricsService.ROLLING_COLUMNS)].astype(float).mean().round(3)
+    return {
+        'start': args.start.isoformat(),
+        'end': args.end.isoformat(),
+        'nights': int(nights['total_sleep_min'].notna().sum()),
+        'averages': averages.astype(object).where(averages.notna(), None).to_dict(),
+        'csv_path': os.path.abspath(output_path),
+    }
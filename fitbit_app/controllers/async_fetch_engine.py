@@ -0,0 +1,164 @@
+import asyncio
+import json
+import time
+import aiohttp
+from ..metrics import Metrics
+
+class AsyncFetchEngine:
+    """1つのイベントループでFitbit APIにリクエストを送る取得エンジン
+
+    キープアライブの接続を MAX_CONNECTIONS 本まで使い回し、
+    エンドポイントごとの同時リクエスト数を endpoint_concurrency で制限する。
+    送信間隔は RateLimiter に従う。
+    """
+    MAX_CONNECTIONS = 10
+    KEEPALIVE_TIMEOUT = 30 # 秒
+    REQUEST_TIMEOUT = 10 # 秒
+
+    # レート制限で待っている間に、キャンセルされたか確認する間隔
+    CANCEL_CHECK_INTERVAL = 0.2 # 秒
+
+    # エンドポイントごとの同時リクエスト数
+    ENDPOINT_CONCURRENCY = {
+        'steps': 4,
+        'sleep': 4,
+    }
+
+    def __init__(self, fitbit, rate_limiter, max_connections=MAX_CONNECTIONS, endpoint_concurrency=None,
+                 cancel_token=None):
+        """
+        Args:
+            fitbit (Fitbit): アクセストークンの取得・更新に使うFitbitクライアント
+            rate_limiter (RateLimiter): レート制限
+            max_connections (int): 接続プールの大きさ
+            endpoint_concurrency (dict): エンドポイント名をキー、同時リクエスト数を値とする辞書
+            cancel_token (CancelToken): キャンセルされたら新しいリクエストを送らずに CancelledError を投げる
+        """
+        self.fitbit = fitbit
+        self.rate_limiter = rate_limiter
+        self.cancel_token = cancel_token
+        self.max_connections = max_connections
+        self.endpoint_concurrency = endpoint_concurrency or self.ENDPOINT_CONCURRENCY
+
+        self._semaphores = None
+        self._refresh_lock = None
+
+    def run(self, jobs: list):
+        """リクエストをすべて実行する(終わるまで戻らない)
+
+        Args:
+            jobs (list): (エンドポイント名, URL, コールバック) のリスト。
+                         コールバックはレスポンスのJSONを受け取り、イベントループのスレッドで呼ばれる
+        """
+        asyncio.run(self._run(jobs))
+
+    async def _run(self, jobs):
+        self._semaphores = {
+            endpoint: asyncio.Semaphore(concurrency)
+            for endpoint, concurrency in self.endpoint_concurrency.items()
+        }
+        self._refresh_lock = asyncio.Lock()
+
+        connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=self.KEEPALIVE_TIMEOUT)
+        timeout = aiohttp.ClientTimeout(total=self.REQUEST_TIMEOUT)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            tasks = [asyncio.create_task(self._run_job(session, *job)) for job in jobs]
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                # 1つでも失敗したら残りのリクエストは送らない
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run_job(self, session, endpoint, url, callback):
+        semaphore = self._semaphores.setdefault(endpoint, asyncio.Semaphore(1))
+
+        async with semaphore:
+            data = await self._request(session, endpoint, url)
+
+        callback(data)
+
+    async def _request(self, session, endpoint, url):
+        """レート制限に合わせてGETリクエストを送り、JSONを返す
+           429ならリセットまで待って再試行し、トークン切れならトークンを更新して再試行する
+        """
+        retries = 0
+
+        # 更新したときの期限切れのアクセストークン(更新しても同じトークンで期限切れになるなら諦める)
+        expired_access_token = None
+
+        while True:
+            await self._acquire()
+
+            access_token = self.fitbit.client.session.token['access_token']
+            headers = {
+                'Authorization': f'Bearer {access_token}',
+                'Accept-Language': self.fitbit.system,
+            }
+
+            Metrics.count('http.requests')
+            try:
+                with Metrics.span('fetch.http', endpoint=endpoint):
+                    async with session.get(url, headers=headers) as response:
+                        self.rate_limiter.update_from_headers(response.headers)
+                        body = await response.read()
+            finally:
+                self.rate_limiter.release()
+
+            if response.status == 429:
+                Metrics.count('http.429')
+                retries += 1
+                if retries > self.rate_limiter.MAX_RETRIES:
+                    raise Exception("サーバーへのアクセスが多すぎます。1時間後に再度実行してください。")
+                Metrics.count('http.retries')
+                retry_after = int(response.headers.get('Retry-After', self.rate_limiter.WINDOW_SECONDS))
+                self.rate_limiter.pause(retry_after)
+                continue
+
+            # 429で待っている間に更新したトークンがまた期限切れになることもあるので、トークンごとに1回更新する
+            if response.status == 401 and access_token != expired_access_token and self._is_expired_token(body):
+                await self._refresh_token(access_token)
+                expired_access_token = access_token
+                continue
+
+            if response.status >= 400:
+                raise Exception(f"HTTP {response.status}: {body.decode('utf8', errors='replace')}")
+
+            return json.loads(body.decode('utf8'))
+
+    async def _acquire(self):
+        """RateLimiter のトークンを取り出せるまで待つ(イベントループは止めない)"""
+        wait_started = None
+
+        while True:
+            if self.cancel_token is not None:
+                self.cancel_token.raise_if_cancelled()
+
+            wait_seconds = self.rate_limiter.try_acquire()
+            if wait_seconds <= 0:
+                if wait_started is not None:
+                    Metrics.record('fetch.rate_limit_wait', time.perf_counter() - wait_started)
+                return
+
+            if wait_started is None:
+                wait_started = time.perf_counter()
+
+            # キャンセルにすぐ気付けるように、少しずつ待つ
+            await asyncio.sleep(min(wait_seconds, self.CANCEL_CHECK_INTERVAL))
+
+    async def _refresh_token(self, expired_access_token):
+        """アクセストークンを更新する(同時に複数のリクエストが期限切れになっても1回だけ更新する)"""
+        async with self._refresh_lock:
+            if self.fitbit.client.session.token['access_token'] != expired_access_token:
+                return
+            loop = asyncio.get_running_loop()
+            with Metrics.span('fetch.token_refresh'):
+                await loop.run_in_executor(None, Metrics.bind(self.fitbit.client.refresh_token))
+
+    def _is_expired_token(self, body: bytes) -> bool:
+        try:
+            return json.loads(body.decode('utf8'))['errors'][0]['errorType'] == 'expired_token'
+        except (ValueError, KeyError, IndexError):
+            return False
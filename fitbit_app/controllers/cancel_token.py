@@ -0,0 +1,34 @@
+import threading
+
+class CancelledError(Exception):
+    """処理がキャンセルされた"""
+    def __init__(self, message="キャンセルしました。"):
+        super().__init__(message)
+
+class CancelToken:
+    """処理のキャンセルを伝える(どのスレッドからでも cancel できる)
+
+    処理する側は区切りごとに raise_if_cancelled を呼び、
+    待つときは time.sleep の代わりに wait を使う(キャンセルされたらすぐに戻る)。
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        """キャンセルする"""
+        self._event.set()
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        """キャンセルされていたら CancelledError を投げる"""
+        if self._event.is_set():
+            raise CancelledError()
+
+    def wait(self, seconds: float):
+        """seconds 秒待つ。待っている間にキャンセルされたら CancelledError を投げる"""
+        if self._event.wait(seconds):
+            raise CancelledError()
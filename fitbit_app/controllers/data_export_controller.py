@@ -0,0 +1,107 @@
+import calendar
+from ..metrics import Metrics
+from ..models.credential import Credential
+from ..models.data_exporter import DataExporter
+from ..models.output_month_model import OutputMonthModel
+from .cancel_token import CancelToken
+from .progress_reporter import ProgressReporter
+
+class DataExportController:
+    """保存済みのデータを月ごとにファイルへ書き出す(前回から変わった月だけ)
+
+    データベースは1か月ずつ読み込むので、期間が長くてもメモリは1か月分しか使わない。
+    """
+
+    def __init__(self, output_dir: str, export_format: str = 'parquet', start_month: tuple = None,
+                 end_month: tuple = None, full=False, progress=None, cancel_token=None):
+        """
+        Args:
+            output_dir (str): 出力先のフォルダ
+            export_format (str): 'parquet'、'arrow' または 'csv'
+            start_month (tuple): (開始年, 開始月)。Noneならデータがある最初の月
+            end_month (tuple): (終了年, 終了月)。Noneならデータがある最後の月
+            full (bool): Trueなら変わっていない月も書き直す
+            progress (ProgressReporter): 進捗の通知先(1か月ごとに通知する)
+            cancel_token (CancelToken): キャンセルされたら、書き出し中の月を終えてから止める
+        """
+        self.output_dir = output_dir
+        self.export_format = export_format
+        self.start_month = start_month
+        self.end_month = end_month
+        self.full = full
+        self.progress = progress or ProgressReporter()
+        self.cancel_token = cancel_token or CancelToken()
+
+    def export(self) -> dict:
+        """期間の月を書き出す
+
+        Returns:
+            dict: {'output_dir': 出力先, 'written': 書き出した月のリスト, 'unchanged': 変わっていなかった月数,
+                   'rows': テーブルごとの書き出した行数}
+
+        Raises:
+            CancelledError: キャンセルされたとき(書き出し済みの月は manifest.json に記録してある)
+            Exception: データが無いとき、読み込み・書き出しに失敗したとき
+        """
+        data_exporter = DataExporter(self.output_dir, self.export_format)
+        output_month_model = OutputMonthModel()
+        try:
+            first_day, last_day = self._period(output_month_model)
+            month_count = (
+                (int(last_day[:4]) - int(first_day[:4])) * 12 + int(last_day[5:7]) - int(first_day[5:7]) + 1
+            )
+
+            with Metrics.run(
+                'export_data', client_id=Credential.client_id, start=first_day[:7], end=last_day[:7],
+                format=self.export_format
+            ):
+                written = []
+                unchanged = 0
+                row_counts = {table_name: 0 for table_name in DataExporter.TABLES}
+
+                self.progress.start('export_data', month_count)
+                month_rows = output_month_model.iter_month_rows(first_day, last_day)
+                for year, month, sleep_rows, step_rows, step_intraday_rows in month_rows:
+                    self.cancel_token.raise_if_cancelled()
+                    Metrics.count('db.rows_read', len(sleep_rows) + len(step_rows) + len(step_intraday_rows))
+
+                    month_digest = OutputMonthModel.digest_rows(sleep_rows, step_rows, step_intraday_rows)
+                    if not self.full and data_exporter.is_unchanged(year, month, month_digest):
+                        unchanged += 1
+                    else:
+                        with Metrics.span('export_data.write', month=f"{year}-{month:02}"):
+                            month_row_counts = data_exporter.write_month(
+                                year, month, month_digest, sleep_rows, step_rows, step_intraday_rows
+                            )
+                        for table_name, row_count in month_row_counts.items():
+                            row_counts[table_name] += row_count
+                        Metrics.count('export_data.rows_written', sum(month_row_counts.values()))
+                        written.append(f"{year}-{month:02}")
+
+                    self.progress.advance()
+                self.progress.finish()
+        finally:
+            output_month_model.close()
+
+        return {
+            'output_dir': data_exporter.output_dir,
+            'written': written,
+            'unchanged': unchanged,
+            'rows': row_counts,
+        }
+
+    def _period(self, output_month_model: OutputMonthModel) -> tuple:
+        """書き出す期間を (月初の日付, 月末の日付) で返す(省略した側はデータがある最初・最後の月)"""
+        first_date, last_date = output_month_model.retrieve_date_range()
+        if first_date is None:
+            raise Exception("データがありません。")
+
+        start_year, start_month = self.start_month or (int(first_date[:4]), int(first_date[5:7]))
+        end_year, end_month = self.end_month or (int(last_date[:4]), int(last_date[5:7]))
+        if (start_year, start_month) > (end_year, end_month):
+            raise Exception("終了月が開始月より前です。")
+
+        return (
+            f"{start_year}-{start_month:02}-01",
+            f"{end_year}-{end_month:02}-{calendar.monthrange(end_year, end_month)[1]:02}"
+        )
@@ -1,13 +1,21 @@
 from concurrent.futures import ThreadPoolExecutor
-from datetime import timedelta
+from datetime import datetime, timedelta
 from fitbit import Fitbit
 from fitbit.exceptions import HTTPTooManyRequests
 import logging
 import os
 import threading
-from ..views.progress_view import ProgressView
+from urllib.parse import urlparse
+from .cancel_token import CancelToken, CancelledError
+from .progress_reporter import ProgressReporter
+from .rate_limiter import RateLimiter
+from ..metrics import Metrics
+from ..models.auth_model import AuthModel
 from ..models.credential import Credential
+from ..models.database import Database
 from ..models.fetch_model import FetchModel
+from ..models.fetch_writer import FetchWriter
+from ..models.step_intraday import StepIntraday
 
 os.makedirs('error_log', exist_ok=True)
 
@@ -19,120 +27,534 @@ logging.basicConfig(
 )
 
 class FetchController:
-    def __init__(self, master, start_date, end_date, error_callback, success_callback):
-        self.fitbit = Fitbit(
-            Credential.client_id,
-            Credential.client_secret,
-            Credential.access_token,
-            Credential.refresh_token
-        )
-        
+    # 取得モード
+    FETCH_MODE_DAILY = 'daily' # 1日ずつ取得(1日あたり2リクエスト)
+    FETCH_MODE_RANGE = 'range' # 期間まとめて取得(期間APIを使用)
+
+    # 期間APIで1回に取得できる最大日数(睡眠の期間APIは100日まで)
+    RANGE_CHUNK_DAYS = 100
+
+    # 取得エンジン
+    FETCH_ENGINE_THREAD = 'thread' # スレッドプールで同期リクエスト
+    FETCH_ENGINE_ASYNC = 'async'   # asyncioのイベントループで非同期リクエスト(aiohttpが必要)
+
+    # 1日ずつ取得するときの同時リクエスト数(送信間隔は RateLimiter が調整する)
+    MAX_WORKERS = 10
+
+    # 取得済みの日を除いて取得するときも、必ず取得し直す直近の日数
+    # (デバイスの同期が遅れて、取得済みの日のデータが後から増えることがあるため)
+    SYNC_RECENT_DAYS = 2
+
+    def __init__(self, master, start_date, end_date, error_callback, success_callback,
+                 fetch_mode=FETCH_MODE_DAILY, sync_missing_only=False, fetch_engine=FETCH_ENGINE_THREAD,
+                 progress=None, fitbit=None, rate_limiter=None, cancel_token=None,
+                 api_endpoint=None, concurrency=None):
+        """
+        fitbit と rate_limiter は、前回の取得で作ったものを渡すと使い回す
+        (接続とレート制限の状態を引き継ぐ。両方そろって渡す)
+
+        api_endpoint は、Fitbit APIの代わりに負荷試験用のサーバー(benchmarks/fitbit_simulator.py)などへ
+        リクエストを送るときに指定する(例: http://127.0.0.1:8080)。fitbit を渡したときは使わない。
+        concurrency は同時リクエスト数(Noneなら MAX_WORKERS、非同期エンジンはエンジンの既定値)。
+        """
+        if fitbit is None:
+            # トークンの期限が切れたら自動で更新し、_on_token_refresh で保存する
+            fitbit = Fitbit(
+                Credential.client_id,
+                Credential.client_secret,
+                Credential.access_token,
+                Credential.refresh_token,
+                expires_at=Credential.expires_at,
+                refresh_cb=FetchController._on_token_refresh
+            )
+            if api_endpoint:
+                self._set_api_endpoint(fitbit, api_endpoint)
+
+            # レスポンスヘッダーからレート制限の状態を読み取る
+            rate_limiter = RateLimiter()
+            fitbit.client.session.hooks['response'].append(rate_limiter.update_from_response)
+
+        self.fitbit = fitbit
+        self.rate_limiter = rate_limiter
+
         self.master = master
         self.start_date = start_date
         self.end_date = end_date
         self.error_callback = error_callback
         self.success_callback = success_callback
+        self.fetch_mode = fetch_mode
+        self.sync_missing_only = sync_missing_only
+        self.fetch_engine = fetch_engine
+        self.concurrency = concurrency
+
+        # 進捗の通知先(画面を使わないときに進捗を出力する)
+        self.progress = progress or ProgressReporter()
+
+        # キャンセルされたら新しいリクエストを送らない(取得済みの分は保存する)
+        self.cancel_token = cancel_token or CancelToken()
 
     def start_fetch(self):
-        self.progress_view = ProgressView(self.master, "データ取得中です...")
+        from ..views.event_bus import UiEventBus
+        from ..views.progress_view import ProgressView, ProgressViewReporter
+
+        # Tkの操作はすべてイベントバスを通してメインスレッドで行う
+        event_bus = UiEventBus.of(self.master)
+        self.progress_view = ProgressView(self.master, "データ取得中です...", cancel_token=self.cancel_token)
+        self.progress = ProgressViewReporter(self.progress_view, event_bus)
 
         def run_task():
             try:
-                self._fetch_steps_and_sleep_data_in_range()
-                self.success_callback()
+                self.fetch()
+                result = (self.success_callback,)
+            except CancelledError:
+                # キャンセルしたときは何も表示しない(取得済みの日は保存してあり、次回はその続きから取得する)
+                result = None
             except Exception as e:
-                self.error_callback(str(e))
+                result = (self.error_callback, str(e))
             finally:
-                self.progress_view.close()
+                # このスレッドで開いたデータベースの接続を閉じる
+                Database.close()
+
+            # 進捗画面を閉じてから結果を表示する
+            event_bus.post(self.progress_view.close)
+            if result is not None:
+                event_bus.post(*result)
 
         thread = threading.Thread(target=run_task)
         thread.start()
 
-    def _fetch_steps_and_sleep_data_in_range(self):
+    def fetch(self):
+        """歩数と睡眠のデータを取得して保存する(終わるまで戻らない)
+           画面を使わないときは start_fetch ではなくこれを直接呼ぶ
+
+        Raises:
+            CancelledError: キャンセルされたとき(それまでに取得した日は保存する)
+            Exception: 取得または保存に失敗したとき
+        """
+        with Metrics.run(
+            'sync', client_id=Credential.client_id,
+            start=self.start_date.isoformat(), end=self.end_date.isoformat(),
+            mode=self.fetch_mode, engine=self.fetch_engine, missing_only=self.sync_missing_only
+        ):
+            with Metrics.span('fetch.plan'):
+                dates = self._plan_fetch_dates()
+            Metrics.count('fetch.days', len(dates))
+
+            # 進捗と一緒にリクエストの速さとレート制限の残りを通知する
+            # (Fitbitクライアントを使い回すときのために、リクエスト数はこの取得の分だけにする)
+            requests_at_start = self.rate_limiter.headroom()['requests']
+
+            def fetch_status():
+                status = self.rate_limiter.headroom()
+                status['requests'] -= requests_at_start
+                return status
+
+            self.progress.set_status_source(fetch_status)
+            self.progress.start('sync', len(dates))
+            if not dates:
+                self.progress.finish()
+                return
+
+            # 取得したデータは書き込みスレッドがまとめて保存する
+            writer = FetchWriter()
+            writer.start()
+
+            try:
+                if self.fetch_engine == self.FETCH_ENGINE_ASYNC:
+                    self._fetch_steps_and_sleep_data_async(dates, writer)
+                elif self.fetch_mode == self.FETCH_MODE_RANGE:
+                    self._fetch_steps_and_sleep_data_by_range(dates, writer)
+                else:
+                    self._fetch_steps_and_sleep_data_by_day(dates, writer)
+            finally:
+                # 取得済みの分は、途中でエラーになっても保存する
+                with Metrics.span('fetch.writer_close'):
+                    self._close_writer(writer)
+
+            self.progress.finish()
+
+    @staticmethod
+    def _set_api_endpoint(fitbit: Fitbit, api_endpoint: str):
+        """リクエスト先(APIとトークンの更新)を変える
+
+        Args:
+            fitbit (Fitbit): Fitbitクライアント
+            api_endpoint (str): スキームとホスト(例: http://127.0.0.1:8080)
+        """
+        api_endpoint = api_endpoint.rstrip('/')
+
+        # 手元の負荷試験用サーバーは http なので、トークンを http で送れるようにする(ループバックのときだけ)
+        url = urlparse(api_endpoint)
+        if url.scheme == 'http' and url.hostname in ('127.0.0.1', 'localhost', '::1'):
+            os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
+
+        fitbit.API_ENDPOINT = api_endpoint
+        fitbit.client.refresh_token_url = f"{api_endpoint}/oauth2/token"
+        fitbit.client.session.auto_refresh_url = fitbit.client.refresh_token_url
+
+    @staticmethod
+    def _on_token_refresh(token: dict):
+        """トークンが更新されたときに呼ばれる
+           リフレッシュトークンは1回しか使えないので、保存してあるトークンも書き換える
+        """
+        Credential.access_token = token['access_token']
+        Credential.refresh_token = token['refresh_token']
+        Credential.expires_at = token.get('expires_at', '')
+
+        AuthModel().update_token(Credential.client_id, token)
+        Metrics.count('http.token_refreshes')
+
+    def _put_day(self, writer, date_str: str, step_count, sleep_data: list, step_intraday=None):
+        """1日分のデータを書き込みキューへ積み、進捗を通知する"""
+        writer.put(date_str, step_count, sleep_data, step_intraday)
+        self.progress.advance()
+
+    def _close_writer(self, writer):
+        try:
+            writer.close()
+        except Exception as e:
+            logging.error("An save error occurred", exc_info=True)
+            raise Exception(
+                f"データ保存に失敗しました。\n"
+                f"詳細: {e}"
+            )
+
+    def _plan_fetch_dates(self) -> list:
+        """取得する日付のリストを作る
+           sync_missing_only のときは、未取得の日・不完全な日・直近 SYNC_RECENT_DAYS 日だけにする
+           (1日ずつ取得するときは、15分ごとの歩数が保存されていない日も取得する)
+
+        Returns:
+            list: 取得する日付(date)のリスト(昇順)
+        """
         total_days = (self.end_date - self.start_date).days + 1
-        if total_days > 100:
-            raise Exception(f"取得する日数が多すぎます。3ヵ月分程度に絞ってください。")
-        
+        dates = [self.start_date + timedelta(days=i) for i in range(total_days)]
+
+        if not self.sync_missing_only:
+            return dates
+
+        model = FetchModel()
+        try:
+            complete_dates = model.retrieve_complete_dates(
+                self.start_date, self.end_date, require_step_intraday=self.fetch_mode == self.FETCH_MODE_DAILY
+            )
+        finally:
+            model.close()
+
+        recent_start = datetime.today().date() - timedelta(days=self.SYNC_RECENT_DAYS - 1)
+
+        return [
+            current_date for current_date in dates
+            if current_date.isoformat() not in complete_dates or current_date >= recent_start
+        ]
+
+    def _plan_range_chunks(self, dates) -> list:
+        """期間APIで取得する区間のリストを作る
+           期間APIは日数によらず1リクエストなので、取得する日の間に取得済みの日があっても
+           RANGE_CHUNK_DAYS 日までは1つの区間にまとめる
+
+        Args:
+            dates (list): 取得する日付(date)のリスト(昇順)
+
+        Returns:
+            list: (開始日, 終了日) のリスト
+        """
+        chunks = []
+        index = 0
+
+        while index < len(dates):
+            chunk_start = dates[index]
+            chunk_end = min(chunk_start + timedelta(days=self.RANGE_CHUNK_DAYS - 1), dates[-1])
+            chunks.append((chunk_start, chunk_end))
+
+            # 次の区間は、この区間より後の最初の取得する日から
+            while index < len(dates) and dates[index] <= chunk_end:
+                index += 1
+
+        return chunks
+
+    def _put_range_data(self, writer, chunk_start, chunk_end, date_strs, step_counts, sleep_data):
+        """期間APIで取得したデータを1日ごとに書き込みキューへ積む(保存は取得する日だけ)"""
+        for i in range((chunk_end - chunk_start).days + 1):
+            date_str = (chunk_start + timedelta(days=i)).isoformat()
+            if date_str not in date_strs:
+                continue
+            self._put_day(writer, date_str, step_counts.get(date_str, 0), sleep_data.get(date_str, []))
+
+    def _fetch_steps_and_sleep_data_by_range(self, dates, writer):
+        """期間APIで歩数と睡眠のデータをまとめて取得し、1日ごとに保存する
+           RANGE_CHUNK_DAYS 日ごとに区切って取得するので、日数の上限はない
+
+        Args:
+            dates (list): 取得する日付(date)のリスト(昇順)
+            writer (FetchWriter): 書き込みスレッド
+        """
+        date_strs = {current_date.isoformat() for current_date in dates}
+
+        for chunk_start, chunk_end in self._plan_range_chunks(dates):
+            # データの取得
+            step_counts = self._fetch_step_data_in_range(chunk_start, chunk_end)
+            sleep_data = self._fetch_sleep_data_in_range(chunk_start, chunk_end)
+
+            # 書き込みキューへ
+            self._put_range_data(writer, chunk_start, chunk_end, date_strs, step_counts, sleep_data)
+
+    def _fetch_steps_and_sleep_data_by_day(self, dates, writer):
         futures = [] # タスクの例外はfuture.result()を呼び出さないとキャッチできない
 
-        with ThreadPoolExecutor(max_workers=50) as executor:
-            for i in range(total_days):
-                current_date = self.start_date + timedelta(days=i)
+        # 取得スレッドでの時間と件数も、この取得の記録にする
+        fetch_and_save_data = Metrics.bind(self._fetch_and_save_data)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency or self.MAX_WORKERS) as executor:
+            for current_date in dates:
                 futures.append(
-                    executor.submit(self._fetch_and_save_data, current_date)
+                    executor.submit(fetch_and_save_data, current_date, writer)
                 )
             
         # タスクの結果を確認し、例外があれば再スロー
         for future in futures:
             try:
                 future.result()  # ここで例外が発生していればキャッチできる
+            except CancelledError:
+                raise
             except Exception as e:
                 raise Exception(f"{e}")
 
-    def _fetch_and_save_data(self, date):
-        model = FetchModel()
-
-        date_str = date.isoformat()
-
+    def _fetch_and_save_data(self, date, writer):
         # データの取得
-        step_count = self._fetch_step_data(date)
+        step_count, step_intraday = self._fetch_step_data(date)
         sleep_data = self._fetch_sleep_data(date)
 
-        # データベースへ保存
+        # 書き込みキューへ
+        self._put_day(writer, date.isoformat(), step_count, sleep_data, step_intraday)
+
+    def _fetch_steps_and_sleep_data_async(self, dates, writer):
+        """非同期エンジンで歩数と睡眠のデータを取得し、1日ごとに保存する
+           取得モード(1日ずつ/期間まとめて)の扱いは同期の場合と同じ
+
+        Args:
+            dates (list): 取得する日付(date)のリスト(昇順)
+            writer (FetchWriter): 書き込みスレッド
+        """
+        # aiohttp は非同期エンジンを使うときだけ必要なので、ここでインポートする
+        from .async_fetch_engine import AsyncFetchEngine
+
+        # 歩数と睡眠の両方がそろったら書き込みキューへ積む(コールバックはイベントループのスレッドで呼ばれる)
+        received = {}
+
+        def on_received(key, data_type, save):
+            def callback(data):
+                parts = received.setdefault(key, {})
+                parts[data_type] = data
+                if len(parts) == 2:
+                    save(parts['steps'], parts['sleep'])
+                    del received[key]
+            return callback
+
+        jobs = []
+
+        if self.fetch_mode == self.FETCH_MODE_RANGE:
+            date_strs = {current_date.isoformat() for current_date in dates}
+
+            for chunk_start, chunk_end in self._plan_range_chunks(dates):
+                def save_range(step_data, raw_sleep_data, chunk_start=chunk_start, chunk_end=chunk_end):
+                    period_str = f"{chunk_start.isoformat()}~{chunk_end.isoformat()}"
+                    step_counts = self._parse_step_data_in_range(step_data, period_str)
+                    sleep_data = self._parse_sleep_data_in_range(raw_sleep_data, period_str)
+                    self._put_range_data(writer, chunk_start, chunk_end, date_strs, step_counts, sleep_data)
+
+                key = (chunk_start, chunk_end)
+                jobs.append(('steps', self._step_range_url(chunk_start, chunk_end), on_received(key, 'steps', save_range)))
+                jobs.append(('sleep', self._sleep_range_url(chunk_start, chunk_end), on_received(key, 'sleep', save_range)))
+        else:
+            for current_date in dates:
+                def save_day(step_data, raw_sleep_data, current_date=current_date):
+                    step_count = self._parse_step_data(step_data, current_date.isoformat())
+                    step_intraday = self._parse_step_intraday(step_data, current_date.isoformat())
+                    sleep_data = self._parse_sleep_data(raw_sleep_data, current_date.isoformat())
+                    self._put_day(writer, current_date.isoformat(), step_count, sleep_data, step_intraday)
+
+                jobs.append(('steps', self._step_url(current_date), on_received(current_date, 'steps', save_day)))
+                jobs.append(('sleep', self._sleep_url(current_date), on_received(current_date, 'sleep', save_day)))
+
         try:
-            model.insert_step_data(date_str, step_count)
-            model.insert_sleep_data(date_str, sleep_data)
+            engine_options = {}
+            if self.concurrency:
+                engine_options['max_connections'] = self.concurrency
+                engine_options['endpoint_concurrency'] = {
+                    endpoint: self.concurrency for endpoint in AsyncFetchEngine.ENDPOINT_CONCURRENCY
+                }
+            AsyncFetchEngine(self.fitbit, self.rate_limiter, cancel_token=self.cancel_token, **engine_options).run(jobs)
+        except CancelledError:
+            raise
         except Exception as e:
-            logging.error("An save error occurred", exc_info=True)
+            logging.error("An async fetch error occurred", exc_info=True)
             raise Exception(
-                f"{date_str} のデータ保存に失敗しました。\n"
+                f"データを取得できませんでした。\n"
                 f"詳細: {e}"
             )
-        finally:
-            model.close()
 
-    def _fetch_step_data(self, date):
-        try:
-            step_data = self.fitbit.intraday_time_series(
-                'activities/steps', date, detail_level='15min'
-            )
-            step_count = step_data['activities-steps'][0]['value']
-            
-            return step_count
-        except (HTTPTooManyRequests, KeyError) as e:
-            raise Exception(
-                    f"{date.isoformat()}の歩数データを取得できませんでした。\n"
+    def _api_url(self, path: str) -> str:
+        """APIのURLを組み立てる(fitbitパッケージと同じ形式)"""
+        return f"{self.fitbit.API_ENDPOINT}/{self.fitbit.API_VERSION}/user/-/{path}.json"
+
+    def _step_url(self, date) -> str:
+        return self._api_url(f"activities/steps/date/{date.isoformat()}/1d/15min")
+
+    def _sleep_url(self, date) -> str:
+        return self._api_url(f"sleep/date/{date.isoformat()}")
+
+    def _step_range_url(self, start_date, end_date) -> str:
+        return self._api_url(f"activities/steps/date/{start_date.isoformat()}/{end_date.isoformat()}")
+
+    def _sleep_range_url(self, start_date, end_date) -> str:
+        # fitbitパッケージには睡眠の期間APIのメソッドが無いのでURLを組み立てる
+        return self._api_url(f"sleep/date/{start_date.isoformat()}/{end_date.isoformat()}")
+
+    def _fetch_error(self, target_str: str, data_name: str, e: Exception) -> Exception:
+        """取得エラーをユーザー向けのメッセージにする
+
+        Args:
+            target_str (str): 日付または期間の文字列
+            data_name (str): '歩数' または '睡眠'
+            e (Exception): 元の例外
+        """
+        # キャンセルはそのまま呼び出し元に伝える
+        if isinstance(e, CancelledError):
+            return e
+
+        if isinstance(e, (HTTPTooManyRequests, KeyError)):
+            return Exception(
+                    f"{target_str}の{data_name}データを取得できませんでした。\n"
                     f"原因: サーバーへのアクセスが多すぎます。\n"
                     f"{f'1時間後に再度実行してください。'}"
                 )
+
+        logging.error(f"An fetch {data_name} data error occurred", exc_info=e)
+        return Exception(
+            f"{target_str}の{data_name}データを取得できませんでした。\n"
+            f"詳細: {e}"
+        )
+
+    def _fetch_step_data(self, date) -> tuple:
+        """1日の歩数を取得する
+
+        Returns:
+            tuple: (歩数, 15分ごとの歩数のリスト(取得できなければNone))
+        """
+        try:
+            step_data = self.rate_limiter.call(
+                self.fitbit.intraday_time_series,
+                'activities/steps', date, detail_level='15min',
+                cancel_token=self.cancel_token
+            )
         except Exception as e:
-            logging.error("An fetch step data error occurred", exc_info=True)
-            raise Exception(
-                f"{date.isoformat()}の歩数データを取得できませんでした。\n"
-                f"詳細: {e}"
+            raise self._fetch_error(date.isoformat(), '歩数', e)
+
+        return self._parse_step_data(step_data, date.isoformat()), self._parse_step_intraday(step_data, date.isoformat())
+
+    def _parse_step_data(self, step_data: dict, date_str: str):
+        try:
+            return step_data['activities-steps'][0]['value']
+        except Exception as e:
+            raise self._fetch_error(date_str, '歩数', e)
+
+    def _parse_step_intraday(self, step_data: dict, date_str: str):
+        try:
+            return StepIntraday.from_response(step_data)
+        except Exception as e:
+            raise self._fetch_error(date_str, '15分ごとの歩数', e)
+
+    def _fetch_step_data_in_range(self, start_date, end_date) -> dict:
+        """期間内の1日ごとの歩数を取得する
+
+        Args:
+            start_date (date): 開始日
+            end_date (date): 終了日
+
+        Returns:
+            dict: 日付文字列(YYYY-MM-DD)をキー、歩数を値とする辞書
+        """
+        period_str = f"{start_date.isoformat()}~{end_date.isoformat()}"
+
+        try:
+            step_data = self.rate_limiter.call(
+                self.fitbit.time_series,
+                'activities/steps', base_date=start_date, end_date=end_date,
+                cancel_token=self.cancel_token
+            )
+        except Exception as e:
+            raise self._fetch_error(period_str, '歩数', e)
+
+        return self._parse_step_data_in_range(step_data, period_str)
+
+    def _parse_step_data_in_range(self, step_data: dict, period_str: str) -> dict:
+        try:
+            return {
+                daily_step['dateTime']: daily_step['value']
+                for daily_step in step_data['activities-steps']
+            }
+        except Exception as e:
+            raise self._fetch_error(period_str, '歩数', e)
+
+    def _fetch_sleep_data_in_range(self, start_date, end_date) -> dict:
+        """期間内の睡眠データを取得し、1日ごとに分割する
+
+        Args:
+            start_date (date): 開始日
+            end_date (date): 終了日(開始日から100日以内)
+
+        Returns:
+            dict: 日付文字列(YYYY-MM-DD)をキー、睡眠記録ごとの詳細のリストを値とする辞書
+        """
+        period_str = f"{start_date.isoformat()}~{end_date.isoformat()}"
+
+        try:
+            raw_sleep_data = self.rate_limiter.call(
+                self.fitbit.make_request, self._sleep_range_url(start_date, end_date),
+                cancel_token=self.cancel_token
             )
-    
+        except Exception as e:
+            raise self._fetch_error(period_str, '睡眠', e)
+
+        return self._parse_sleep_data_in_range(raw_sleep_data, period_str)
+
+    def _parse_sleep_data_in_range(self, raw_sleep_data: dict, period_str: str) -> dict:
+        """期間APIの睡眠データを1日ごとに分割する
+           形式は _parse_sleep_data と同じ(睡眠記録ごとの詳細を開始時刻順に並べたリスト)
+        """
+        try:
+            # 睡眠記録を日付ごとにまとめる
+            sleep_logs_by_date = {}
+            for sleep_log in raw_sleep_data['sleep']:
+                sleep_logs_by_date.setdefault(sleep_log['dateOfSleep'], []).append(sleep_log)
+
+            sleep_data = {}
+            for date_str, sleep_logs in sleep_logs_by_date.items():
+                sleep_logs.sort(key=lambda sleep_log: sleep_log['startTime'])
+                sleep_data[date_str] = [sleep_log['levels']['data'] for sleep_log in sleep_logs]
+
+            return sleep_data
+        except Exception as e:
+            raise self._fetch_error(period_str, '睡眠', e)
+
     def _fetch_sleep_data(self, date):
+        try:
+            raw_sleep_data = self.rate_limiter.call(self.fitbit.get_sleep, date, cancel_token=self.cancel_token)
+        except Exception as e:
+            raise self._fetch_error(date.isoformat(), '睡眠', e)
+
+        return self._parse_sleep_data(raw_sleep_data, date.isoformat())
+
+    def _parse_sleep_data(self, raw_sleep_data: dict, date_str: str) -> list:
         try:
             sleep_data = []
 
-            raw_sleep_data = self.fitbit.get_sleep(date)
             sleep_count = raw_sleep_data['summary']['totalSleepRecords']
 
             for i in reversed(range(sleep_count)):
                 sleep_data.append(raw_sleep_data['sleep'][i]['levels']['data'])
 
-            return str(sleep_data)
-        except (HTTPTooManyRequests, KeyError) as e:
-            raise Exception(
-                    f"{date.isoformat()}の睡眠データを取得できませんでした。\n"
-                    f"原因: サーバーへのアクセスが多すぎます。\n"
-                    f"{f'1時間後に再度実行してください。'}"
-                )
+            return sleep_data
         except Exception as e:
-            logging.error("An fetch sleep data error occurred", exc_info=True)
-            raise Exception(
-                f"{date.isoformat()}の睡眠データを取得できませんでした。\n"
-                f"詳細: {e}"
-            )
-
+            raise self._fetch_error(date_str, '睡眠', e)
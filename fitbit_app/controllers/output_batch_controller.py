@@ -0,0 +1,285 @@
+import calendar
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+import logging
+import os
+import signal
+import threading
+from matplotlib.backends.backend_pdf import PdfPages
+from ..models.credential import Credential
+from ..models.database import Database
+from ..models.output_month_service import OutputMonthService
+from ..models.report_cache import ReportCache
+from .cancel_token import CancelToken, CancelledError
+from ..metrics import Metrics
+from .output_month_controller import OutputMonthController
+from .progress_reporter import ProgressReporter
+
+def _init_worker(client_id: str, metrics_enabled: bool):
+    """ワーカープロセスの初期化(クラス変数は別プロセスに引き継がれないので設定し直す)"""
+    # Ctrl+C は親プロセスだけが受け取ってキャンセルする
+    # (spawn・forkserver のワーカーは既定のハンドラーのままなので、描画中に KeyboardInterrupt でプールが壊れる)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    Credential.client_id = client_id
+    Metrics.init_worker(metrics_enabled)
+
+def _render_month(year: int, month: int, return_figure: bool, frames=None):
+    """ワーカープロセスで1か月分のグラフを描画する
+
+    Args:
+        year (int): 年
+        month (int): 月
+        return_figure (bool): Trueなら保存せずにFigureを返す(1つのPDFにまとめるとき)
+        frames (tuple): キャッシュしておいた(睡眠データ, 歩数データ, 時間帯別の歩数データ)。Noneならデータベースから読み込む
+
+    Returns:
+        tuple: (年, 月, 保存したPDFのパスまたはFigure, 描画に使ったデータ, エラーメッセージ, 記録した時間と件数)
+    """
+    with Metrics.capture() as metrics_run:
+        try:
+            controller = OutputMonthController(None, year, month, lambda error_message: None)
+            if frames is not None:
+                controller.set_frames(frames)
+            fig = controller.build_figure()
+            frames = controller.frames()
+            output = fig if return_figure else controller.save_pdf(fig)
+            error = None
+        except Exception as e:
+            output, frames, error = None, None, str(e)
+
+    # 時間と件数は親プロセスの記録にまとめる
+    return year, month, output, frames, error, metrics_run.records() if metrics_run else None
+
+class OutputBatchController:
+    """複数の月のグラフをプロセスプールで並列に描画してPDFに出力する"""
+
+    # 描画の終了を待つ間に、キャンセルされたか確認する間隔
+    CANCEL_CHECK_INTERVAL = 0.2 # 秒
+
+    def __init__(self, master, start_year: int, start_month: int, end_year: int, end_month: int,
+                 error_callback, success_callback, combine=False, max_workers=None, progress=None,
+                 cancel_token=None):
+        """
+        Args:
+            master: 進捗画面の親ウィンドウ
+            start_year (int): 開始年
+            start_month (int): 開始月
+            end_year (int): 終了年
+            end_month (int): 終了月
+            error_callback: エラー時のコールバック(エラーメッセージを受け取る)
+            success_callback: 成功時のコールバック(保存したPDFのパスのリストを受け取る)
+            combine (bool): Trueなら1つのPDF(1か月1ページ)にまとめる
+            max_workers (int): プロセス数(Noneならコア数)
+            progress (ProgressReporter): 進捗の通知先(1か月ごとに通知する)
+            cancel_token (CancelToken): キャンセルされたら、まだ始まっていない月は描画しない
+        """
+        self.master = master
+        self.months = self._list_months(start_year, start_month, end_year, end_month)
+        self.error_callback = error_callback
+        self.success_callback = success_callback
+        self.combine = combine
+        self.max_workers = max_workers
+        self.progress = progress or ProgressReporter()
+        self.errors = []
+        self.cancel_token = cancel_token or CancelToken()
+
+        # 保存フォルダ名をClient IDにする
+        self.save_folder_name = Credential.client_id
+
+        if not self.months:
+            raise Exception("終了月が開始月より前です。")
+
+    def start_export(self):
+        from ..views.event_bus import UiEventBus
+        from ..views.progress_view import ProgressView, ProgressViewReporter
+
+        # Tkの操作はすべてイベントバスを通してメインスレッドで行う
+        event_bus = UiEventBus.of(self.master)
+        self.progress_view = ProgressView(
+            self.master, f"{len(self.months)}か月分のグラフ描画中です...", cancel_token=self.cancel_token
+        )
+        self.progress = ProgressViewReporter(self.progress_view, event_bus)
+
+        def run_task():
+            try:
+                pdf_paths = self.export()
+                result = (self.success_callback, pdf_paths)
+            except CancelledError:
+                # キャンセルしたときは何も表示しない(描画済みの月はキャッシュしてあり、次回はすぐに出力できる)
+                result = None
+            except Exception as e:
+                result = (self.error_callback, str(e))
+            finally:
+                # このスレッドで開いたデータベースの接続を閉じる
+                Database.close()
+
+            # 進捗画面を閉じてから結果を表示する
+            event_bus.post(self.progress_view.close)
+            if result is not None:
+                event_bus.post(*result)
+
+        # 新しいスレッドを使ってタスクを実行
+        thread = threading.Thread(target=run_task)
+        thread.start()
+
+    def export(self) -> list:
+        """すべての月を描画してPDFに保存する
+
+        Returns:
+            list: 保存したPDFのパスのリスト
+
+        Raises:
+            CancelledError: キャンセルされたとき
+            Exception: 1つも出力できなかったとき、保存に失敗したとき
+        """
+        (start_year, start_month), (end_year, end_month) = self.months[0], self.months[-1]
+        with Metrics.run(
+            'export', client_id=self.save_folder_name,
+            start=f"{start_year}-{start_month:02}", end=f"{end_year}-{end_month:02}", combine=self.combine
+        ):
+            # キャッシュの確認と保存はこのプロセスだけで行う(index.json をワーカーから同時に書き換えないため)
+            report_cache = ReportCache(self.save_folder_name)
+            results = {}
+            jobs = []
+
+            self.progress.start('export', len(self.months))
+
+            with Metrics.span('export.cache_key', months=len(self.months)):
+                month_digests = self._month_digests()
+
+            for year, month in self.months:
+                self.cancel_token.raise_if_cancelled()
+
+                controller = OutputMonthController(None, year, month, lambda error_message: None)
+                try:
+                    key = controller.cache_key(month_digests.get((year, month)))
+                except Exception as e:
+                    results[(year, month)] = (year, month, None, None, str(e))
+                    self.progress.advance()
+                    continue
+
+                cached = report_cache.get(key)
+                Metrics.count('cache.hits' if cached else 'cache.misses')
+                if cached and not self.combine:
+                    # 描画済みのPDFをそのまま使う
+                    pdf_path = controller.pdf_path()
+                    report_cache.restore_pdf(cached['pdf_path'], pdf_path)
+                    results[(year, month)] = (year, month, pdf_path, None, None)
+                    self.progress.advance()
+                    continue
+
+                # 1つのPDFにまとめるときは、キャッシュしたデータから描画し直す(データベースの読み込みと変換を省く)
+                frames = report_cache.load_frames(cached['frame_path']) if cached else None
+                jobs.append((year, month, key, frames))
+
+            if jobs:
+                with ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    initializer=_init_worker,
+                    initargs=(Credential.client_id, Metrics.enabled)
+                ) as executor:
+                    futures = [
+                        (key, executor.submit(_render_month, year, month, self.combine, frames))
+                        for year, month, key, frames in jobs
+                    ]
+                    for key, future in futures:
+                        try:
+                            year, month, output, frames, error, worker_metrics = self._wait_result(future)
+                        except CancelledError:
+                            # まだ始まっていない月は描画しない(描画中の月は終わるのを待つ)
+                            executor.shutdown(wait=False, cancel_futures=True)
+                            raise
+                        results[(year, month)] = (year, month, output, frames, error)
+                        Metrics.merge(worker_metrics)
+
+                        # 月ごとに保存したPDFはキャッシュしておく
+                        if not error and not self.combine:
+                            report_cache.put(key, year, month, output, frames)
+
+                        self.progress.advance()
+
+            # 月の順番どおりに並べる
+            results = [results[year_month] for year_month in self.months]
+            self.progress.finish()
+
+            # 出力できなかった月(呼び出し側で表示できるように残しておく)
+            self.errors = [f"{year}年{month:02}月: {error}" for year, month, _, _, error in results if error]
+            rendered = [(year, month, output) for year, month, output, _, error in results if not error]
+
+            if not rendered:
+                raise Exception("出力できる月がありませんでした。\n" + "\n".join(self.errors))
+
+            if self.errors:
+                logging.error("Some months could not be exported: %s", self.errors)
+
+            try:
+                if self.combine:
+                    return [self._save_combined_pdf(rendered)]
+                return [pdf_path for _, _, pdf_path in rendered]
+            except PermissionError:
+                raise Exception('ファイルが開かれているため、保存できません。\nPDFを閉じて再試行してください。')
+
+    def _month_digests(self) -> dict:
+        """すべての月のデータのハッシュを、期間のデータを1回読むだけで計算する
+
+        Returns:
+            dict: {(年, 月): ハッシュ}。読み込めなかったときは空(月ごとに計算し直して、月ごとのエラーにする)
+        """
+        (start_year, start_month), (end_year, end_month) = self.months[0], self.months[-1]
+        first_day = f"{start_year}-{start_month:02}-01"
+        last_day = f"{end_year}-{end_month:02}-{calendar.monthrange(end_year, end_month)[1]:02}"
+
+        try:
+            return {
+                (year, month): month_digest
+                for year, month, month_digest in OutputMonthService().iter_month_digests(first_day, last_day)
+            }
+        except Exception:
+            logging.error("An error occurred", exc_info=True)
+            return {}
+
+    def _wait_result(self, future):
+        """ワーカーの結果を待つ(待っている間にキャンセルされたら CancelledError を投げる)"""
+        while True:
+            self.cancel_token.raise_if_cancelled()
+            try:
+                return future.result(timeout=self.CANCEL_CHECK_INTERVAL)
+            except TimeoutError:
+                continue
+
+    def _save_combined_pdf(self, rendered: list) -> str:
+        """描画したFigureを1つのPDFに月の順番で保存する
+
+        Args:
+            rendered (list): (年, 月, Figure) のリスト
+
+        Returns:
+            str: 保存したPDFのパス
+        """
+        (first_year, first_month, _), (last_year, last_month, _) = rendered[0], rendered[-1]
+
+        os.makedirs(fr'./graph/{self.save_folder_name}/monthly', exist_ok=True)
+        pdf_path = os.path.abspath(
+            fr'./graph/{self.save_folder_name}/monthly/'
+            fr'{first_year}-{first_month:02}_{last_year}-{last_month:02}.pdf'
+        )
+
+        with Metrics.span('render.savefig', pages=len(rendered)):
+            with PdfPages(pdf_path) as pdf:
+                for _, _, fig in rendered:
+                    pdf.savefig(fig)
+
+        Metrics.count('pdf.files')
+        Metrics.count('pdf.bytes', os.path.getsize(pdf_path))
+
+        return pdf_path
+
+    def _list_months(self, start_year: int, start_month: int, end_year: int, end_month: int) -> list:
+        """開始月から終了月までの(年, 月)のリストを作る"""
+        months = []
+        year, month = start_year, start_month
+
+        while (year, month) <= (end_year, end_month):
+            months.append((year, month))
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+        return months
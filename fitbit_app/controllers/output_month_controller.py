@@ -5,14 +5,19 @@ import jpholiday
 import logging
 import matplotlib
 matplotlib.use('Agg')
-import matplotlib.pyplot as plt
 from matplotlib import rcParams
+from matplotlib.collections import PolyCollection
+from matplotlib.figure import Figure
 from matplotlib.lines import Line2D
+import numpy as np
 import seaborn as sns
 import threading
-from ..views.progress_view import ProgressView
+from .cancel_token import CancelToken, CancelledError
+from ..metrics import Metrics
 from ..models.output_month_service import OutputMonthService
 from ..models.credential import Credential
+from ..models.database import Database
+from ..models.report_cache import ReportCache
 
 # エラーログの設定
 os.makedirs('error_log', exist_ok=True)
@@ -24,12 +29,19 @@ logging.basicConfig(
     encoding='utf-8'
 )
 
-# フォントを日本語対応のものに設定
-rcParams['font.family'] = 'MS Gothic'
-sns.set_theme(style='darkgrid', context='notebook', font='MS Gothic')
-
 class OutputMonthController:
-    def __init__(self, master, year: int, month: int, error_callback):
+    # A4用紙横向きの寸法(インチ単位)
+    A4_WIDTH = 11.69
+    A4_HEIGHT = 8.27
+    DPI = 200
+
+    # 描画設定のバージョン(グラフの見た目を変えたら上げる。キャッシュしたPDFを描画し直すため)
+    RENDER_VERSION = 3
+
+    # グラフの見た目を設定済みか(モジュールを読み込んだだけではrcParamsを変えない)
+    _style_applied = False
+
+    def __init__(self, master, year: int, month: int, error_callback, cancel_token=None):
         self.master = master
         self.year = year
         self.month = month
@@ -40,81 +52,229 @@ class OutputMonthController:
         self.last_day = calendar.monthrange(self.year, self.month)[1]
         self.last_day_of_month = f"{self.year}-{self.month:02}-{self.last_day:02}"
 
-        # 睡眠データと歩数データをセット
+        # 睡眠データと歩数データは描画するときに読み込む(キャッシュがあれば読み込まない)
+        self.sleep_data = None
+        self.step_data = None
+        self.step_hourly_data = None
+
+        # グラフの列数(時間帯別歩数のグラフを出すかどうかで build_figure が決める)
+        self.column_count = 4
+
+        # 保存フォルダ名をClient IDにする
+        self.save_folder_name = Credential.client_id
+        self.report_cache = ReportCache(self.save_folder_name)
+
+        # 描画の区切りごとにキャンセルされたか確認する
+        self.cancel_token = cancel_token or CancelToken()
+
+    def load_data(self):
+        """データベースから睡眠データと歩数データを読み込む
+        """
         try:
             output_month_service = OutputMonthService()
             output_month_service.retrieve_month_data(self.first_day_of_month, self.last_day_of_month)
             self.sleep_data = output_month_service.sleep_data
             self.step_data = output_month_service.step_data
+            self.step_hourly_data = output_month_service.step_hourly_data
         except Exception as e:
-            # データベースが無い時
-            if "no such table" in str(e):
-                error_message = "データベースがありません。先にデータを取得してください。"
-                self.error_callback(error_message)
-            else:
-                logging.error("An error occurred", exc_info=True)
-                self.error_callback(str(e))
-            raise Exception(f"{e}")
+            raise self._data_error(e)
 
-        # 保存フォルダ名をClient IDにする
-        self.save_folder_name = Credential.client_id
+    def frames(self) -> tuple:
+        """描画に使ったデータを返す(キャッシュに保存する)
+
+        Returns:
+            tuple: (睡眠データ, 歩数データ, 時間帯別の歩数データ)
+        """
+        return self.sleep_data, self.step_data, self.step_hourly_data
+
+    def set_frames(self, frames: tuple):
+        """キャッシュしておいた睡眠データと歩数データをセットする
+
+        Args:
+            frames (tuple): frames() で返した (睡眠データ, 歩数データ, 時間帯別の歩数データ)
+        """
+        self.sleep_data, self.step_data, self.step_hourly_data = frames
+
+    def cache_key(self, month_digest: str = None) -> str:
+        """この月のキャッシュのキーを返す(その月のデータが変わるとキーも変わる)
+
+        Args:
+            month_digest (str): 計算済みのその月のハッシュ(OutputMonthService.iter_month_digests)。
+                                Noneならデータベースから計算する
+        """
+        if month_digest is None:
+            try:
+                month_digest = OutputMonthService().retrieve_month_digest(self.first_day_of_month, self.last_day_of_month)
+            except Exception as e:
+                raise self._data_error(e)
+
+        return self.report_cache.make_key(self.year, self.month, month_digest, self.RENDER_VERSION)
+
+    def _data_error(self, e: Exception) -> Exception:
+        # データベースが無い時
+        if "no such table" in str(e):
+            return Exception("データベースがありません。先にデータを取得してください。")
+
+        logging.error("An error occurred", exc_info=True)
+        return Exception(f"{e}")
 
     def start_plot(self):
-        self.progress_view = ProgressView(self.master, "グラフ描画中です...")
+        from ..views.event_bus import UiEventBus
+        from ..views.progress_view import ProgressView
+
+        # Tkの操作はすべてイベントバスを通してメインスレッドで行う
+        event_bus = UiEventBus.of(self.master)
+        self.progress_view = ProgressView(self.master, "グラフ描画中です...", cancel_token=self.cancel_token)
 
         def run_task():
             try:
                 self._plot_and_save_graph()
+                error_message = None
+            except CancelledError:
+                # キャンセルしたときは何も表示しない
+                error_message = None
             except Exception as e:
-                self.error_callback(str(e))
-                raise Exception(f"{e}")
+                error_message = str(e)
             finally:
-                self.progress_view.close()
+                # このスレッドで開いたデータベースの接続を閉じる
+                Database.close()
+
+            # 進捗画面を閉じてからエラーを表示する
+            event_bus.post(self.progress_view.close)
+            if error_message is not None:
+                event_bus.post(self.error_callback, error_message)
 
         # 新しいスレッドを使ってタスクを実行
         thread = threading.Thread(target=run_task)
         thread.start()
         
     def _plot_and_save_graph(self):
-        """グラフを描画する
+        """グラフを描画してPDFを開く
+        """
+        pdf_path = self.export_pdf()
+
+        # PDFを開く
+        os.startfile(pdf_path)
+
+    def export_pdf(self) -> str:
+        """グラフを描画してPDFで保存する(キャッシュがあればキャッシュしたPDFを使う)
+           画面を使わないときは start_plot ではなくこれを直接呼ぶ
+
+        Returns:
+            str: 保存したPDFのパス
+
+        Raises:
+            CancelledError: キャンセルされたとき(PDFは保存しない)
+            Exception: データが無いとき、保存に失敗したとき
         """
-        # A4用紙横向きの寸法(インチ単位)
-        a4_height = 8.27
-        a4_width = 11.69
+        with Metrics.run('export', client_id=self.save_folder_name, year=self.year, month=self.month):
+            with Metrics.span('export.cache_key'):
+                key = self.cache_key()
+            cached = self.report_cache.get(key)
+            Metrics.count('cache.hits' if cached else 'cache.misses')
+
+            # PDFで保存
+            try:
+                if cached:
+                    pdf_path = self.pdf_path()
+                    with Metrics.span('cache.restore'):
+                        self.report_cache.restore_pdf(cached['pdf_path'], pdf_path)
+                else:
+                    fig = self.build_figure()
+                    self.cancel_token.raise_if_cancelled()
+                    pdf_path = self.save_pdf(fig)
+                    with Metrics.span('cache.put'):
+                        self.report_cache.put(key, self.year, self.month, pdf_path, self.frames())
+
+                return pdf_path
+
+            except CancelledError:
+                raise
+            except PermissionError:
+                raise Exception('ファイルが開かれているため、保存できません。\nPDFを閉じて再試行してください。')
+            except Exception as e:
+                logging.error("An error occurred", exc_info=True)
+                raise Exception(f'ファイルの保存でエラーが発生しました。: {e}')
+
+    def build_figure(self) -> Figure:
+        """月のグラフを描画したFigureを作る
+           pyplotの状態を使わないので、別スレッド・別プロセスからでも呼べる
+
+        Returns:
+            Figure: 睡眠データ・時間帯別の歩数・歩数データのグラフ
+
+        Raises:
+            CancelledError: キャンセルされたとき
+        """
+        if self.sleep_data is None:
+            self.load_data()
+
+        self._apply_style()
 
         # グラフキャンバス用意
-        fig = plt.figure(dpi=200, figsize=(a4_width, a4_height))
+        fig = Figure(dpi=self.DPI, figsize=(self.A4_WIDTH, self.A4_HEIGHT))
+
+        # 15分ごとの歩数が1日も無い月(期間まとめて取得した月など)は、時間帯別歩数のグラフを出さない
+        has_step_hourly = bool(self.step_hourly_data.notna().to_numpy().any())
+        self.column_count = 4 if has_step_hourly else 3
 
         # グラフ描画
-        self._plot_sleep_data(fig, self.sleep_data)
-        self._plot_step_data(fig, self.step_data)
+        self.cancel_token.raise_if_cancelled()
+        with Metrics.span('render.sleep'):
+            self._plot_sleep_data(fig, self.sleep_data)
+        if has_step_hourly:
+            self.cancel_token.raise_if_cancelled()
+            with Metrics.span('render.heatmap'):
+                self._plot_step_heatmap(fig, self.step_hourly_data)
+        self.cancel_token.raise_if_cancelled()
+        with Metrics.span('render.steps'):
+            self._plot_step_data(fig, self.step_data)
+
+        with Metrics.span('render.layout'):
+            fig.tight_layout()
+
+        return fig
+
+    @classmethod
+    def _apply_style(cls):
+        """グラフの見た目を設定する(最初に描画するときに1回だけ)"""
+        if cls._style_applied:
+            return
+
+        # フォントを日本語対応のものに設定
+        rcParams['font.family'] = 'MS Gothic'
+        sns.set_theme(style='darkgrid', context='notebook', font='MS Gothic')
+        cls._style_applied = True
+
+    def pdf_path(self) -> str:
+        """月のPDFの保存先を返す"""
+        return os.path.abspath(fr'./graph/{self.save_folder_name}/monthly/{self.year}-{self.month:02}.pdf')
+
+    def save_pdf(self, fig: Figure) -> str:
+        """FigureをPDFに保存する
 
-        fig.tight_layout()
+        Args:
+            fig (Figure): build_figure で作ったFigure
 
-        # PDFで保存
-        try:
-            os.makedirs(fr'./graph/{self.save_folder_name}/monthly', exist_ok=True)
+        Returns:
+            str: 保存したPDFのパス
+        """
+        os.makedirs(fr'./graph/{self.save_folder_name}/monthly', exist_ok=True)
 
-            # PDFに保存
-            pdf_path = os.path.abspath(fr'./graph/{self.save_folder_name}/monthly/{self.year}-{self.month:02}.pdf')
-            plt.savefig(pdf_path)
+        # PDFに保存
+        pdf_path = self.pdf_path()
+        with Metrics.span('render.savefig'):
+            fig.savefig(pdf_path)
 
-            # PDFが存在するか確認
-            if not os.path.exists(pdf_path):
-                logging.error("An error occurred", exc_info=True)
-                raise Exception(f'PDFファイルが存在しません: {pdf_path}')
+        # PDFが存在するか確認
+        if not os.path.exists(pdf_path):
+            logging.error("An error occurred", exc_info=True)
+            raise Exception(f'PDFファイルが存在しません: {pdf_path}')
 
-            # PDFを開く
-            os.startfile(pdf_path)
+        Metrics.count('pdf.files')
+        Metrics.count('pdf.bytes', os.path.getsize(pdf_path))
 
-        except PermissionError:
-            raise Exception('ファイルが開かれているため、保存できません。\nPDFを閉じて再試行してください。')
-        except Exception as e:
-            logging.error("An error occurred", exc_info=True)
-            raise Exception(f'ファイルの保存でエラーが発生しました。: {e}')
-        finally:
-            plt.clf()
-            plt.close()
+        return pdf_path
 
     def _plot_sleep_data(self, fig, sleep_data):
         """睡眠データをグラフに表示
@@ -127,7 +287,7 @@ class OutputMonthController:
             'deep': 'blue'
         }
 
-        ax = fig.add_subplot(1, 3, (1, 2))
+        ax = fig.add_subplot(1, self.column_count, (1, 2))
 
         # 凡例を設定
         self._add_sleep_legend(ax)
@@ -146,28 +306,30 @@ class OutputMonthController:
         ax.set(xlabel='Time', ylabel='Date')
         ax.set_title(f'{self.year}年{self.month:02}月の睡眠データ')
 
-        # 睡眠データのプロット
-        for i in range(len(sleep_data)):
-            for j in range(len(sleep_data[i])):
-                date = sleep_data[i]['dateTime'].iloc[j].day
-                start_sec = self._time_to_seconds(sleep_data[i]['dateTime'].iloc[j])
-                width_sec = int(sleep_data[i]['seconds'].iloc[j])
-                color = COLORS_DICT[sleep_data[i]['level'].iloc[j]]
-
-                ax.barh(date, width_sec, left=start_sec, height=1, color=color, linewidth=0.3)
-
-    def _time_to_seconds(self, datetime: dt.datetime) -> int:
-        """与えられた日時を正午(00:00:00)からの秒数に変換し返す
-
-        Args:
-            datetime (dt.datetime): 日時
-
-        Returns:
-            int: 00:00:00 からの秒数
-        """
-        time_seconds = datetime.hour * 3600 + datetime.minute * 60 + datetime.second
-
-        return time_seconds
+        # 睡眠データのプロット(区間ごとに、描画する日・0時からの秒数・継続秒が入っている)
+        # 区間ごとに barh を呼ぶと区間の数だけ Rectangle ができるので、
+        # 睡眠レベルごとに全区間の長方形を1つの PolyCollection にまとめて描画する
+        edgecolor = rcParams['patch.edgecolor'] if rcParams['patch.force_edgecolor'] else 'none'
+
+        for level, level_df in sleep_data.groupby('level', observed=True):
+            days = level_df['date'].dt.day.to_numpy()
+            left = level_df['offset'].to_numpy()
+            right = left + level_df['seconds'].to_numpy()
+
+            # barh(height=1) と同じく、日付を中心に上下0.5の長方形(4頂点)
+            bottom = days - 0.5
+            top = days + 0.5
+            verts = np.stack([
+                np.column_stack([left, bottom]),
+                np.column_stack([left, top]),
+                np.column_stack([right, top]),
+                np.column_stack([right, bottom]),
+            ], axis=1)
+
+            ax.add_collection(
+                PolyCollection(verts, facecolors=COLORS_DICT[level], edgecolors=edgecolor, linewidths=0.3),
+                autolim=False
+            )
 
     def _add_sleep_legend(self, ax):
         """睡眠データ用の凡例を設定
@@ -242,10 +404,37 @@ class OutputMonthController:
         else:
             return 'black' # 平日は黒
         
+    def _plot_step_heatmap(self, fig, step_hourly_df):
+        """時間帯別の歩数(1時間ごと)を日×時間のヒートマップで表示
+           15分ごとの歩数が無い日(期間まとめて取得した日など)は塗らない
+        """
+        ax = fig.add_subplot(1, self.column_count, 3)
+
+        # y軸は睡眠グラフと同じく1日を中心に上下0.5、x軸は0~24時
+        hourly = np.ma.masked_invalid(step_hourly_df.to_numpy())
+        x_edges = np.arange(25)
+        y_edges = np.arange(self.last_day + 1) + 0.5
+
+        mesh = ax.pcolormesh(x_edges, y_edges, hourly, cmap='YlGn', vmin=0, vmax=max(1000, hourly.max()))
+        # カラーバーは軸の下に置く(軸の高さを変えずに、睡眠グラフと日付の位置をそろえる)
+        colorbar = fig.colorbar(mesh, cax=ax.inset_axes([0.05, -0.2, 0.9, 0.025]), orientation='horizontal')
+        colorbar.set_label('歩数/時')
+
+        # x軸目盛りの設定(3時間ごと)
+        ax.set_xlim([0, 24])
+        ax.set(xticks=range(0, 25, 3), xticklabels=[f'{i:02}:00' for i in range(0, 25, 3)])
+        ax.tick_params(axis='x', rotation=90)
+
+        self._setting_yaxis(ax)
+
+        # ラベルの設定
+        ax.set(xlabel='Time', ylabel='Date')
+        ax.set_title(f'{self.year}年{self.month:02}月の時間帯別歩数')
+
     def _plot_step_data(self, fig, step_data_df):
         """歩数データをグラフに表示
         """
-        ax = fig.add_subplot(1, 3, 3)
+        ax = fig.add_subplot(1, self.column_count, self.column_count)
         
         days = step_data_df['Date'].dt.day
         steps = step_data_df['Steps']
@@ -253,7 +442,7 @@ class OutputMonthController:
 
         # x軸の最大値を10000歩orそれ以上は自動に設定
         if len(steps) == 0 or max(steps) < 10000:
-            plt.xlim([0, 10000])
+            ax.set_xlim([0, 10000])
             
         self._setting_yaxis(ax)
 
@@ -0,0 +1,131 @@
+import json
+import sys
+import threading
+import time
+
+class ProgressReporter:
+    """進捗の通知先(画面やコマンドラインに依存しない)
+
+    コントローラーは処理の開始・1件ごとの完了・終了をこのクラスのメソッドで通知する。
+    このクラスは件数を数えて速さと残り時間を計算するだけで、何も表示しない。
+    表示するときは on_start / on_advance / on_finish を上書きする(通知したスレッドで呼ばれる)。
+    """
+
+    def __init__(self):
+        self.task = ''
+        self.total = 0
+        self.done = 0
+        self.started_at = time.monotonic()
+        self.status_source = None
+
+        # 複数のスレッドから通知される(on_* の中から snapshot を呼べるように RLock にする)
+        self._lock = threading.RLock()
+
+    def set_status_source(self, status_source):
+        """進捗と一緒に表示する状態を返す関数を設定する
+
+        Args:
+            status_source: 辞書を返す関数(例: RateLimiter.headroom)。
+                           'requests' があれば1秒あたりのリクエスト数も計算する
+        """
+        self.status_source = status_source
+
+    def start(self, task: str, total: int):
+        """処理の開始
+
+        Args:
+            task (str): 処理の名前(例: 'sync', 'export')
+            total (int): 処理する件数
+        """
+        with self._lock:
+            self.task = task
+            self.total = total
+            self.done = 0
+            self.started_at = time.monotonic()
+            self.on_start()
+
+    def advance(self, count: int = 1):
+        """処理が count 件終わった"""
+        with self._lock:
+            self.done += count
+            self.on_advance()
+
+    def finish(self):
+        """処理の終了"""
+        with self._lock:
+            self.on_finish()
+
+    def snapshot(self) -> dict:
+        """今の進捗を返す
+
+        Returns:
+            dict: task, done, total, elapsed(秒), items_per_second, eta(残り秒。分からなければNone)
+                  と、status_source の値
+        """
+        with self._lock:
+            elapsed = time.monotonic() - self.started_at
+            items_per_second = self.done / elapsed if elapsed > 0 else 0.0
+            eta = (self.total - self.done) / items_per_second if items_per_second > 0 else None
+
+            snapshot = {
+                'task': self.task,
+                'done': self.done,
+                'total': self.total,
+                'elapsed': round(elapsed, 3),
+                'items_per_second': round(items_per_second, 3),
+                'eta': round(eta, 1) if eta is not None else None,
+            }
+
+        if self.status_source is not None:
+            status = self.status_source()
+            snapshot.update(status)
+            if 'requests' in status and elapsed > 0:
+                snapshot['requests_per_second'] = round(status['requests'] / elapsed, 3)
+
+        return snapshot
+
+    def on_start(self):
+        pass
+
+    def on_advance(self):
+        pass
+
+    def on_finish(self):
+        pass
+
+class JsonLinesProgressReporter(ProgressReporter):
+    """進捗を1行1つのJSONで出力する(コマンドラインから使うとき)
+
+    出力例:
+        {"event": "start", "task": "sync", "total": 30}
+        {"event": "progress", "task": "sync", "done": 1, "total": 30, "elapsed": 0.4, "items_per_second": 2.5, "eta": 11.6}
+        {"event": "finish", "task": "sync", "done": 30, "total": 30, "elapsed": 12.3, ...}
+    """
+
+    def __init__(self, stream=None, context=None):
+        """
+        Args:
+            stream: 出力先(Noneなら標準出力)
+            context (dict): すべての行に付ける項目(例: {'client_id': 'ABC123'})
+        """
+        super().__init__()
+        self.stream = stream or sys.stdout
+        self.context = context or {}
+
+    def on_start(self):
+        self._emit({'event': 'start', 'task': self.task, 'total': self.total})
+
+    def on_advance(self):
+        self._emit({'event': 'progress', **self.snapshot()})
+
+    def on_finish(self):
+        self._emit({'event': 'finish', **self.snapshot()})
+
+    def emit(self, event: dict):
+        """進捗以外のイベント(結果やエラー)を出力する"""
+        with self._lock:
+            self._emit(event)
+
+    def _emit(self, event: dict):
+        self.stream.write(json.dumps({**event, **self.context}, ensure_ascii=False) + '\n')
+        self.stream.flush()
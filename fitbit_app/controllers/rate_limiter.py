@@ -0,0 +1,189 @@
+import threading
+import time
+from fitbit.exceptions import HTTPTooManyRequests
+from ..metrics import Metrics
+
+class RateLimiter:
+    """Fitbit APIのレート制限に合わせてリクエストを送るトークンバケット
+
+    トークンの数はレスポンスヘッダーの残りリクエスト数(から、送信中でまだサーバーが数えていない分を引いた数)、
+    補充はリセット時刻に行われる。
+    上限の BURST_RATIO までは続けて送り(数日分の取得はすぐ終わる)、それより残りが少なくなったら、
+    残りのトークンをリセット時刻までに均等な間隔で送る(長い期間の取得で、1時間止まったままにならないようにする)。
+    トークンが尽きたらリセット時刻まで待ち、429が返ってきたら指定秒数だけ全体を止めて再試行する。
+    """
+    LIMIT_HEADER = 'Fitbit-Rate-Limit-Limit'
+    REMAINING_HEADER = 'Fitbit-Rate-Limit-Remaining'
+    RESET_HEADER = 'Fitbit-Rate-Limit-Reset'
+
+    # ヘッダーを受け取るまでの仮の値(Fitbit APIは1時間あたり150リクエスト)
+    DEFAULT_LIMIT = 150
+    WINDOW_SECONDS = 3600
+
+    # 他のアプリ等のために残しておくリクエスト数
+    SAFETY_MARGIN = 2
+
+    # 間隔を空けずに送るリクエストの割合(上限に対する割合。残りがこれ以下になったら間隔を空ける)
+    BURST_RATIO = 0.5
+
+    # 429が返ってきたときの再試行回数
+    MAX_RETRIES = 3
+
+    def __init__(self, clock=time.monotonic, sleep=time.sleep):
+        self._lock = threading.Lock()
+        self._clock = clock
+        self._sleep = sleep
+
+        now = self._clock()
+        self.limit = self.DEFAULT_LIMIT
+        self.remaining = self.DEFAULT_LIMIT
+        self.reset_at = now + self.WINDOW_SECONDS
+        self.paused_until = now
+
+        # 最後にトークンを取り出した時刻(間隔を空けて送るときの基準。まだ取り出していなければNone)
+        self.acquired_at = None
+
+        # 送ったリクエストの数(進捗の表示用)
+        self.request_count = 0
+
+        # トークンを取り出して、まだレスポンスを受け取っていないリクエストの数
+        self.in_flight = 0
+
+    def try_acquire(self) -> float:
+        """トークンを1つ取り出す
+
+        Returns:
+            float: 取り出せたら0、取り出せなければ待つべき秒数
+        """
+        with self._lock:
+            now = self._clock()
+
+            # 429で停止中
+            if now < self.paused_until:
+                return self.paused_until - now
+
+            # リセット時刻を過ぎたらトークンを補充
+            if now >= self.reset_at:
+                self.remaining = self.limit
+                self.reset_at = now + self.WINDOW_SECONDS
+
+            if self.remaining > self.SAFETY_MARGIN:
+                # 残りが少ないときは、残りのトークンをリセット時刻までに均等に割り振る
+                if self.acquired_at is not None and self.remaining <= self.limit * self.BURST_RATIO:
+                    interval = (self.reset_at - self.acquired_at) / (self.remaining - self.SAFETY_MARGIN)
+                    if now < self.acquired_at + interval:
+                        return self.acquired_at + interval - now
+
+                self.remaining -= 1
+                self.request_count += 1
+                self.in_flight += 1
+                self.acquired_at = now
+                return 0
+
+            return self.reset_at - now
+
+    def acquire(self, cancel_token=None):
+        """トークンを取り出せるまで待つ
+
+        Args:
+            cancel_token (CancelToken): 渡すと、待っている間にキャンセルされたら CancelledError を投げる
+        """
+        while True:
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+
+            wait_seconds = self.try_acquire()
+            if wait_seconds <= 0:
+                return
+
+            with Metrics.span('fetch.rate_limit_wait', seconds_planned=round(wait_seconds, 3)):
+                if cancel_token is not None:
+                    cancel_token.wait(wait_seconds)
+                else:
+                    self._sleep(wait_seconds)
+
+    def release(self):
+        """取り出したトークンのリクエストが終わったことを知らせる(成功・失敗にかかわらず1回呼ぶ)"""
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+
+    def headroom(self) -> dict:
+        """レート制限の今の状態を返す(進捗の表示用)
+
+        Returns:
+            dict: {'requests': 送ったリクエスト数, 'remaining': 残りリクエスト数,
+                   'limit': 上限, 'reset_in': リセットまでの秒数}
+        """
+        with self._lock:
+            return {
+                'requests': self.request_count,
+                'remaining': self.remaining,
+                'limit': self.limit,
+                'reset_in': round(max(0.0, self.reset_at - self._clock()), 1),
+            }
+
+    def pause(self, seconds: float):
+        """リクエストを一時停止する(429を受け取ったとき)
+
+        Args:
+            seconds (float): 停止する秒数
+        """
+        with self._lock:
+            now = self._clock()
+            self.paused_until = max(self.paused_until, now + seconds)
+            self.remaining = 0
+            self.reset_at = now + seconds
+
+    def update_from_headers(self, headers):
+        """レスポンスヘッダーからレート制限の状態を更新する
+           同時に送っている他のリクエストはサーバーがまだ数えていないので、その分を残りから引く
+           (release を呼ぶ前、レスポンスを受け取ったリクエストがまだ送信中に数えられている間に呼ぶ)
+
+        Args:
+            headers: レスポンスヘッダー(大文字小文字を区別しない辞書)
+        """
+        try:
+            limit = int(headers[self.LIMIT_HEADER])
+            remaining = int(headers[self.REMAINING_HEADER])
+            reset_seconds = int(headers[self.RESET_HEADER])
+        except (KeyError, ValueError):
+            return
+
+        with self._lock:
+            self.limit = limit
+            self.remaining = max(0, remaining - max(0, self.in_flight - 1))
+            self.reset_at = self._clock() + reset_seconds
+
+    def update_from_response(self, response, *args, **kwargs):
+        """requestsのレスポンスフック。Sessionの hooks['response'] に登録して使う"""
+        self.update_from_headers(response.headers)
+        return response
+
+    def call(self, func, *args, cancel_token=None, **kwargs):
+        """レート制限に合わせて関数(APIリクエスト)を実行する
+           429が返ってきたらリセットまで待って再試行する
+
+        Args:
+            func: Fitbit APIを呼び出す関数
+            cancel_token (CancelToken): 渡すと、キャンセルされたらリクエストを送らずに CancelledError を投げる
+
+        Returns:
+            funcの戻り値
+        """
+        retries = 0
+
+        while True:
+            self.acquire(cancel_token)
+            Metrics.count('http.requests')
+            try:
+                with Metrics.span('fetch.http', endpoint=getattr(func, '__name__', '')):
+                    return func(*args, **kwargs)
+            except HTTPTooManyRequests as e:
+                Metrics.count('http.429')
+                retries += 1
+                if retries > self.MAX_RETRIES:
+                    raise
+                Metrics.count('http.retries')
+                self.pause(getattr(e, 'retry_after_secs', self.WINDOW_SECONDS))
+            finally:
+                self.release()
@@ -1,37 +1,81 @@
 import tkinter as tk
 
 class ViewController:
+    """1つのTkウィンドウの中で画面を切り替える
+
+    画面(Frame)は最初に表示するときに1回だけ作って保存しておき、
+    切り替えるときは tkraise で前面に出す(入力した日付などはそのまま残る)。
+    """
+    # 最初の画面を表示してから重いモジュールを読み込み始めるまでの時間(ミリ秒)
+    WARM_UP_DELAY_MS = 300
+
+    root = None
+    container = None
+
+    # 画面のクラス → 作成済みの画面
+    views = {}
+
     @staticmethod
-    def start_auth_view():
+    def start_auth_view(warm_up=True):
         from ..views.auth_view import AuthView
-        root = tk.Tk()
-        auth_view = AuthView(root)
-        auth_view.mainloop()
+        ViewController.root = tk.Tk()
+
+        # 画面を同じ位置に重ねて置く入れ物
+        ViewController.container = tk.Frame(ViewController.root)
+        ViewController.container.pack(fill=tk.BOTH, expand=True)
+        ViewController.container.grid_rowconfigure(0, weight=1)
+        ViewController.container.grid_columnconfigure(0, weight=1)
+
+        ViewController.show_view(AuthView)
+
+        # 画面を表示したあとに、グラフ出力で使うモジュールをバックグラウンドで読み込んでおく
+        if warm_up:
+            from .warm_up import start_warm_up
+            ViewController.root.after(ViewController.WARM_UP_DELAY_MS, start_warm_up)
+
+        ViewController.root.mainloop()
 
     @staticmethod
-    def switch_to_main_view(root):
+    def show_view(view_class):
+        """画面を前面に出す(まだ作っていなければ作る)
+
+        Args:
+            view_class: 画面のクラス(on_show でウィンドウのタイトルと大きさを設定するFrame)
+
+        Returns:
+            表示した画面
+        """
+        view = ViewController.views.get(view_class)
+        if view is None:
+            view = view_class(ViewController.container)
+            view.grid(row=0, column=0, sticky=tk.NSEW)
+            ViewController.views[view_class] = view
+
+        view.on_show()
+        view.tkraise()
+        return view
+
+    @staticmethod
+    def switch_to_main_view():
         from ..views.main_view import MainView
-        root.destroy()
-        new_root = tk.Tk()
-        main_view = MainView(new_root)
-        main_view.mainloop()
+        ViewController.show_view(MainView)
 
     @staticmethod
-    def switch_to_output_month_view(root):
+    def switch_to_output_month_view():
         from ..views.output_month_view import OutputMonthView
-        root.destroy()
-        new_root = tk.Tk()
-        output_month_view = OutputMonthView(new_root)
-        output_month_view.mainloop()
+        ViewController.show_view(OutputMonthView)
 
     @staticmethod
-    def switch_to_fetch_view(root):
+    def switch_to_fetch_view():
         from ..views.fetch_view import FetchView
-        root.destroy()
-        new_root = tk.Tk()
-        fetch_view = FetchView(new_root)
-        fetch_view.mainloop()
+        ViewController.show_view(FetchView)
 
     @staticmethod
-    def close_view(root):
-        root.destroy()
\ No newline at end of file
+    def close_view():
+        from ..views.event_bus import UiEventBus
+        UiEventBus.of(ViewController.root).stop()
+
+        ViewController.root.destroy()
+        ViewController.root = None
+        ViewController.container = None
+        ViewController.views = {}
@@ -0,0 +1,37 @@
+import importlib
+import logging
+import threading
+
+# グラフ出力で使う重いモジュール(画面の表示には不要なので起動時には読み込まない)
+WARM_UP_MODULES = (
+    'numpy',
+    'pandas',
+    'matplotlib.figure',
+    'matplotlib.collections',
+    'matplotlib.backends.backend_pdf',
+    'seaborn',
+    'jpholiday',
+)
+
+def start_warm_up(modules=WARM_UP_MODULES) -> threading.Thread:
+    """重いモジュールをバックグラウンドのスレッドで読み込んでおく
+       最初に画面を表示したあとに呼ぶと、最初のグラフ出力までの待ち時間が短くなる。
+       読み込みに失敗しても何もしない(実際に使うときにエラーになる)
+
+    Args:
+        modules (tuple): 読み込むモジュール名
+
+    Returns:
+        threading.Thread: 読み込み中のスレッド
+    """
+    def warm_up_task():
+        for module_name in modules:
+            try:
+                importlib.import_module(module_name)
+            except Exception:
+                logging.getLogger(__name__).debug("Warm-up import failed: %s", module_name, exc_info=True)
+
+    # アプリを閉じるときに読み込みの終了を待たない
+    thread = threading.Thread(target=warm_up_task, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,289 @@
+"""処理ごとの時間と件数を記録する(データ取得・変換・描画のどこに時間がかかったか調べるため)
+
+使い方:
+    with Metrics.run('export', year=2024, month=1):   # 1回の処理(終わったら metrics/ にJSON Linesで書き出す)
+        with Metrics.span('render.savefig'):          # 時間を測る区間
+            ...
+        Metrics.count('pdf.bytes', 12345)             # 件数・バイト数など
+
+記録は環境変数 FITBIT_APP_METRICS=1 またはコマンドラインの --metrics で有効にする。
+無効のとき(既定)は span と count は何もしない。
+"""
+import contextlib
+import contextvars
+from datetime import datetime
+import json
+import os
+import threading
+import time
+
+class MetricsRun:
+    """1回の処理(データ取得・グラフ出力など)の記録"""
+
+    def __init__(self, task: str, context: dict):
+        """
+        Args:
+            task (str): 処理の名前(例: 'sync', 'export')
+            context (dict): 記録と一緒に書き出す情報(Client ID、期間など)
+        """
+        self.task = task
+        self.context = context
+        self.started_at = datetime.now()
+        self.started = time.perf_counter()
+        self.spans = []
+        self.counters = {}
+        self.error = None
+
+        # 取得スレッド・書き込みスレッドなど複数のスレッドから記録される
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, seconds: float, attrs: dict):
+        with self._lock:
+            self.spans.append({'name': name, 'seconds': seconds, **attrs})
+
+    def add_count(self, name: str, value):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, records: dict):
+        """別プロセスで記録した区間と件数を加える
+
+        Args:
+            records (dict): MetricsRun.records の値
+        """
+        with self._lock:
+            self.spans.extend(records['spans'])
+            for name, value in records['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def records(self) -> dict:
+        """記録した区間と件数を返す(別プロセスから親プロセスへ渡すとき)"""
+        with self._lock:
+            return {'spans': list(self.spans), 'counters': dict(self.counters)}
+
+    def summary(self) -> dict:
+        """区間の名前ごとの回数・合計秒・最大秒と、件数をまとめる"""
+        with self._lock:
+            spans = {}
+            for span in self.spans:
+                total = spans.setdefault(span['name'], {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+                total['count'] += 1
+                total['seconds'] += span['seconds']
+                total['max_seconds'] = max(total['max_seconds'], span['seconds'])
+
+            for total in spans.values():
+                total['seconds'] = round(total['seconds'], 6)
+
+            return {
+                'event': 'summary',
+                'task': self.task,
+                'seconds': round(time.perf_counter() - self.started, 6),
+                'status': 'error' if self.error else 'ok',
+                'spans': spans,
+                'counters': dict(self.counters),
+            }
+
+    def write(self, path: str):
+        """1行1つのJSONで書き出す(開始・区間ごと・まとめの順)
+
+        Args:
+            path (str): 書き出すファイルのパス
+        """
+        lines = [{'event': 'run', 'task': self.task, 'started_at': self.started_at.isoformat(), **self.context}]
+        with self._lock:
+            lines.extend({'event': 'span', **span} for span in self.spans)
+        lines.append(self.summary())
+
+        with open(path, 'a', encoding='utf-8') as f:
+            for line in lines:
+                f.write(json.dumps(line, ensure_ascii=False, default=str) + '\n')
+
+class Metrics:
+    """区間の時間と件数を記録する(今の処理の MetricsRun へ記録する)
+
+    今の処理はコンテキスト(スレッド)ごとに持つので、データ取得中に画面からグラフ出力したときも別々の記録になる。
+    処理の中で別のスレッドを使うときは、bind で包んだ関数を渡して同じ処理に記録する。
+    処理の途中で別の処理を始めたとき(グラフ出力の中で1か月分の出力を呼ぶときなど)は、外側の処理にまとめて記録する。
+    """
+    # 記録を書き出すフォルダ
+    METRICS_DIR = './metrics'
+
+    enabled = os.environ.get('FITBIT_APP_METRICS') == '1'
+
+    # 今の処理(記録していないときはNone)
+    _current_run = contextvars.ContextVar('metrics_run', default=None)
+
+    # 最後に書き出したファイルのパス
+    last_path = None
+
+    @classmethod
+    @contextlib.contextmanager
+    def run(cls, task: str, **context):
+        """1回の処理を記録し、終わったら METRICS_DIR にJSON Linesで書き出す
+
+        Args:
+            task (str): 処理の名前(例: 'sync', 'export')
+            context: 記録と一緒に書き出す情報(Client ID、期間など)
+        """
+        run = cls._start_run(task, context)
+        if run is None:
+            yield
+            return
+
+        token = cls._current_run.set(run)
+        try:
+            yield
+        except BaseException as e:
+            run.error = e
+            raise
+        finally:
+            cls._current_run.reset(token)
+            cls._write(run)
+
+    @classmethod
+    def init_worker(cls, enabled: bool):
+        """ワーカープロセスの記録を初期化する
+           (fork で作られたプロセスは親プロセスの記録中の処理を引き継いでしまうので、記録していない状態に戻す)
+
+        Args:
+            enabled (bool): 親プロセスで記録が有効か
+        """
+        cls.enabled = enabled
+        cls._current_run.set(None)
+
+    @classmethod
+    @contextlib.contextmanager
+    def capture(cls):
+        """ワーカープロセスで記録する(ファイルには書かず、MetricsRun を返して親プロセスで merge する)"""
+        run = cls._start_run('capture', {})
+        if run is None:
+            yield None
+            return
+
+        token = cls._current_run.set(run)
+        try:
+            yield run
+        finally:
+            cls._current_run.reset(token)
+
+    @classmethod
+    def bind(cls, function):
+        """今の処理に記録するように function を包む(処理の中で別のスレッドに渡す関数に使う)
+
+        Args:
+            function: 別のスレッドで呼ぶ関数
+
+        Returns:
+            呼ぶと、包んだときの処理を今の処理にして function を呼ぶ関数(記録していなければ function のまま)
+        """
+        run = cls._current_run.get()
+        if run is None:
+            return function
+
+        def bound(*args, **kwargs):
+            token = cls._current_run.set(run)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                cls._current_run.reset(token)
+        return bound
+
+    @classmethod
+    @contextlib.contextmanager
+    def span(cls, name: str, **attrs):
+        """with の中の時間を記録する
+
+        Args:
+            name (str): 区間の名前(例: 'fetch.http', 'render.savefig')
+            attrs: 区間と一緒に書き出す情報
+        """
+        run = cls._current_run.get()
+        if run is None:
+            yield
+            return
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            run.add_span(name, round(time.perf_counter() - started, 6), attrs)
+
+    @classmethod
+    def record(cls, name: str, seconds: float, **attrs):
+        """測り終えた時間を記録する(with で囲めないとき)
+
+        Args:
+            name (str): 区間の名前
+            seconds (float): 秒数
+            attrs: 区間と一緒に書き出す情報
+        """
+        run = cls._current_run.get()
+        if run is not None:
+            run.add_span(name, round(seconds, 6), attrs)
+
+    @classmethod
+    def count(cls, name: str, value=1):
+        """件数を加える
+
+        Args:
+            name (str): 件数の名前(例: 'http.requests', 'db.rows_written')
+            value: 加える数
+        """
+        run = cls._current_run.get()
+        if run is not None:
+            run.add_count(name, value)
+
+    @classmethod
+    def merge(cls, records: dict):
+        """ワーカープロセスで記録した区間と件数を今の処理に加える
+
+        Args:
+            records (dict): MetricsRun.records の値(Noneなら何もしない)
+        """
+        run = cls._current_run.get()
+        if run is not None and records:
+            run.merge(records)
+
+    @classmethod
+    @contextlib.contextmanager
+    def profile(cls, name: str):
+        """with の中をcProfileで計測し、METRICS_DIR に .prof で保存する
+           計測するのは with を実行したスレッドだけ(ワーカープロセスの描画は含まない)
+
+        Args:
+            name (str): ファイル名に付ける名前
+
+        Yields:
+            str: 保存するファイルのパス(snakeviz や pstats で開く)
+        """
+        import cProfile
+
+        os.makedirs(cls.METRICS_DIR, exist_ok=True)
+        path = os.path.abspath(os.path.join(cls.METRICS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}_{name}.prof"))
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield path
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+
+    @classmethod
+    def _start_run(cls, task: str, context: dict):
+        """記録を始める(無効のとき・このコンテキストでほかの処理を記録中のときはNone)"""
+        if not cls.enabled or cls._current_run.get() is not None:
+            return None
+        return MetricsRun(task, context)
+
+    @classmethod
+    def _write(cls, run: MetricsRun):
+        # 記録の書き出しに失敗しても、処理そのものは失敗にしない
+        try:
+            os.makedirs(cls.METRICS_DIR, exist_ok=True)
+            name = '_'.join(str(part) for part in (run.task, run.context.get('client_id')) if part)
+            path = os.path.abspath(os.path.join(cls.METRICS_DIR, f"{run.started_at:%Y%m%d-%H%M%S}_{name}.jsonl"))
+            run.write(path)
+            cls.last_path = path
+        except OSError:
+            pass
@@ -1,13 +1,22 @@
 import json
 import os
+import threading
 
 class AuthModel:
+    # トークンの更新は取得スレッドから呼ばれるので、同時に書き換えないようにする
+    _token_lock = threading.Lock()
+
+    # トークンのJSONファイルにClient IDごとに保存する項目
+    # (client_secret も保存しておくと、コマンドラインから複数のClient IDを順に取得できる)
+    TOKEN_KEYS = ('client_secret', 'access_token', 'refresh_token', 'expires_at')
+
     def __init__(self):
         self.credentials_file_dir = f"./database"
         os.makedirs(self.credentials_file_dir, exist_ok=True)
 
         # JSONファイルのパスを指定
-        self.credentials_file = os.path.join(self.credentials_file_dir, f"credentials.json")
+        self.credentials_file = os.path.join(self.credentials_file_dir, "credentials.json")
+        self.tokens_file = os.path.join(self.credentials_file_dir, "tokens.json")
 
     def load_credentials(self) -> dict:
         """JSONファイルからクライアント情報を読み込む
@@ -41,4 +50,73 @@ class AuthModel:
         """JSONファイルを削除する
         """
         if os.path.exists(self.credentials_file):
-            os.remove(self.credentials_file)
\ No newline at end of file
+            os.remove(self.credentials_file)
+
+    def load_token(self, client_id: str) -> dict:
+        """JSONファイルからClient IDのトークンを読み込む
+
+        Args:
+            client_id (str): Client ID
+
+        Returns:
+            dict: トークンの辞書（例: {"client_secret": "...", "access_token": "...", "refresh_token": "...", "expires_at": 1700000000.0}）または空辞書。
+        """
+        with self._token_lock:
+            return self._load_tokens().get(client_id, {})
+
+    def save_token(self, client_id: str, token: dict):
+        """JSONファイルにClient IDのトークンを保存する(他のClient IDのトークンはそのまま)
+
+        Args:
+            client_id (str): Client ID
+            token (dict): access_token, refresh_token, expires_at と、あれば client_secret を含む辞書
+        """
+        with self._token_lock:
+            tokens = self._load_tokens()
+            entry = tokens.get(client_id, {})
+            entry.update({key: token[key] for key in self.TOKEN_KEYS if key in token})
+            tokens[client_id] = entry
+            self._save_tokens(tokens)
+
+    def list_token_client_ids(self) -> list:
+        """トークンを保存してあるClient IDのリストを返す"""
+        with self._token_lock:
+            return list(self._load_tokens())
+
+    def update_token(self, client_id: str, token: dict):
+        """トークンが更新されたとき、保存してあるClient IDのトークンだけを書き換える
+           (保存しない設定のClient IDは保存しない)
+
+        Args:
+            client_id (str): Client ID
+            token (dict): 更新後のトークン
+        """
+        if self.load_token(client_id):
+            self.save_token(client_id, token)
+
+    def delete_token(self, client_id: str):
+        """JSONファイルからClient IDのトークンを削除する
+
+        Args:
+            client_id (str): Client ID
+        """
+        with self._token_lock:
+            tokens = self._load_tokens()
+            if tokens.pop(client_id, None) is not None:
+                self._save_tokens(tokens)
+
+    def _load_tokens(self) -> dict:
+        if os.path.exists(self.tokens_file):
+            with open(self.tokens_file, 'r') as file:
+                try:
+                    return json.load(file)
+                except json.JSONDecodeError:
+                    return {}
+        return {}
+
+    def _save_tokens(self, tokens: dict):
+        # リフレッシュトークンは1回しか使えないので、書き込み途中で壊れないように一時ファイルから置き換える
+        temp_file = f"{self.tokens_file}.tmp"
+        with open(temp_file, 'w') as file:
+            json.dump(tokens, file)
+        os.replace(temp_file, self.tokens_file)
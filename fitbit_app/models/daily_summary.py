@@ -0,0 +1,157 @@
+import sqlite3
+from sqlite3 import Error
+from .sleep_segment import SleepSegment
+
+class DailySummary:
+    """日付ごとの睡眠と歩数の集計を daily_summary テーブルに1日1行で保存する
+
+    データ取得で保存するときに同じトランザクションで更新するので、
+    期間の平均などは sleep_segment テーブルの区間を読まずにこのテーブルだけで求められる。
+    入眠・起床時刻と中途覚醒の回数は、その日の一番長い睡眠記録(主睡眠)のもの。
+    時刻(onset_ts, wake_ts)は sleep_segment.start_ts と同じく、端末の現地時刻をそのままUNIX秒にしたもの。
+    """
+    LEVEL_COLUMNS = tuple(f'{level}_seconds' for level in SleepSegment.LEVELS)
+
+    COLUMNS = (
+        'date',
+        'step_count',
+        'sleep_log_count',
+        'time_in_bed_seconds',  # 睡眠記録の区間の合計
+        'total_sleep_seconds',  # 起きている区間(SleepSegment.WAKE_LEVELS)を除いた合計
+        *LEVEL_COLUMNS,         # 睡眠レベルごとの合計
+        'onset_ts',             # 主睡眠で最初に眠った時刻
+        'wake_ts',              # 主睡眠で最後に起きた時刻
+        'awakenings',           # 主睡眠の入眠から起床までに起きた回数
+    )
+
+    CREATE_TABLE = f'''
+        CREATE TABLE IF NOT EXISTS daily_summary (
+            date TEXT NOT NULL PRIMARY KEY,
+            step_count INT,
+            sleep_log_count INT NOT NULL,
+            time_in_bed_seconds INT NOT NULL,
+            total_sleep_seconds INT NOT NULL,
+            {', '.join(f'{column} INT NOT NULL' for column in LEVEL_COLUMNS)},
+            onset_ts INT,
+            wake_ts INT,
+            awakenings INT NOT NULL
+        )
+    '''
+
+    @classmethod
+    def ensure_table(cls, conn: sqlite3.Connection):
+        """テーブルが無ければ作り、保存済みのデータから集計する(集計済みなら何もしない)
+           sleep_segment テーブルへの移行(SleepSegment.migrate)の後に呼ぶ
+
+        Args:
+            conn (sqlite3.Connection): データベース接続
+        """
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'daily_summary'")
+            if cursor.fetchone():
+                return
+        except Error as e:
+            raise Exception(f"日ごとの集計の確認に失敗しました: {e}")
+        finally:
+            cursor.close()
+
+        cls.rebuild(conn)
+
+    @classmethod
+    def rebuild(cls, conn: sqlite3.Connection) -> int:
+        """保存済みの歩数と睡眠区間から daily_summary テーブルを作り直す
+
+        Args:
+            conn (sqlite3.Connection): データベース接続
+
+        Returns:
+            int: 集計した日数
+        """
+        cursor = conn.cursor()
+        try:
+            cursor.execute(cls.CREATE_TABLE)
+
+            cursor.execute('SELECT date, step_count FROM step_data')
+            step_counts = dict(cursor.fetchall())
+
+            segments = {}
+            cursor.execute('''
+                SELECT date, sleep_log_index, start_ts, level_code, seconds FROM sleep_segment
+                ORDER BY date, sleep_log_index, start_ts
+            ''')
+            for row in cursor:
+                segments.setdefault(row[0], []).append(row)
+
+            rows = [
+                cls.to_row(date, step_counts.get(date), segments.get(date, []))
+                for date in sorted(step_counts.keys() | segments.keys())
+            ]
+
+            cursor.execute('DELETE FROM daily_summary')
+            cls.replace_rows(cursor, rows)
+            conn.commit()
+        except Error as e:
+            conn.rollback()
+            raise Exception(f"日ごとの集計に失敗しました: {e}")
+        finally:
+            cursor.close()
+
+        return len(rows)
+
+    @classmethod
+    def to_row(cls, date: str, step_count, segments: list) -> tuple:
+        """1日分の歩数と睡眠区間を daily_summary テーブルの行にする
+
+        Args:
+            date (str): 日付(YYYY-MM-DD)
+            step_count: 歩数
+            segments (list): その日の睡眠区間(SleepSegment.to_rows の行。睡眠記録・開始時刻の順)
+
+        Returns:
+            tuple: COLUMNS の順の値
+        """
+        level_seconds = [0] * len(SleepSegment.LEVELS)
+        sleep_logs = {}
+        for _, sleep_log_index, start_ts, level_code, seconds in segments:
+            level_seconds[level_code] += seconds
+            sleep_logs.setdefault(sleep_log_index, []).append((start_ts, level_code, seconds))
+
+        time_in_bed = sum(level_seconds)
+        total_sleep = time_in_bed - sum(level_seconds[code] for code in SleepSegment.WAKE_LEVEL_CODES)
+
+        onset_ts, wake_ts, awakenings = None, None, 0
+        if sleep_logs:
+            main_sleep = max(sleep_logs.values(), key=lambda sleep_log: sum(seconds for _, _, seconds in sleep_log))
+            asleep = [segment for segment in main_sleep if segment[1] not in SleepSegment.WAKE_LEVEL_CODES]
+            if asleep:
+                onset_ts = asleep[0][0]
+                wake_ts = asleep[-1][0] + asleep[-1][2]
+
+                # 入眠から起床までの間で、眠っている区間から起きている区間に変わった回数
+                was_awake = False
+                for start_ts, level_code, _ in main_sleep:
+                    if not onset_ts <= start_ts < wake_ts:
+                        continue
+                    is_awake = level_code in SleepSegment.WAKE_LEVEL_CODES
+                    if is_awake and not was_awake:
+                        awakenings += 1
+                    was_awake = is_awake
+
+        return (
+            date, step_count, len(sleep_logs), time_in_bed, total_sleep,
+            *level_seconds, onset_ts, wake_ts, awakenings
+        )
+
+    @classmethod
+    def replace_rows(cls, cursor, rows: list):
+        """日付ごとに集計を入れ替える(コミットは呼び出し側で行う)
+
+        Args:
+            cursor: sqlite3のカーソル
+            rows (list): to_row で作った行のリスト
+        """
+        cursor.executemany(f'''
+            INSERT OR REPLACE INTO daily_summary ({', '.join(cls.COLUMNS)})
+            VALUES ({', '.join('?' * len(cls.COLUMNS))})
+        ''', rows)
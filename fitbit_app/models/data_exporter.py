@@ -0,0 +1,231 @@
+import csv
+import json
+import os
+import numpy as np
+from .sleep_segment import SleepSegment
+from .step_intraday import StepIntraday
+
+class DataExporter:
+    """保存済みのデータを、年/月ごとに分けた Parquet・Arrow IPC・CSV のファイルに書き出す
+
+    ファイルは {出力先}/{テーブル}/year=YYYY/month=MM/part-0.{拡張子}(Hive形式の分け方なので、
+    pyarrow.dataset や pandas.read_parquet でフォルダごと読み込める)。
+    出力先の manifest.json に月ごとのデータのハッシュ(OutputMonthModel.digest_rows)を記録しておき、
+    ハッシュが同じ月は書き直さない。
+    時刻(start)はデータベースと同じく端末の現地時刻(タイムゾーン無し)。
+    Parquet・Arrow IPC で出力するには pyarrow が必要(requirements.txt には含めていない)。
+    """
+    # 出力形式と拡張子
+    FORMATS = {
+        'parquet': 'parquet',
+        'arrow': 'arrow',
+        'csv': 'csv',
+    }
+
+    # テーブルの列
+    TABLES = {
+        'steps': ('date', 'step_count'),
+        'sleep_segments': ('date', 'sleep_log_index', 'start', 'level', 'seconds'),
+        'steps_15min': ('date', 'start', 'steps'),
+    }
+
+    # 列や分け方を変えたら上げる(manifest.json のバージョンが違えば、すべての月を書き直す)
+    EXPORT_VERSION = 1
+
+    MANIFEST_FILE_NAME = 'manifest.json'
+
+    def __init__(self, output_dir: str, export_format: str = 'parquet'):
+        """
+        Args:
+            output_dir (str): 出力先のフォルダ(出力形式ごとに分ける)
+            export_format (str): 'parquet'、'arrow' または 'csv'
+
+        Raises:
+            Exception: 出力形式が違うとき、Parquet・Arrow IPC で pyarrow が無いとき
+        """
+        if export_format not in self.FORMATS:
+            raise Exception(f"出力形式は {', '.join(self.FORMATS)} のどれかを指定してください。")
+
+        self.output_dir = os.path.abspath(output_dir)
+        self.export_format = export_format
+        self.manifest_path = os.path.join(self.output_dir, self.MANIFEST_FILE_NAME)
+        self.pyarrow = None if export_format == 'csv' else self._import_pyarrow()
+        self.month_digests = self._load_manifest()
+
+    def is_unchanged(self, year: int, month: int, month_digest: str) -> bool:
+        """前回書き出したときから、その月のデータが変わっていないか"""
+        return self.month_digests.get(f"{year}-{month:02}") == month_digest
+
+    def write_month(self, year: int, month: int, month_digest: str,
+                    sleep_rows: list, step_rows: list, step_intraday_rows: list) -> dict:
+        """1か月分のデータをテーブルごとのファイルに書き出し、manifest.json にハッシュを記録する
+           (データが無いテーブルは、前回のファイルがあれば消す)
+
+        Args:
+            year (int): 年
+            month (int): 月
+            month_digest (str): その月のデータのハッシュ
+            sleep_rows (list): (date, sleep_log_index, start_ts, level_code, seconds) のリスト
+            step_rows (list): (date, step_count) のリスト
+            step_intraday_rows (list): (date, steps) のリスト(steps は StepIntraday.to_blob で作ったBLOB)
+
+        Returns:
+            dict: テーブルごとの書き出した行数
+        """
+        tables = {
+            'steps': self._step_columns(step_rows),
+            'sleep_segments': self._sleep_columns(sleep_rows),
+            'steps_15min': self._step_intraday_columns(step_intraday_rows),
+        }
+
+        row_counts = {}
+        for table_name, columns in tables.items():
+            path = self.partition_path(table_name, year, month)
+            row_counts[table_name] = len(columns['date'])
+            if row_counts[table_name] == 0:
+                if os.path.exists(path):
+                    os.remove(path)
+                continue
+
+            # 書き込み途中で落ちても壊れたファイルが残らないように、一時ファイルに書いてから置き換える
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.tmp"
+            if self.export_format == 'csv':
+                self._write_csv(temp_path, table_name, columns)
+            else:
+                self._write_arrow(temp_path, table_name, columns)
+            os.replace(temp_path, path)
+
+        self.month_digests[f"{year}-{month:02}"] = month_digest
+        self._save_manifest()
+        return row_counts
+
+    def partition_path(self, table_name: str, year: int, month: int) -> str:
+        """テーブルの1か月分のファイルのパスを返す"""
+        return os.path.join(
+            self.output_dir, table_name, f"year={year}", f"month={month:02}",
+            f"part-0.{self.FORMATS[self.export_format]}"
+        )
+
+    @staticmethod
+    def _step_columns(step_rows: list) -> dict:
+        dates, step_counts = zip(*step_rows) if step_rows else ((), ())
+        return {
+            'date': np.array(dates, dtype='datetime64[D]'),
+            'step_count': list(step_counts),  # 歩数が無い日(None)があるので、numpyの配列にしない
+        }
+
+    @staticmethod
+    def _sleep_columns(sleep_rows: list) -> dict:
+        columns = list(zip(*sleep_rows)) if sleep_rows else [()] * 5
+        dates, sleep_log_indexes, start_ts, level_codes, seconds = columns
+        return {
+            'date': np.array(dates, dtype='datetime64[D]'),
+            'sleep_log_index': np.array(sleep_log_indexes, dtype=np.int16),
+            'start': np.array(start_ts, dtype=np.int64).astype('datetime64[s]'),
+            'level': np.array(level_codes, dtype=np.int8),  # SleepSegment.LEVELS のインデックス
+            'seconds': np.array(seconds, dtype=np.int32),
+        }
+
+    @staticmethod
+    def _step_intraday_columns(step_intraday_rows: list) -> dict:
+        """1日1行のBLOBを、15分ごとに1行にする"""
+        dates, blobs = zip(*step_intraday_rows) if step_intraday_rows else ((), ())
+        dates = np.repeat(np.array(dates, dtype='datetime64[D]'), StepIntraday.SLOTS)
+        slot_starts = np.tile(
+            np.arange(StepIntraday.SLOTS) * StepIntraday.SLOT_MINUTES, len(step_intraday_rows)
+        ).astype('timedelta64[m]')
+        return {
+            'date': dates,
+            'start': (dates + slot_starts).astype('datetime64[s]'),
+            'steps': np.frombuffer(b''.join(blobs), dtype='<u2'),
+        }
+
+    def _write_arrow(self, path: str, table_name: str, columns: dict):
+        pa = self.pyarrow
+        schema = self._arrow_schema(table_name)
+
+        arrays = []
+        for field in schema:
+            if field.name == 'level':
+                # 睡眠レベルは名前の辞書型にする(値は LEVELS のインデックスのまま)
+                arrays.append(pa.DictionaryArray.from_arrays(
+                    pa.array(columns['level'], type=pa.int8()), pa.array(SleepSegment.LEVELS)
+                ))
+            else:
+                arrays.append(pa.array(columns[field.name], type=field.type))
+        table = pa.Table.from_arrays(arrays, schema=schema)
+
+        if self.export_format == 'parquet':
+            import pyarrow.parquet as pq
+            pq.write_table(table, path, compression='zstd')
+        else:
+            with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+                writer.write_table(table)
+
+    def _arrow_schema(self, table_name: str):
+        pa = self.pyarrow
+        types = {
+            'date': pa.date32(),
+            'step_count': pa.int32(),
+            'sleep_log_index': pa.int16(),
+            'start': pa.timestamp('s'),
+            'level': pa.dictionary(pa.int8(), pa.string()),
+            'seconds': pa.int32(),
+            'steps': pa.uint16(),
+        }
+        return pa.schema([(column, types[column]) for column in self.TABLES[table_name]])
+
+    @staticmethod
+    def _write_csv(path: str, table_name: str, columns: dict):
+        values = []
+        for column in DataExporter.TABLES[table_name]:
+            column_values = columns[column]
+            if column == 'level':
+                column_values = np.array(SleepSegment.LEVELS)[column_values]
+            elif column in ('date', 'start'):
+                column_values = np.datetime_as_string(column_values)
+            values.append(column_values)
+
+        with open(path, 'w', encoding='utf-8', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(DataExporter.TABLES[table_name])
+            writer.writerows(zip(*values))
+
+    @staticmethod
+    def _import_pyarrow():
+        try:
+            import pyarrow
+            import pyarrow.ipc
+        except ImportError:
+            raise Exception(
+                "Parquet・Arrow IPC で出力するには pyarrow が必要です。\n"
+                "pip install pyarrow でインストールするか、CSVで出力してください。"
+            )
+        return pyarrow
+
+    def _load_manifest(self) -> dict:
+        """前回書き出した月のハッシュを読み込む(形式かバージョンが違えば、すべての月を書き直すので空にする)"""
+        if not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as file:
+                manifest = json.load(file)
+        except json.JSONDecodeError:
+            return {}
+
+        if manifest.get('version') != self.EXPORT_VERSION or manifest.get('format') != self.export_format:
+            return {}
+        return manifest.get('months', {})
+
+    def _save_manifest(self):
+        # 書き込み途中で落ちても壊れないように、一時ファイルに書いてから置き換える
+        os.makedirs(self.output_dir, exist_ok=True)
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump({
+                'version': self.EXPORT_VERSION,
+                'format': self.export_format,
+                'months': dict(sorted(self.month_digests.items())),
+            }, file, indent=1)
+        os.replace(temp_path, self.manifest_path)
@@ -0,0 +1,102 @@
+import os
+import sqlite3
+import threading
+from .credential import Credential
+
+class Database:
+    """Client ID ごとのデータベース(database/{Client ID}.db)への接続を管理する
+
+    sqlite3の接続は作成したスレッドでしか使えないので、スレッドごとに1つ作って使い回す。
+    WALモードにして、データ取得中(書き込みスレッドが書き込んでいる間)でもグラフ出力の読み込みができるようにする。
+    書き込むのはデータ取得の書き込みスレッド(FetchWriter)だけにする。
+    """
+    DATABASE_DIR = './database'
+
+    # 他の接続が書き込み中のときに待つ時間(秒)
+    BUSY_TIMEOUT = 10.0
+
+    # 接続ごとに設定するPRAGMA
+    PRAGMAS = (
+        ('journal_mode', 'WAL'),    # 読み込みと書き込みを同時にできるようにする(データベースファイルに記録される)
+        ('synchronous', 'NORMAL'),  # WALではコミットごとにfsyncしなくても壊れない(電源断で直前のコミットが失われることはある)
+        ('cache_size', -16000),     # ページキャッシュ(負の値はKiB単位、約16MB)
+        ('temp_store', 'MEMORY'),   # 並べ替えなどの一時データをメモリに置く
+    )
+
+    # スレッドごとの接続({(プロセスID, データベースの絶対パス): 接続})
+    _local = threading.local()
+
+    @classmethod
+    def path(cls, client_id: str = None) -> str:
+        """データベースファイルのパスを返す
+
+        Args:
+            client_id (str): Client ID(省略時は Credential.client_id)
+        """
+        return os.path.join(cls.DATABASE_DIR, f"{client_id or Credential.client_id}.db")
+
+    @classmethod
+    def list_client_ids(cls) -> list:
+        """データベースファイルがあるClient IDのリストを返す(トークンを使わないコマンドで処理するClient ID)"""
+        if not os.path.isdir(cls.DATABASE_DIR):
+            return []
+        return sorted(
+            name[:-len('.db')] for name in os.listdir(cls.DATABASE_DIR)
+            if name.endswith('.db') and os.path.isfile(os.path.join(cls.DATABASE_DIR, name))
+        )
+
+    @classmethod
+    def connect(cls, client_id: str = None) -> sqlite3.Connection:
+        """設定済みの新しい接続を作る(閉じるのは呼び出し側で行う)
+
+        Args:
+            client_id (str): Client ID(省略時は Credential.client_id)
+
+        Raises:
+            sqlite3.Error: 接続できないとき
+        """
+        conn = sqlite3.connect(cls.path(client_id), timeout=cls.BUSY_TIMEOUT)
+        try:
+            for name, value in cls.PRAGMAS:
+                conn.execute(f"PRAGMA {name} = {value}")
+        except sqlite3.Error:
+            conn.close()
+            raise
+        return conn
+
+    @classmethod
+    def connection(cls, client_id: str = None) -> sqlite3.Connection:
+        """このスレッドの接続を返す(無ければ作る)
+           同じスレッドのモデルは同じ接続を使うので、モデルを閉じても接続は閉じない
+
+        Args:
+            client_id (str): Client ID(省略時は Credential.client_id)
+
+        Raises:
+            sqlite3.Error: 接続できないとき
+        """
+        connections = cls._connections()
+        # カレントディレクトリが変わっても別のファイルと取り違えないように絶対パスで区別する
+        # (プロセスをforkしたときは、親プロセスの接続を使わない)
+        key = (os.getpid(), os.path.abspath(cls.path(client_id)))
+
+        conn = connections.get(key)
+        if conn is None:
+            conn = cls.connect(client_id)
+            connections[key] = conn
+        return conn
+
+    @classmethod
+    def close(cls):
+        """このスレッドの接続をすべて閉じる(スレッドを終えるとき、データフォルダを消す前に呼ぶ)"""
+        connections = cls._connections()
+        for (pid, _), conn in list(connections.items()):
+            if pid == os.getpid():
+                conn.close()
+        connections.clear()
+
+    @classmethod
+    def _connections(cls) -> dict:
+        if not hasattr(cls._local, 'connections'):
+            cls._local.connections = {}
+        return cls._local.connections
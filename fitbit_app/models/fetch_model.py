@@ -1,7 +1,11 @@
+from datetime import date as dt_date, datetime
 import os
-import sqlite3
 from sqlite3 import Error
-from ..models.credential import Credential
+from ..metrics import Metrics
+from .daily_summary import DailySummary
+from .database import Database
+from .sleep_segment import SleepSegment
+from .step_intraday import StepIntraday
 
 class FetchModel:
     CREATE_STEP_TABLE = '''
@@ -11,21 +15,28 @@ class FetchModel:
             step_count INT
         )
     '''
-    CREATE_SLEEP_TABLE = '''
-        CREATE TABLE IF NOT EXISTS sleep_data (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date TEXT NOT NULL UNIQUE,
-            sleep_data TEXT
+    # 日付・データ種別ごとの取得状況(is_complete: 取得時点で過去の日付だったか)
+    CREATE_SYNC_STATE_TABLE = '''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            date TEXT NOT NULL,
+            data_type TEXT NOT NULL,
+            fetched_at TEXT NOT NULL,
+            is_complete INT NOT NULL,
+            PRIMARY KEY (date, data_type)
         )
     '''
-    
+
+    DATA_TYPE_STEP = 'step'
+    DATA_TYPE_SLEEP = 'sleep'
+    DATA_TYPES = (DATA_TYPE_STEP, DATA_TYPE_SLEEP)
+
     def __init__(self):
         # ルートディレクトリに database フォルダを作成
-        self.database_dir = f"./database"
+        self.database_dir = Database.DATABASE_DIR
         os.makedirs(self.database_dir, exist_ok=True)
 
         # データベースファイルのパスを指定
-        self.db_name = os.path.join(self.database_dir, f"{Credential.client_id}.db")
+        self.db_name = Database.path()
 
         self.conn = None
         self.cursor = None
@@ -33,7 +44,8 @@ class FetchModel:
 
     def connect(self):
         try:
-            self.conn = sqlite3.connect(self.db_name)
+            # 接続はスレッドごとに使い回す(Database.connection)
+            self.conn = Database.connection()
             self.cursor = self.conn.cursor()
             self._create_tables()
         except Error as e:
@@ -42,39 +54,108 @@ class FetchModel:
     def _create_tables(self):
         try:
             self.cursor.execute(self.CREATE_STEP_TABLE)
-            self.cursor.execute(self.CREATE_SLEEP_TABLE)
+            self.cursor.execute(self.CREATE_SYNC_STATE_TABLE)
+            StepIntraday.create_table(self.cursor)
             self.conn.commit()
         except Error as e:
             raise Exception(f"テーブル作成に失敗しました: {e}")
+
+        # 睡眠データは sleep_segment テーブルに保存する(古い sleep_data テーブルがあれば移行する)
+        SleepSegment.migrate(self.conn)
+
+        # 日ごとの集計が無ければ、保存済みのデータから作る
+        DailySummary.ensure_table(self.conn)
         
     def close(self):
+        # 接続は同じスレッドの他のモデルも使うので閉じない(閉じるときは Database.close)
         if self.cursor:
             self.cursor.close()
-        if self.conn:
-            self.conn.close()
 
-    def insert_step_data(self, date, step_count):
+    def insert_day_records(self, records: list):
+        """1日ごとのデータをまとめて1つのトランザクションで保存する
+
+        Args:
+            records (list): {'date': 日付(YYYY-MM-DD), 'step_count': 歩数, 'sleep_logs': 睡眠記録ごとの詳細のリスト,
+                             'step_intraday': 15分ごとの歩数のリスト(無ければNone、省略可)} のリスト
+        """
+        now = datetime.now()
+        fetched_at = now.isoformat(timespec='seconds')
+        today_str = now.date().isoformat()
+
+        step_rows = [(record['date'], record['step_count']) for record in records]
+        dates = [record['date'] for record in records]
+        segments_by_date = {record['date']: SleepSegment.to_rows(record['date'], record['sleep_logs']) for record in records}
+        sleep_segment_rows = [row for rows in segments_by_date.values() for row in rows]
+        daily_summary_rows = [
+            DailySummary.to_row(record['date'], record['step_count'], segments_by_date[record['date']])
+            for record in records
+        ]
+        step_intraday_rows = StepIntraday.to_rows(records)
+        sync_state_rows = [
+            (record['date'], data_type, fetched_at, int(record['date'] < today_str))
+            for record in records
+            for data_type in self.DATA_TYPES
+        ]
+
         try:
-            self.cursor.execute('''
-                INSERT INTO step_data (date, step_count)
-                VALUES (?, ?)
-                ON CONFLICT(date) DO UPDATE SET
-                    date = excluded.date,
-                    step_count = excluded.step_count
-            ''', (date, step_count))
-            self.conn.commit()
+            with Metrics.span('db.write', days=len(records)):
+                self.cursor.executemany('''
+                    INSERT INTO step_data (date, step_count)
+                    VALUES (?, ?)
+                    ON CONFLICT(date) DO UPDATE SET
+                        date = excluded.date,
+                        step_count = excluded.step_count
+                ''', step_rows)
+                SleepSegment.replace_rows(self.cursor, dates, sleep_segment_rows)
+                StepIntraday.replace_rows(self.cursor, step_intraday_rows)
+                DailySummary.replace_rows(self.cursor, daily_summary_rows)
+                # 取得状況(is_complete: 取得時点で過去の日付だったか)
+                self.cursor.executemany('''
+                    INSERT INTO sync_state (date, data_type, fetched_at, is_complete)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(date, data_type) DO UPDATE SET
+                        fetched_at = excluded.fetched_at,
+                        is_complete = excluded.is_complete
+                ''', sync_state_rows)
+                self.conn.commit()
         except Error as e:
-            raise Exception(f"歩数データの挿入に失敗しました。: {e}")
+            self.conn.rollback()
+            raise Exception(f"データの保存に失敗しました。: {e}")
+
+        Metrics.count('db.days_written', len(records))
+        Metrics.count(
+            'db.rows_written',
+            len(step_rows) + len(sleep_segment_rows) + len(step_intraday_rows) + len(daily_summary_rows) + len(sync_state_rows)
+        )
+
+    def retrieve_complete_dates(self, start_date: dt_date, end_date: dt_date, require_step_intraday=False) -> set:
+        """期間内で、すべてのデータ種別が取得済みかつ完全な日付を返す
 
-    def insert_sleep_data(self, date, sleep_data):
+        Args:
+            start_date (dt_date): 開始日
+            end_date (dt_date): 終了日
+            require_step_intraday (bool): Trueなら15分ごとの歩数が保存されていない日も除く
+                                          (期間まとめて取得した日を、1日ずつ取得し直して埋めるため)
+
+        Returns:
+            set: 日付文字列(YYYY-MM-DD)の集合
+        """
+        step_intraday_condition = 'AND date IN (SELECT date FROM step_intraday)' if require_step_intraday else ''
         try:
-            self.cursor.execute('''
-                INSERT INTO sleep_data (date, sleep_data)
-                VALUES (?, ?)
-                ON CONFLICT(date) DO UPDATE SET
-                    date = excluded.date,
-                    sleep_data = excluded.sleep_data
-            ''', (date, sleep_data))
-            self.conn.commit()
+            self.cursor.execute(f'''
+                SELECT date FROM sync_state
+                WHERE date BETWEEN ? AND ? AND is_complete = 1 {step_intraday_condition}
+                GROUP BY date
+                HAVING COUNT(DISTINCT data_type) = ?
+            ''', (start_date.isoformat(), end_date.isoformat(), len(self.DATA_TYPES)))
+            return {row[0] for row in self.cursor.fetchall()}
         except Error as e:
-            raise Exception(f"歩数データの挿入に失敗しました。: {e}")
\ No newline at end of file
+            raise Exception(f"取得状況の読み込みに失敗しました。: {e}")
+
+    def rebuild_daily_summary(self) -> int:
+        """保存済みのデータから日ごとの集計(daily_summary テーブル)を作り直す
+
+        Returns:
+            int: 集計した日数
+        """
+        return DailySummary.rebuild(self.conn)
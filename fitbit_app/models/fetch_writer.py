@@ -0,0 +1,110 @@
+import queue
+import threading
+import time
+from ..metrics import Metrics
+from .database import Database
+from .fetch_model import FetchModel
+
+class FetchWriter:
+    """取得したデータを1つの書き込みスレッドでまとめて保存する
+
+    取得スレッドは put() でキューに1日分のデータを積むだけにし、
+    書き込みスレッドが BATCH_SIZE 件または FLUSH_INTERVAL 秒ごとに
+    1つのトランザクションでデータベースへ書き込む。
+    """
+    BATCH_SIZE = 200
+    FLUSH_INTERVAL = 1.0 # 秒
+
+    _STOP = object()
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.thread = None
+        self.error = None
+
+    def start(self):
+        """書き込みスレッドを開始する(書き込みの時間と件数は、開始したときの処理の記録にする)"""
+        self.thread = threading.Thread(target=Metrics.bind(self._run), daemon=True)
+        self.thread.start()
+
+    def put(self, date: str, step_count, sleep_logs: list, step_intraday=None):
+        """1日分のデータを書き込みキューに積む
+
+        Args:
+            date (str): 日付(YYYY-MM-DD)
+            step_count: 歩数
+            sleep_logs (list): 睡眠記録ごとの詳細(levels.data)のリスト
+            step_intraday (list): 15分ごとの歩数のリスト(期間まとめて取得したときはNone)
+        """
+        # 書き込みが失敗していたら、これ以上取得しても保存できないので止める
+        if self.error:
+            raise self.error
+
+        self.queue.put({
+            'date': date, 'step_count': step_count, 'sleep_logs': sleep_logs, 'step_intraday': step_intraday
+        })
+
+    def close(self):
+        """キューに残っているデータを書き込んでから書き込みスレッドを終了する
+
+        Raises:
+            Exception: 書き込みエラー
+        """
+        if self.thread:
+            self.queue.put(self._STOP)
+            self.thread.join()
+            self.thread = None
+
+        if self.error:
+            raise self.error
+
+    def _run(self):
+        # sqlite3の接続は作成したスレッドでしか使えないので、書き込みスレッドで接続する
+        # (データベースに書き込むのはこのスレッドだけ)
+        model = None
+        stopped = False
+        try:
+            model = FetchModel()
+
+            while not stopped:
+                records, stopped = self._next_batch()
+                if records:
+                    model.insert_day_records(records)
+        except Exception as e:
+            self.error = e
+            if not stopped:
+                self._discard_remaining()
+        finally:
+            if model:
+                model.close()
+            Database.close()
+
+    def _next_batch(self):
+        """キューから次に書き込む分を取り出す
+
+        Returns:
+            tuple: (1日分のデータのリスト, 終了の合図を受け取ったか)
+        """
+        records = []
+        item = self.queue.get()
+        deadline = time.monotonic() + self.FLUSH_INTERVAL
+
+        while item is not self._STOP:
+            records.append(item)
+            if len(records) >= self.BATCH_SIZE:
+                return records, False
+
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                return records, False
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                return records, False
+
+        return records, True
+
+    def _discard_remaining(self):
+        """書き込みエラー後、close() が待ち続けないように終了の合図まで読み捨てる"""
+        while self.queue.get() is not self._STOP:
+            pass
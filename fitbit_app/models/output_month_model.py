@@ -1,29 +1,45 @@
-import sqlite3
+import calendar
+from datetime import datetime, timedelta
+import hashlib
+import itertools
 from sqlite3 import Error
-from .credential import Credential
+from .database import Database
+from .sleep_segment import SleepSegment
+from .step_intraday import StepIntraday
 
 class OutputMonthModel:
+    # 期間のデータを読み込むときに、1回に取り出す行数
+    FETCH_SIZE = 5000
+
     def __init__(self):
         self.sleep_data = None
         self.step_data = None
+        self.step_intraday_data = None
 
-        self.db_name = fr"./database/{Credential.client_id}.db"
+        self.db_name = Database.path()
         self.conn = None
         self.cursor = None
         self.connect()
 
     def connect(self):
         try:
-            self.conn = sqlite3.connect(self.db_name)
+            # 接続はスレッドごとに使い回す(WALなので、データ取得中でも読み込める)
+            self.conn = Database.connection()
             self.cursor = self.conn.cursor()
+
+            # まだ移行していない古い sleep_data テーブルがあれば移行する
+            SleepSegment.migrate(self.conn)
+
+            # 15分ごとの歩数を保存する前のデータベースでも読み込めるようにする
+            StepIntraday.create_table(self.cursor)
+            self.conn.commit()
         except Error as e:
             raise Exception(f"データベースに接続できませんでした: {e}")
         
     def close(self):
+        # 接続は同じスレッドの他のモデルも使うので閉じない(閉じるときは Database.close)
         if self.cursor:
             self.cursor.close()
-        if self.conn:
-            self.conn.close()
 
     def retrieve_month_data(self, first_day_of_month: str, last_day_of_month: str) -> None:
         """データベースから月毎のデータを取得する
@@ -32,54 +48,179 @@ class OutputMonthModel:
             first_day_of_month (str): 月初の日付
             last_day_of_month (str): 月末の日付
         """
-        self.sleep_data = self._retrieve_month_sleep_data(first_day_of_month, last_day_of_month)
-        self.step_data = self._retrieve_month_step_data(first_day_of_month, last_day_of_month)
+        self.sleep_data = list(self._iter_sleep_data(first_day_of_month, last_day_of_month))
+        self.step_data = list(self._iter_step_data(first_day_of_month, last_day_of_month))
+        self.step_intraday_data = list(self._iter_step_intraday_data(first_day_of_month, last_day_of_month))
 
-    def _retrieve_month_sleep_data(self, first_day_of_month: str, last_day_of_month: str) -> str:
-        """月毎の睡眠データを取得する
+    def iter_month_rows(self, first_day: str, last_day: str, include_steps: bool = True):
+        """期間のデータを月ごとに読み込む
+           FETCH_SIZE 行ずつ取り出して1か月分ずつ返すので、期間が長くてもメモリは1か月分しか使わない
 
         Args:
-            first_day_of_month (str): 月初の日付
-            last_day_of_month (str): 月末の日付
+            first_day (str): 期間の初日
+            last_day (str): 期間の最終日
+            include_steps (bool): Falseなら歩数を読み込まない(睡眠区間だけ使うとき)
 
-        Raises:
-            Exception: 睡眠データの取得エラー
+        Yields:
+            tuple: (年, 月, 睡眠区間のリスト, 歩数のリスト, 15分ごとの歩数のリスト)
+                   (期間の月を順にすべて返す。データが無い月は空のリスト)
+        """
+        sleep_groups = _MonthGroups(self._iter_sleep_data(first_day, last_day))
+        step_groups = _MonthGroups(self._iter_step_data(first_day, last_day) if include_steps else ())
+        step_intraday_groups = _MonthGroups(self._iter_step_intraday_data(first_day, last_day) if include_steps else ())
+
+        year, month = int(first_day[:4]), int(first_day[5:7])
+        while f"{year}-{month:02}" <= last_day[:7]:
+            month_key = f"{year}-{month:02}"
+            yield (
+                year, month,
+                sleep_groups.take(month_key), step_groups.take(month_key), step_intraday_groups.take(month_key)
+            )
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+    def retrieve_date_range(self) -> tuple:
+        """保存されている歩数・睡眠区間の最初と最後の日付を返す
 
         Returns:
-            str: 睡眠データ
+            tuple: (最初の日付, 最後の日付)。データが無ければ (None, None)
+
+        Raises:
+            Exception: 取得エラー
         """
         try:
             self.cursor.execute('''
-                SELECT sleep_data FROM sleep_data
-                WHERE date BETWEEN ? AND ?
-                ORDER BY date
-            ''', (first_day_of_month, last_day_of_month))
-            rows = self.cursor.fetchall()
-            return rows
+                SELECT MIN(first_date), MAX(last_date) FROM (
+                    SELECT MIN(date) AS first_date, MAX(date) AS last_date FROM step_data
+                    UNION ALL
+                    SELECT MIN(date), MAX(date) FROM sleep_segment
+                )
+            ''')
+            return self.cursor.fetchone()
         except Error as e:
-            raise Exception(f"睡眠データの取得でエラーが起きました。: {e}")
-        
-    def _retrieve_month_step_data(self, first_day_of_month: str, last_day_of_month: str) -> str:
-        """月毎の歩数データを取得する
+            raise Exception(f"保存されている期間の取得でエラーが起きました。: {e}")
+
+    def retrieve_month_digest(self, first_day_of_month: str, last_day_of_month: str) -> str:
+        """月毎のデータのハッシュを返す(データが変わったかどうかの判定に使う)
 
         Args:
             first_day_of_month (str): 月初の日付
             last_day_of_month (str): 月末の日付
 
-        Raises:
-            Exception: 歩数の取得エラー
-
         Returns:
-            str: 歩数データ
+            str: 睡眠区間・歩数・15分ごとの歩数の行から計算したハッシュ
         """
+        return self.digest_rows(
+            self._iter_sleep_data(first_day_of_month, last_day_of_month),
+            self._iter_step_data(first_day_of_month, last_day_of_month),
+            self._iter_step_intraday_data(first_day_of_month, last_day_of_month)
+        )
+
+    def iter_month_digests(self, first_day: str, last_day: str):
+        """期間の月ごとのハッシュを返す(月ごとに retrieve_month_digest を呼ぶのと同じ値)
+
+        Args:
+            first_day (str): 期間の初日(月初)
+            last_day (str): 期間の最終日(月末)
+
+        Yields:
+            tuple: (年, 月, ハッシュ)
+        """
+        for year, month, sleep_rows, step_rows, step_intraday_rows in self.iter_month_rows(first_day, last_day):
+            yield year, month, self.digest_rows(sleep_rows, step_rows, step_intraday_rows)
+
+    @staticmethod
+    def digest_rows(sleep_rows, step_rows, step_intraday_rows) -> str:
+        """1か月分の行からハッシュを計算する(iter_month_rows で読み込んだ行からも同じ値になる)"""
+        digest = hashlib.sha256()
+
+        for row in sleep_rows:
+            digest.update(repr(row).encode('utf8'))
+        digest.update(b'|')
+        for row in step_rows:
+            digest.update(repr(row).encode('utf8'))
+        digest.update(b'|')
+        for date, steps in step_intraday_rows:
+            digest.update(date.encode('utf8'))
+            digest.update(steps)
+
+        return digest.hexdigest()
+
+    def _iter_sleep_data(self, first_day: str, last_day: str):
+        """期間の睡眠区間を読み込む
+           日付(起床日)が期間内の睡眠記録の区間を、前日の夜の分も含めて返す
+
+        Args:
+            first_day (str): 期間の初日
+            last_day (str): 期間の最終日
+
+        Yields:
+            tuple: (date, sleep_log_index, start_ts, level_code, seconds)(日付・睡眠記録・開始時刻の順)
+        """
+        # start_ts のインデックスを使うための範囲(初日の前日0時~最終日の翌日0時)
+        first_ts = calendar.timegm((datetime.fromisoformat(first_day) - timedelta(days=1)).timetuple())
+        end_ts = calendar.timegm((datetime.fromisoformat(last_day) + timedelta(days=1)).timetuple())
+
+        return self._iter_rows('''
+            SELECT date, sleep_log_index, start_ts, level_code, seconds FROM sleep_segment
+            WHERE start_ts >= ? AND start_ts < ? AND date BETWEEN ? AND ?
+            ORDER BY date, sleep_log_index, start_ts
+        ''', (first_ts, end_ts, first_day, last_day), "睡眠データ")
+
+    def _iter_step_data(self, first_day: str, last_day: str):
+        """期間の歩数データを読み込む
+
+        Yields:
+            tuple: (date, step_count)(日付順)
+        """
+        return self._iter_rows('''
+            SELECT date, step_count FROM step_data
+            WHERE date BETWEEN ? AND ?
+            ORDER BY date
+        ''', (first_day, last_day), "歩数データ")
+
+    def _iter_step_intraday_data(self, first_day: str, last_day: str):
+        """期間の15分ごとの歩数を読み込む(保存されている日だけ)
+
+        Yields:
+            tuple: (date, steps)(日付順。steps は StepIntraday.to_blob で作ったBLOB)
+        """
+        return self._iter_rows('''
+            SELECT date, steps FROM step_intraday
+            WHERE date BETWEEN ? AND ?
+            ORDER BY date
+        ''', (first_day, last_day), "15分ごとの歩数")
+
+    def _iter_rows(self, query: str, params: tuple, data_name: str):
+        """クエリの結果を FETCH_SIZE 行ずつ取り出して1行ずつ返す(同時に複数のクエリを読めるようにカーソルを分ける)
+
+        Raises:
+            Exception: 取得エラー
+        """
+        cursor = self.conn.cursor()
         try:
-            self.cursor.execute('''
-                SELECT date, step_count FROM step_data
-                WHERE date BETWEEN ? AND ?
-                ORDER BY date
-            ''', (first_day_of_month, last_day_of_month))
-            rows = self.cursor.fetchall()
-            return rows
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(self.FETCH_SIZE)
+                if not rows:
+                    return
+                yield from rows
         except Error as e:
-            raise Exception(f"歩数データの取得でエラーが起きました。: {e}")
+            raise Exception(f"{data_name}の取得でエラーが起きました。: {e}")
+        finally:
+            cursor.close()
+
+class _MonthGroups:
+    """日付順の行を、月(YYYY-MM)ごとに先頭から取り出す"""
+
+    def __init__(self, rows):
+        self.groups = itertools.groupby(rows, key=lambda row: row[0][:7])
+        self.current = next(self.groups, None)
+
+    def take(self, month_key: str) -> list:
+        """その月の行を返す(無ければ空のリスト)。月は古い順に指定する"""
+        if self.current is None or self.current[0] != month_key:
+            return []
 
+        rows = list(self.current[1])
+        self.current = next(self.groups, None)
+        return rows
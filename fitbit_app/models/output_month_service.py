@@ -1,13 +1,16 @@
-import ast
-import datetime as dt
+import calendar
 import pandas as pd
 import numpy as np
+from ..metrics import Metrics
 from .output_month_model import OutputMonthModel
+from .sleep_segment import SleepSegment
+from .step_intraday import StepIntraday
 
 class OutputMonthService:
     def __init__(self):
         self.sleep_data = None
         self.step_data = None
+        self.step_hourly_data = None
 
     def retrieve_month_data(self, first_day_of_month: str, last_day_of_month: str) -> None:
         """データベースから月毎のデータを取得する
@@ -19,163 +22,187 @@ class OutputMonthService:
         # データベースから睡眠と歩数のデータを取得
         try:
             output_month_model = OutputMonthModel()
-            output_month_model.retrieve_month_data(first_day_of_month, last_day_of_month)
+            with Metrics.span('db.read', month=first_day_of_month[:7]):
+                output_month_model.retrieve_month_data(first_day_of_month, last_day_of_month)
             self.sleep_data = output_month_model.sleep_data
             self.step_data = output_month_model.step_data
+            self.step_hourly_data = output_month_model.step_intraday_data
         except Exception as e:
             raise Exception(f"{e}")
         finally:
             output_month_model.close()
 
+        Metrics.count('db.rows_read', len(self.sleep_data) + len(self.step_data) + len(self.step_hourly_data))
+
         # データが無ければエラーにする
         if self.sleep_data == [] and self.step_data == []:
             raise Exception(f"データがありません。")
 
-        # 睡眠データを変換(生データ→データフレーム→24時間スケール)
-        self.sleep_data = self._convert_sleep_list_to_dataframe(self.sleep_data)
-        self.sleep_data = self._convert_sleep_data_df_to_24h_scale(self.sleep_data)
+        self.sleep_data, self.step_data, self.step_hourly_data = self._convert_month_data(
+            self.sleep_data, self.step_data, self.step_hourly_data, first_day_of_month, last_day_of_month
+        )
+
+    def iter_month_data(self, first_day: str, last_day: str):
+        """期間のデータを1か月ずつ読み込んで変換する(期間が長くてもメモリは1か月分しか使わない)
+
+        Args:
+            first_day (str): 期間の初日
+            last_day (str): 期間の最終日
+
+        Yields:
+            tuple: (年, 月, 睡眠データ, 歩数データ, 時間帯別の歩数データ)
+                   (retrieve_month_data と同じ形。データが無い月も空のデータフレームで返す)
+        """
+        output_month_model = OutputMonthModel()
+        try:
+            month_rows = output_month_model.iter_month_rows(first_day, last_day)
+            for year, month, sleep_data, step_data, step_intraday_data in month_rows:
+                Metrics.count('db.rows_read', len(sleep_data) + len(step_data) + len(step_intraday_data))
+
+                # 期間の初日・最終日が月の途中なら、その日までにする
+                month_first_day = max(first_day, f"{year}-{month:02}-01")
+                month_last_day = min(last_day, f"{year}-{month:02}-{calendar.monthrange(year, month)[1]:02}")
+                yield (year, month, *self._convert_month_data(
+                    sleep_data, step_data, step_intraday_data, month_first_day, month_last_day
+                ))
+        finally:
+            output_month_model.close()
+
+    def iter_month_digests(self, first_day: str, last_day: str):
+        """期間の月ごとのデータのハッシュを1回の読み込みで返す(変換はしない)
+
+        Args:
+            first_day (str): 期間の初日(月初)
+            last_day (str): 期間の最終日(月末)
+
+        Yields:
+            tuple: (年, 月, その月のデータベースの行のハッシュ)(retrieve_month_digest と同じ値)
+        """
+        output_month_model = OutputMonthModel()
+        try:
+            yield from output_month_model.iter_month_digests(first_day, last_day)
+        finally:
+            output_month_model.close()
+
+    def _convert_month_data(self, sleep_data: list, step_data: list, step_intraday_data: list,
+                            first_day: str, last_day: str) -> tuple:
+        """データベースから取り出したままのデータを描画用に変換する
+
+        Returns:
+            tuple: (睡眠データ, 歩数データ, 時間帯別の歩数データ)
+        """
+        # 睡眠データを変換(生データ→1つのデータフレーム→24時間スケール)
+        with Metrics.span('transform.sleep_frame'):
+            sleep_df = self._convert_sleep_list_to_dataframe(sleep_data)
+        with Metrics.span('transform.sleep_24h'):
+            sleep_df = self._convert_sleep_data_df_to_24h_scale(sleep_df, first_day, last_day)
 
         # 歩数データを変換(生データ→リスト)
-        self.step_data = self._convert_step_data_to_df(self.step_data)
+        with Metrics.span('transform.steps'):
+            step_df = self._convert_step_data_to_df(step_data)
 
-    def _convert_sleep_list_to_dataframe(self, sleep_data: list) -> list:
-        """睡眠データをデータフレームに変換
-           同時にグラフ化に必要な加工をする
+        # 15分ごとの歩数を変換(BLOB→日×時間の歩数)
+        with Metrics.span('transform.step_hourly'):
+            step_hourly_df = self._convert_step_intraday_to_hourly_df(step_intraday_data, first_day, last_day)
+
+        return sleep_df, step_df, step_hourly_df
+
+    def retrieve_month_digest(self, first_day_of_month: str, last_day_of_month: str) -> str:
+        """月毎のデータのハッシュを返す(変換はしない)
 
         Args:
-            sleep_data (list): データベースから取り出したままの睡眠データのリスト
+            first_day_of_month (str): 月初の日付
+            last_day_of_month (str): 月末の日付
 
         Returns:
-            list: 睡眠データの詳細をデータフレーム化したリスト
+            str: その月のデータベースの行のハッシュ
         """
-        convert_sleep_data = []
-
-        # まずは睡眠データの詳細ひとつひとつをlist型に変換する
-        for i in range(len(sleep_data)): # 1日ごとのデータに分ける
-            for j in range(len(sleep_data[i])): 
-                # タプルから取り出すと文字列が出てくる
-                data_str = sleep_data[i][j]
-                # 文字列をリストに変換
-                data_list = ast.literal_eval(data_str)
-                convert_sleep_data.append(data_list)
-
-        # 詳細データをデータフレームに変換し、必要な加工をする
-        for i in range(len(convert_sleep_data)):
-            for j in range(len(convert_sleep_data[i])):
-                # データフレームに変換
-                convert_sleep_data[i][j] = pd.DataFrame(convert_sleep_data[i][j])
-
-                # 日付の列(dateTime列)を文字列からdatetime型に変換する
-                convert_sleep_data[i][j]['dateTime'] = pd.to_datetime(convert_sleep_data[i][j]['dateTime'], format='%Y-%m-%dT%H:%M:%S.%f')
-
-                # グラフ化に必要なので、最終行のdateTimeにsecondsを足したものを末尾に追加
-                end_time = convert_sleep_data[i][j]['dateTime'].iloc[-1]  # 最終行の時刻
-                level = convert_sleep_data[i][j]['level'].iloc[-1]        # 最終行の睡眠レベル
-                time_delta = convert_sleep_data[i][j]['seconds'].iloc[-1] # 最終行の継続秒
-                time_delta = np.timedelta64(time_delta, 's')
-                new_end_time = end_time + time_delta
-                convert_sleep_data[i][j].loc[len(convert_sleep_data[i][j])] = [new_end_time, level, 0] # 最終行に追加
-
-        return convert_sleep_data
-    
-    def _convert_sleep_data_df_to_24h_scale(self, sleep_data_df: list) -> list:
-        """睡眠データのリストを24hのスケールに変換する。
+        output_month_model = OutputMonthModel()
+        try:
+            return output_month_model.retrieve_month_digest(first_day_of_month, last_day_of_month)
+        finally:
+            output_month_model.close()
+
+    def _convert_sleep_list_to_dataframe(self, sleep_data: list) -> pd.DataFrame:
+        """睡眠区間を1つのデータフレームに変換
+
+        Args:
+            sleep_data (list): データベースから取り出したままの睡眠区間
+                               ((date, sleep_log_index, start_ts, level_code, seconds) のリスト)
+
+        Returns:
+            pd.DataFrame: 睡眠区間のデータフレーム
+                          (start: 開始日時, seconds: 継続秒, level: 睡眠レベル, episode: 睡眠記録の番号)
+        """
+        columns = list(zip(*sleep_data)) if sleep_data else [(), (), (), (), ()]
+        dates, sleep_log_indexes, start_ts, level_codes, seconds = (np.asarray(column) for column in columns)
+
+        # 日付と睡眠記録の番号が変わるところで睡眠記録の番号を振る(行は日付・睡眠記録・開始時刻の順に並んでいる)
+        is_new_episode = np.ones(len(dates), dtype=bool)
+        is_new_episode[1:] = (dates[1:] != dates[:-1]) | (sleep_log_indexes[1:] != sleep_log_indexes[:-1])
+        episode = np.cumsum(is_new_episode) - 1
+
+        return pd.DataFrame({
+            'start': start_ts.astype('datetime64[s]'),
+            'seconds': seconds.astype(np.int32),
+            'level': pd.Categorical.from_codes(level_codes.astype(np.int8), categories=SleepSegment.LEVELS),
+            'episode': episode.astype(np.int16),
+        })
+
+    def _convert_sleep_data_df_to_24h_scale(self, sleep_data_df: pd.DataFrame, first_day: str, last_day: str) -> pd.DataFrame:
+        """睡眠データを24hのスケールに変換する。
            例えば、3日の睡眠が22:00~7:00の場合、3日のデータに22:00~7:00と記録される。
            これはグラフを書くときに都合が悪いので、
-           2日のデータに22:00~23:59を追加し、3日のデータは0:00~7:00というように
-           データを加工する。
+           0時をまたぐ区間を0時で分割し、2日のデータに22:00~24:00、3日のデータに0:00~7:00
+           というように、区間ごとに描画する日と0時からの秒数を割り当てる。
+           期間全体をまとめてNumPyの配列で処理する。
 
         Args:
-            sleep_data (list): 睡眠データをデータフレーム化したリスト
+            sleep_data_df (pd.DataFrame): _convert_sleep_list_to_dataframe で作った睡眠区間
+            first_day (str): 期間の初日
+            last_day (str): 期間の最終日
 
         Returns:
-            list: 24hスケールに直したデータフレームのリスト
+            pd.DataFrame: 24hスケールに直した睡眠データ
+                          (date: 描画する日, offset: 0時からの秒数, seconds: 継続秒, level: 睡眠レベル, episode: 睡眠記録の番号)
         """
-        sleep_24h_df = []
-
-        for i in range(len(sleep_data_df)): # 日付ごと
-            for j in range(len(sleep_data_df[i])): # 睡眠回ごと
-                # 最終行の日付(当日)を取得
-                current_day = sleep_data_df[i][j]['dateTime'].iloc[-1].date()
-
-                # 当日分と前日分のデータを保存する変数を用意、両方ともデータをつめておく
-                current_day_df = sleep_data_df[i][j]
-                previous_day_df = sleep_data_df[i][j]
-
-                for k in range(len(sleep_data_df[i][j])):
-                    sleep_row = sleep_data_df[i][j].loc[k] # 行ごとのデータ
-                    sleep_row_day = sleep_row['dateTime'].date() # その行の日付
-
-                    # 当日部分を current_day_df、前日部分を previous_day_df にするため、
-                    # その行が当日のデータなら previous_day_df から削除
-                    # そうでなければ current_day_df から削除する
-                    if sleep_row_day != current_day:
-                        current_day_df = current_day_df.drop(k)
-                    else:
-                        previous_day_df = previous_day_df.drop(k)
-
-                # previous_day_df が存在したら
-                if not previous_day_df.empty:
-                    # previous_day_df の最終行に23:59:59を追加する
-                    previous_day_last_dateTime = previous_day_df['dateTime'].iloc[-1]
-                    previous_day_last_level = previous_day_df['level'].iloc[-1]
-
-                    # 月初の0時前のデータを追加しないためのif
-                    if previous_day_last_dateTime.month == current_day.month:
-
-                        previous_day_midnight = dt.datetime(
-                            previous_day_last_dateTime.year,
-                            previous_day_last_dateTime.month,
-                            previous_day_last_dateTime.day,
-                            23, 59, 59
-                        )
-                        
-                        time_delta_midnight_seconds = int(
-                            (previous_day_midnight - previous_day_last_dateTime)
-                            .total_seconds()
-                        )
-
-                        previous_day_df.loc[len(previous_day_df) - 1] = [
-                            previous_day_last_dateTime,
-                            previous_day_last_level,
-                            time_delta_midnight_seconds
-                        ]
-                        
-                        previous_day_df.loc[len(previous_day_df)] = [
-                            previous_day_midnight,
-                            previous_day_last_level,
-                            0
-                        ]
-
-                        sleep_24h_df.append(previous_day_df)
-
-                    # current_day_df の先頭行に00:00:00を追加する
-                    current_day_first_datetime = current_day_df['dateTime'].iloc[0]
-
-                    current_day_midnight = dt.datetime(
-                        current_day_first_datetime.year,
-                        current_day_first_datetime.month,
-                        current_day_first_datetime.day,
-                        00, 00, 00
-                    )
-                    
-                    time_delta_midnight_seconds = int(
-                            (current_day_first_datetime - current_day_midnight)
-                            .total_seconds()
-                        )
-                    
-                    new_first_row = pd.DataFrame({
-                        'dateTime': current_day_midnight,
-                        'level': previous_day_last_level,
-                        'seconds': time_delta_midnight_seconds
-                    }, index=[0])
-
-                    # インデックスをふり直したいのでconcatで結合
-                    current_day_df = pd.concat([new_first_row, current_day_df], ignore_index=True)
-
-                sleep_24h_df.append(current_day_df)
-
-        return sleep_24h_df
+        start = sleep_data_df['start'].to_numpy(dtype='datetime64[s]')
+        seconds = sleep_data_df['seconds'].to_numpy()
+        level_codes = sleep_data_df['level'].cat.codes.to_numpy()
+        episode = sleep_data_df['episode'].to_numpy()
+
+        end = start + seconds.astype('timedelta64[s]')
+        next_midnight = (start.astype('datetime64[D]') + 1).astype('datetime64[s]')
+
+        # 0時をまたぐ区間は、0時までの前半と0時からの後半に分ける
+        # (1つの区間が24時間を超えることはない)
+        crosses = end > next_midnight
+        head_seconds = np.where(crosses, (next_midnight - start).astype(np.int32), seconds)
+        tail_seconds = (end[crosses] - next_midnight[crosses]).astype(np.int32)
+
+        piece_start = np.concatenate([start, next_midnight[crosses]])
+        piece_seconds = np.concatenate([head_seconds, tail_seconds])
+        piece_level_codes = np.concatenate([level_codes, level_codes[crosses]])
+        piece_episode = np.concatenate([episode, episode[crosses]])
+
+        piece_day = piece_start.astype('datetime64[D]')
+        piece_offset = (piece_start - piece_day.astype('datetime64[s]')).astype(np.int32)
+
+        # 期間外の日(初日の前日の夜など)と長さ0の区間は描画しない
+        keep = (
+            (piece_day >= np.datetime64(first_day))
+            & (piece_day <= np.datetime64(last_day))
+            & (piece_seconds > 0)
+        )
+        order = np.argsort(piece_start[keep], kind='stable')
+
+        return pd.DataFrame({
+            'date': piece_day[keep][order].astype('datetime64[s]'),
+            'offset': piece_offset[keep][order],
+            'seconds': piece_seconds[keep][order],
+            'level': pd.Categorical.from_codes(piece_level_codes[keep][order], categories=SleepSegment.LEVELS),
+            'episode': piece_episode[keep][order],
+        })
 
     def _convert_step_data_to_df(self, step_data: list) -> pd.DataFrame:
         """歩数のデータをデータフレームに変換
@@ -189,3 +216,27 @@ class OutputMonthService:
         step_df = pd.DataFrame(step_data, columns=['Date', 'Steps'])
         step_df['Date'] = pd.to_datetime(step_df['Date'])
         return step_df
+
+    def _convert_step_intraday_to_hourly_df(self, step_intraday_data: list, first_day: str, last_day: str) -> pd.DataFrame:
+        """15分ごとの歩数を、1日1行・1時間1列の歩数のデータフレームに変換
+           BLOBをまとめて1つの配列にし、4区間ずつ足して1時間ごとにする
+
+        Args:
+            step_intraday_data (list): データベースから取り出したままの (date, steps) のリスト
+            first_day (str): 期間の初日
+            last_day (str): 期間の最終日
+
+        Returns:
+            pd.DataFrame: 期間のすべての日を行(インデックスは日付)、0~23時を列にした歩数
+                          (15分ごとの歩数が無い日はNaN)
+        """
+        days = np.arange(np.datetime64(first_day), np.datetime64(last_day) + 1)
+        hourly = np.full((len(days), 24), np.nan)
+
+        if step_intraday_data:
+            dates, blobs = zip(*step_intraday_data)
+            slots = np.frombuffer(b''.join(blobs), dtype='<u2').reshape(len(blobs), StepIntraday.SLOTS)
+            rows = (np.array(dates, dtype='datetime64[D]') - days[0]).astype(np.int64)
+            hourly[rows] = slots.reshape(len(blobs), 24, -1).sum(axis=2)
+
+        return pd.DataFrame(hourly, index=pd.DatetimeIndex(days.astype('datetime64[ns]'), name='Date'), columns=range(24))
@@ -0,0 +1,163 @@
+import filecmp
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+
+class ReportCache:
+    """月ごとのグラフ(PDF)と描画に使ったデータフレームを保存しておくキャッシュ
+
+    キーはClient ID・年月・その月のデータベースの行のハッシュ・描画設定のバージョンから作るので、
+    その月のデータを取得し直したときだけキーが変わり、描画し直しになる。
+    古いものから(最後に使った日時の順に)、件数と合計サイズの上限を超えないように削除する。
+    """
+    MAX_ENTRIES = 120
+    MAX_BYTES = 200 * 1024 * 1024
+
+    INDEX_FILE_NAME = 'index.json'
+
+    # 同じプロセスの複数スレッドから index.json を同時に書き換えないようにする
+    _lock = threading.Lock()
+
+    def __init__(self, client_id: str):
+        self.cache_dir = os.path.abspath(fr'./graph/{client_id}/cache')
+        self.index_path = os.path.join(self.cache_dir, self.INDEX_FILE_NAME)
+        self.client_id = client_id
+
+    def make_key(self, year: int, month: int, month_digest: str, render_version: int) -> str:
+        """キャッシュのキーを作る
+
+        Args:
+            year (int): 年
+            month (int): 月
+            month_digest (str): その月のデータベースの行のハッシュ
+            render_version (int): 描画設定のバージョン
+
+        Returns:
+            str: キー
+        """
+        key_source = f"{self.client_id}|{year}-{month:02}|{month_digest}|{render_version}"
+        return hashlib.sha256(key_source.encode('utf8')).hexdigest()
+
+    def get(self, key: str):
+        """キャッシュを探す
+
+        Args:
+            key (str): make_key で作ったキー
+
+        Returns:
+            dict: {'pdf_path': PDFのパス, 'frame_path': データフレームのパス}、無ければ None
+        """
+        with self._lock:
+            index = self._load_index()
+            entry = index.get(key)
+            if entry is None:
+                return None
+
+            pdf_path = os.path.join(self.cache_dir, entry['pdf'])
+            frame_path = os.path.join(self.cache_dir, entry['frame'])
+            if not os.path.exists(pdf_path) or not os.path.exists(frame_path):
+                # ファイルが消されていたら、キャッシュから外す
+                self._remove_entry(index, key)
+                self._save_index(index)
+                return None
+
+            entry['last_used'] = time.time()
+            self._save_index(index)
+
+            return {'pdf_path': pdf_path, 'frame_path': frame_path}
+
+    def put(self, key: str, year: int, month: int, pdf_path: str, frames):
+        """描画したPDFとデータフレームをキャッシュに保存する
+           同じ月の古いキャッシュは削除する
+
+        Args:
+            key (str): make_key で作ったキー
+            year (int): 年
+            month (int): 月
+            pdf_path (str): 保存したPDFのパス
+            frames: 描画に使ったデータフレーム(pickleできるもの)
+        """
+        with self._lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+            pdf_name = f"{key}.pdf"
+            frame_name = f"{key}.pkl"
+            shutil.copyfile(pdf_path, os.path.join(self.cache_dir, pdf_name))
+            with open(os.path.join(self.cache_dir, frame_name), 'wb') as file:
+                pickle.dump(frames, file)
+
+            index = self._load_index()
+
+            # データが変わった月の古いキャッシュは使われないので削除する
+            month_str = f"{year}-{month:02}"
+            for old_key in [old_key for old_key, entry in index.items() if entry['month'] == month_str]:
+                self._remove_entry(index, old_key)
+
+            index[key] = {
+                'month': month_str,
+                'pdf': pdf_name,
+                'frame': frame_name,
+                'size': os.path.getsize(os.path.join(self.cache_dir, pdf_name))
+                        + os.path.getsize(os.path.join(self.cache_dir, frame_name)),
+                'last_used': time.time(),
+            }
+
+            self._evict(index)
+            self._save_index(index)
+
+    def load_frames(self, frame_path: str):
+        """キャッシュしたデータフレームを読み込む"""
+        with open(frame_path, 'rb') as file:
+            return pickle.load(file)
+
+    def restore_pdf(self, cached_pdf_path: str, pdf_path: str):
+        """キャッシュしたPDFを出力先にコピーする(同じ内容のファイルがあればコピーしない)
+
+        Args:
+            cached_pdf_path (str): キャッシュしたPDFのパス
+            pdf_path (str): 出力先のパス
+        """
+        if os.path.exists(pdf_path) and filecmp.cmp(cached_pdf_path, pdf_path, shallow=False):
+            return
+
+        os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
+        shutil.copyfile(cached_pdf_path, pdf_path)
+
+    def _evict(self, index: dict):
+        """件数と合計サイズの上限を超えていたら、最後に使った日時が古いものから削除する"""
+        keys_by_last_used = sorted(index, key=lambda key: index[key]['last_used'])
+        total_bytes = sum(entry['size'] for entry in index.values())
+
+        for key in keys_by_last_used:
+            if len(index) <= self.MAX_ENTRIES and total_bytes <= self.MAX_BYTES:
+                break
+            total_bytes -= index[key]['size']
+            self._remove_entry(index, key)
+
+    def _remove_entry(self, index: dict, key: str):
+        entry = index.pop(key)
+        for file_name in (entry['pdf'], entry['frame']):
+            file_path = os.path.join(self.cache_dir, file_name)
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+    def _load_index(self) -> dict:
+        if not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except json.JSONDecodeError:
+            return {}
+
+    def _save_index(self, index: dict):
+        # 書き込み途中で落ちても壊れないように、一時ファイルに書いてから置き換える
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_path = f"{self.index_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(index, file)
+        os.replace(temp_path, self.index_path)
@@ -0,0 +1,254 @@
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+from ..metrics import Metrics
+from .output_month_model import OutputMonthModel
+from .sleep_segment import SleepSegment
+
+class SleepMetricsService:
+    """期間の睡眠区間から、夜ごとの睡眠指標と移動集計を計算する
+
+    夜(行)は起床日ごとで、指標はその日の一番長い睡眠記録(主睡眠)から計算する。
+    区間は1か月ずつ読み込み、月の区間をまとめてNumPyの配列で処理する(夜ごとのループはしない)。
+    """
+    # 移動集計の日数
+    ROLLING_WINDOWS = (7, 28)
+
+    # 移動平均を計算する指標
+    ROLLING_COLUMNS = ('total_sleep_min', 'efficiency', 'latency_min', 'waso_min', 'midpoint_h', 'sri')
+
+    # 夜ごとの指標の列
+    NIGHT_COLUMNS = (
+        'onset',            # 主睡眠で最初に眠った時刻
+        'wake',             # 主睡眠で最後に起きた時刻
+        'time_in_bed_min',  # 主睡眠の記録の長さ(分)
+        'total_sleep_min',  # 主睡眠で眠っていた時間(分)
+        'efficiency',       # 睡眠効率(眠っていた時間 / 記録の長さ)
+        'latency_min',      # 入眠までの時間(記録の開始から最初に眠るまで、分)
+        'waso_min',         # 中途覚醒時間(入眠から最後に起きるまでに起きていた時間、分)
+        'midpoint_h',       # 睡眠の中央時刻(起床日の0時からの時間。前日なら負)
+        'rem_pct',          # 眠っていた時間に占めるレム睡眠の割合(%、クラシックの記録はNaN)
+        'light_pct',        # 浅い睡眠の割合
+        'deep_pct',         # 深い睡眠の割合
+        'classic',          # 主睡眠がクラシックの記録か
+        'nap_min',          # 主睡眠以外(昼寝など)で眠っていた時間(分)
+        'sri',              # 睡眠規則性指数(前日と同じ時刻に同じ状態(睡眠/覚醒)だった割合を-100~100にしたもの)
+    )
+
+    MINUTES_PER_DAY = 24 * 60
+
+    def __init__(self):
+        self.nights = None
+        self.rolling = None
+
+    def retrieve_metrics(self, first_day: str, last_day: str) -> None:
+        """データベースから期間の睡眠区間を読み込み、夜ごとの指標と移動集計を計算する
+
+        Args:
+            first_day (str): 期間の初日(YYYY-MM-DD)
+            last_day (str): 期間の最終日(YYYY-MM-DD)
+        """
+        # 初日の移動集計と規則性のために前の日も、最終日の規則性のために翌日も読み込む
+        load_first = (date.fromisoformat(first_day) - timedelta(days=max(self.ROLLING_WINDOWS))).isoformat()
+        load_last = (date.fromisoformat(last_day) + timedelta(days=1)).isoformat()
+
+        # 夜ごとの指標は月ごとに計算し、規則性は日×分の配列に月ごとに塗ってから最後に計算する
+        # (期間が長くても、区間は1か月分しかメモリに置かない)
+        days = np.arange(np.datetime64(load_first), np.datetime64(load_last) + 1)
+        is_asleep = np.zeros((len(days), self.MINUTES_PER_DAY), dtype=bool)
+        has_sleep_log = np.zeros(len(days), dtype=bool)
+        month_nights = []
+
+        output_month_model = OutputMonthModel()
+        try:
+            for _, _, sleep_data, _, _ in output_month_model.iter_month_rows(load_first, load_last, include_steps=False):
+                Metrics.count('db.rows_read', len(sleep_data))
+                with Metrics.span('analytics.nights'):
+                    month_nights.append(self.compute_nights(sleep_data))
+                with Metrics.span('analytics.regularity'):
+                    self._paint_asleep(is_asleep, has_sleep_log, days, sleep_data)
+        except Exception as e:
+            raise Exception(f"{e}")
+        finally:
+            output_month_model.close()
+
+        # 睡眠記録が無い月の空のデータフレーム(列の型が決まらない)は連結しない
+        month_nights = [frame for frame in month_nights if not frame.empty] or [self.compute_nights([])]
+        index = pd.date_range(load_first, load_last, freq='D', name='date')
+        nights = pd.concat(month_nights).reindex(index)
+        with Metrics.span('analytics.regularity'):
+            nights['sri'] = self._regularity(is_asleep, has_sleep_log)
+        with Metrics.span('analytics.rolling'):
+            rolling = self.compute_rolling(nights)
+
+        self.nights = nights.loc[first_day:last_day]
+        self.rolling = rolling.loc[first_day:last_day]
+
+    @classmethod
+    def compute_nights(cls, sleep_data: list) -> pd.DataFrame:
+        """睡眠区間から夜ごとの指標を計算する
+
+        Args:
+            sleep_data (list): (date, sleep_log_index, start_ts, level_code, seconds) のリスト
+                               (日付・睡眠記録・開始時刻の順)
+
+        Returns:
+            pd.DataFrame: 起床日をインデックスにした NIGHT_COLUMNS(sri を除く)のデータフレーム
+                          (睡眠記録がある日だけ)
+        """
+        columns = list(zip(*sleep_data)) if sleep_data else [(), (), (), (), ()]
+        dates, sleep_log_indexes, start_ts, level_codes, seconds = (np.asarray(column) for column in columns)
+        dates = dates.astype('datetime64[D]')
+        start_ts = start_ts.astype(np.int64)
+        seconds = seconds.astype(np.int64)
+        level_codes = level_codes.astype(np.int64)
+        end_ts = start_ts + seconds
+
+        # 睡眠記録ごとに番号を振る(行は日付・睡眠記録・開始時刻の順に並んでいる)
+        is_new_log = np.ones(len(dates), dtype=bool)
+        is_new_log[1:] = (dates[1:] != dates[:-1]) | (sleep_log_indexes[1:] != sleep_log_indexes[:-1])
+        log_first_rows = np.flatnonzero(is_new_log)
+        log_ids = np.cumsum(is_new_log) - 1
+        log_count = len(log_first_rows)
+
+        if log_count == 0:
+            return pd.DataFrame(
+                columns=[column for column in cls.NIGHT_COLUMNS if column != 'sri'],
+                index=pd.DatetimeIndex([], name='date')
+            )
+
+        asleep = ~np.isin(level_codes, SleepSegment.WAKE_LEVEL_CODES)
+        level_count = len(SleepSegment.LEVELS)
+
+        # 睡眠記録ごとの集計
+        time_in_bed = np.bincount(log_ids, weights=seconds, minlength=log_count)
+        total_sleep = np.bincount(log_ids, weights=seconds * asleep, minlength=log_count)
+        level_seconds = np.bincount(
+            log_ids * level_count + level_codes, weights=seconds, minlength=log_count * level_count
+        ).reshape(log_count, level_count)
+        log_start = np.minimum.reduceat(start_ts, log_first_rows)
+        onset = np.minimum.reduceat(np.where(asleep, start_ts, np.iinfo(np.int64).max), log_first_rows)
+        final_wake = np.maximum.reduceat(np.where(asleep, end_ts, np.iinfo(np.int64).min), log_first_rows)
+        is_classic = np.bincount(
+            log_ids, weights=np.isin(level_codes, SleepSegment.CLASSIC_LEVEL_CODES), minlength=log_count
+        ) > 0
+
+        # 入眠から最後に起きるまでの間の、起きていた区間
+        is_waso = ~asleep & (start_ts >= onset[log_ids]) & (start_ts < final_wake[log_ids])
+        waso = np.bincount(log_ids, weights=seconds * is_waso, minlength=log_count)
+
+        # 日付ごとに、記録の長さが一番長い睡眠記録を主睡眠にする
+        log_dates = dates[log_first_rows]
+        order = np.lexsort((-time_in_bed, log_dates.astype(np.int64)))
+        is_first_of_date = np.ones(log_count, dtype=bool)
+        is_first_of_date[1:] = log_dates[order][1:] != log_dates[order][:-1]
+        main = order[is_first_of_date]
+        date_total_sleep = np.add.reduceat(total_sleep[order], np.flatnonzero(is_first_of_date))
+
+        # 主睡眠の指標(眠っていた区間が無い記録は時刻の指標をNaNにする)
+        has_sleep = total_sleep[main] > 0
+        main_onset = np.where(has_sleep, onset[main], np.nan)
+        main_wake = np.where(has_sleep, final_wake[main], np.nan)
+        midnight = log_dates[main].astype('datetime64[s]').astype(np.int64)
+
+        main_sleep = total_sleep[main]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            stage_pct = {
+                level: np.where(
+                    is_classic[main], np.nan,
+                    level_seconds[main, SleepSegment.LEVEL_CODES[level]] / main_sleep * 100
+                )
+                for level in ('rem', 'light', 'deep')
+            }
+
+        return pd.DataFrame({
+            'onset': pd.to_datetime(main_onset, unit='s'),
+            'wake': pd.to_datetime(main_wake, unit='s'),
+            'time_in_bed_min': time_in_bed[main] / 60,
+            'total_sleep_min': main_sleep / 60,
+            'efficiency': main_sleep / time_in_bed[main],
+            'latency_min': (main_onset - log_start[main]) / 60,
+            'waso_min': np.where(has_sleep, waso[main] / 60, np.nan),
+            'midpoint_h': ((main_onset + main_wake) / 2 - midnight) / 3600,
+            'rem_pct': stage_pct['rem'],
+            'light_pct': stage_pct['light'],
+            'deep_pct': stage_pct['deep'],
+            'classic': is_classic[main],
+            'nap_min': (date_total_sleep - main_sleep) / 60,
+        }, index=pd.DatetimeIndex(log_dates[main], name='date'))
+
+    @classmethod
+    def _paint_asleep(cls, is_asleep: np.ndarray, has_sleep_log: np.ndarray, days: np.ndarray, sleep_data: list):
+        """眠っている区間を日×分の配列に塗り、睡眠記録がある日に印を付ける(期間外の分は無視する)
+
+        Args:
+            is_asleep (np.ndarray): 日×分の配列(days の初日0時から)
+            has_sleep_log (np.ndarray): 日ごとの、睡眠記録があるか
+            days (np.ndarray): 期間の日付(datetime64[D])
+            sleep_data (list): (date, sleep_log_index, start_ts, level_code, seconds) のリスト
+        """
+        if not sleep_data:
+            return
+
+        dates, _, start_ts, level_codes, seconds = (np.asarray(column) for column in zip(*sleep_data))
+        start_ts = start_ts.astype(np.int64)
+        asleep = ~np.isin(level_codes.astype(np.int64), SleepSegment.WAKE_LEVEL_CODES)
+
+        # 眠っている区間を、期間の初日0時からの分の範囲 [start, end) にして塗る
+        # (配列全体ではなく、この区間が含まれる範囲 [low, high) だけを処理する)
+        epoch_count = is_asleep.size
+        origin = days[0].astype('datetime64[s]').astype(np.int64)
+        start_minute = np.clip((start_ts[asleep] - origin) // 60, 0, epoch_count)
+        end_minute = np.clip((start_ts[asleep] + seconds[asleep].astype(np.int64) - origin) // 60, 0, epoch_count)
+        if len(start_minute):
+            low, high = start_minute.min(), end_minute.max()
+            edges = (
+                np.bincount(start_minute - low, minlength=high - low + 1)
+                - np.bincount(end_minute - low, minlength=high - low + 1)
+            )
+            is_asleep.reshape(-1)[low:high] |= np.cumsum(edges)[:high - low] > 0
+
+        day_indexes = (np.unique(dates.astype('datetime64[D]')) - days[0]).astype(np.int64)
+        has_sleep_log[day_indexes[(day_indexes >= 0) & (day_indexes < len(days))]] = True
+
+    @staticmethod
+    def _regularity(is_asleep: np.ndarray, has_sleep_log: np.ndarray) -> np.ndarray:
+        """日×分の配列から、日ごとの睡眠規則性指数(Sleep Regularity Index)を計算する
+           前日の同じ時刻と状態(睡眠/覚醒)が同じだった割合を 200 * 割合 - 100 にする(毎日同じ時刻に寝起きすると100)。
+           0時~24時の状態は、その日に起きた睡眠記録と翌日に起きた睡眠記録(夜の分)で決まるので、
+           当日・前日・翌日のどれかに睡眠記録が無い日はNaNにする。
+
+        Args:
+            is_asleep (np.ndarray): _paint_asleep で塗った日×分の配列
+            has_sleep_log (np.ndarray): 日ごとの、睡眠記録があるか
+
+        Returns:
+            np.ndarray: 日ごとの睡眠規則性指数
+        """
+        # 0時~24時の状態がそろっている日(当日と翌日に睡眠記録がある)
+        is_complete = np.zeros(len(has_sleep_log), dtype=bool)
+        is_complete[:-1] = has_sleep_log[:-1] & has_sleep_log[1:]
+
+        sri = np.full(len(has_sleep_log), np.nan)
+        same_state = (is_asleep[1:] == is_asleep[:-1]).mean(axis=1)
+        sri[1:] = np.where(is_complete[1:] & is_complete[:-1], 200 * same_state - 100, np.nan)
+        return sri
+
+    @classmethod
+    def compute_rolling(cls, nights: pd.DataFrame) -> pd.DataFrame:
+        """夜ごとの指標の移動集計(ROLLING_WINDOWS 日ごとの平均と、睡眠の中央時刻のばらつき)
+
+        Args:
+            nights (pd.DataFrame): すべての日を行にした夜ごとの指標(睡眠記録が無い日はNaN)
+
+        Returns:
+            pd.DataFrame: {指標}_{日数}d(平均)と midpoint_h_std_{日数}d(標準偏差)の列
+                          (その日までの日数のうち半分以上にデータがあるときだけ計算する)
+        """
+        frames = []
+        for window in cls.ROLLING_WINDOWS:
+            rolling = nights[list(cls.ROLLING_COLUMNS)].astype(float).rolling(window, min_periods=(window + 1) // 2)
+            means = rolling.mean().add_suffix(f'_{window}d')
+            means[f'midpoint_h_std_{window}d'] = rolling['midpoint_h'].std()
+            frames.append(means)
+        return pd.concat(frames, axis=1)
@@ -0,0 +1,155 @@
+import ast
+import calendar
+from datetime import datetime
+import sqlite3
+from sqlite3 import Error
+
+class SleepSegment:
+    """睡眠データを睡眠段階ごとの行として sleep_segment テーブルに保存する
+
+    1行は睡眠記録(sleep_log_index)の中の1区間で、
+    開始時刻(start_ts)は端末の現地時刻をそのままUNIX秒にしたもの。
+    """
+    CREATE_TABLE = '''
+        CREATE TABLE IF NOT EXISTS sleep_segment (
+            date TEXT NOT NULL,
+            sleep_log_index INT NOT NULL,
+            start_ts INT NOT NULL,
+            level_code INT NOT NULL,
+            seconds INT NOT NULL
+        )
+    '''
+    CREATE_INDEXES = (
+        'CREATE INDEX IF NOT EXISTS idx_sleep_segment_start_ts ON sleep_segment (start_ts)',
+        'CREATE INDEX IF NOT EXISTS idx_sleep_segment_date ON sleep_segment (date)',
+    )
+
+    # 睡眠レベル(level_code はこのタプルのインデックス)
+    # wake/rem/light/deep はステージ、awake/restless/asleep はクラシックの記録
+    LEVELS = ('wake', 'rem', 'light', 'deep', 'awake', 'restless', 'asleep')
+    LEVEL_CODES = {level: code for code, level in enumerate(LEVELS)}
+
+    # 起きている区間の睡眠レベル(Fitbitの minutesAsleep と同じく、クラシックの restless も睡眠に含めない)
+    WAKE_LEVELS = ('wake', 'awake', 'restless')
+    WAKE_LEVEL_CODES = tuple(map(LEVELS.index, WAKE_LEVELS))
+
+    # クラシックの記録の睡眠レベル(この区間がある睡眠記録はステージを判定できなかった)
+    CLASSIC_LEVELS = ('awake', 'restless', 'asleep')
+    CLASSIC_LEVEL_CODES = tuple(map(LEVELS.index, CLASSIC_LEVELS))
+
+    DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+    # PRAGMA user_version に記録するスキーマのバージョン
+    # 1: sleep_data テーブルの文字列を sleep_segment テーブルへ移行済み
+    # 2: 移行した sleep_data テーブルを削除済み
+    SCHEMA_VERSION = 2
+
+    @classmethod
+    def to_rows(cls, date: str, sleep_logs: list) -> list:
+        """1日分の睡眠記録を sleep_segment テーブルの行に変換する
+
+        Args:
+            date (str): 日付(YYYY-MM-DD)
+            sleep_logs (list): 睡眠記録ごとの詳細(levels.data)のリスト
+
+        Returns:
+            list: (date, sleep_log_index, start_ts, level_code, seconds) のリスト
+        """
+        return [
+            (
+                date,
+                sleep_log_index,
+                cls.to_timestamp(segment['dateTime']),
+                cls.LEVEL_CODES[segment['level']],
+                int(segment['seconds'])
+            )
+            for sleep_log_index, sleep_log in enumerate(sleep_logs)
+            for segment in sleep_log
+        ]
+
+    @classmethod
+    def to_timestamp(cls, date_time: str) -> int:
+        """Fitbitの日時文字列(タイムゾーン無し)をUNIX秒に変換する
+
+        Args:
+            date_time (str): 日時(例: 2024-01-01T23:30:00.000)
+
+        Returns:
+            int: UNIX秒(現地時刻をUTCとみなした値)
+        """
+        return calendar.timegm(datetime.strptime(date_time, cls.DATETIME_FORMAT).timetuple())
+
+    @classmethod
+    def replace_rows(cls, cursor, dates: list, rows: list):
+        """日付ごとに睡眠区間を入れ替える(コミットは呼び出し側で行う)
+
+        Args:
+            cursor: sqlite3のカーソル
+            dates (list): 入れ替える日付のリスト
+            rows (list): to_rows で作った行のリスト
+        """
+        cursor.executemany('DELETE FROM sleep_segment WHERE date = ?', [(date,) for date in dates])
+        cursor.executemany('''
+            INSERT INTO sleep_segment (date, sleep_log_index, start_ts, level_code, seconds)
+            VALUES (?, ?, ?, ?, ?)
+        ''', rows)
+
+    @classmethod
+    def migrate(cls, conn: sqlite3.Connection):
+        """sleep_segment テーブルを作り、古い sleep_data テーブルの文字列を移行してから sleep_data テーブルを削除する
+           (sleep_data テーブルにはもう書き込まないので、残すと古いデータでファイルが大きいままになる)
+           移行済みなら何もしない
+
+        Args:
+            conn (sqlite3.Connection): データベース接続
+        """
+        cursor = conn.cursor()
+        try:
+            cursor.execute('PRAGMA user_version')
+            user_version = cursor.fetchone()[0]
+            if user_version >= cls.SCHEMA_VERSION:
+                return
+
+            # 移行・sleep_data テーブルの削除・バージョンの記録を1つのトランザクションで行う
+            # (sqlite3 はテーブルの作成・削除の前にはトランザクションを始めないので、明示的に始める)
+            if not conn.in_transaction:
+                cursor.execute('BEGIN')
+
+            cursor.execute(cls.CREATE_TABLE)
+            for create_index in cls.CREATE_INDEXES:
+                cursor.execute(create_index)
+
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'sleep_data'")
+            has_legacy_table = cursor.fetchone() is not None
+
+            # バージョン1のデータベースは移行済みなので、sleep_data テーブルを削除するだけにする
+            if has_legacy_table and user_version < 1:
+                cursor.execute('SELECT date, sleep_data FROM sleep_data ORDER BY date')
+                legacy_rows = cursor.fetchall()
+
+                dates = [date for date, _ in legacy_rows]
+                rows = []
+                for date, sleep_data in legacy_rows:
+                    rows.extend(cls.to_rows(date, ast.literal_eval(sleep_data) if sleep_data else []))
+
+                cls.replace_rows(cursor, dates, rows)
+
+            if has_legacy_table:
+                cursor.execute('DROP TABLE sleep_data')
+
+            # PRAGMA はプレースホルダーを使えない
+            cursor.execute(f'PRAGMA user_version = {cls.SCHEMA_VERSION}')
+            conn.commit()
+        except (Error, ValueError, SyntaxError, KeyError) as e:
+            conn.rollback()
+            raise Exception(f"睡眠データの移行に失敗しました: {e}")
+        finally:
+            cursor.close()
+
+        # 削除した sleep_data テーブルの分だけファイルを小さくする
+        # (他の接続が使用中などで失敗しても、空いたページは次の書き込みで再利用されるので無視する)
+        if has_legacy_table:
+            try:
+                conn.execute('VACUUM')
+            except Error:
+                pass
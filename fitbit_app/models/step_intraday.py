@@ -0,0 +1,82 @@
+import struct
+
+class StepIntraday:
+    """15分ごとの歩数を、1日1行(96個の整数を詰めたBLOB)として step_intraday テーブルに保存する
+
+    1日ずつ取得するときの intraday_time_series の応答に入っている値を保存する
+    (期間まとめて取得するときは1日の合計しか取得しないので保存しない)。
+    """
+    CREATE_TABLE = '''
+        CREATE TABLE IF NOT EXISTS step_intraday (
+            date TEXT NOT NULL PRIMARY KEY,
+            steps BLOB NOT NULL
+        )
+    '''
+
+    SLOT_MINUTES = 15
+    SLOTS = 24 * 60 // SLOT_MINUTES
+
+    # 1区間の歩数は符号なし16ビット(リトルエンディアン)で詰める(15分で65535歩を超えることはない)
+    BLOB_FORMAT = f'<{SLOTS}H'
+    MAX_STEPS = 0xFFFF
+
+    @classmethod
+    def create_table(cls, cursor):
+        """テーブルが無ければ作る(コミットは呼び出し側で行う)"""
+        cursor.execute(cls.CREATE_TABLE)
+
+    @classmethod
+    def from_response(cls, step_data: dict):
+        """intraday_time_series の応答から15分ごとの歩数を取り出す
+
+        Args:
+            step_data (dict): APIの応答('activities-steps-intraday' の dataset)
+
+        Returns:
+            list: SLOTS 個の歩数(0時から順)。応答に15分ごとの値が無ければNone
+        """
+        intraday = step_data.get('activities-steps-intraday')
+        if not intraday or intraday.get('datasetInterval', cls.SLOT_MINUTES) != cls.SLOT_MINUTES:
+            return None
+
+        slots = [0] * cls.SLOTS
+        for point in intraday.get('dataset', []):
+            hour, minute, _ = point['time'].split(':')
+            slots[(int(hour) * 60 + int(minute)) // cls.SLOT_MINUTES] = int(point['value'])
+        return slots
+
+    @classmethod
+    def to_blob(cls, slots: list) -> bytes:
+        """SLOTS 個の歩数をBLOBにする"""
+        return struct.pack(cls.BLOB_FORMAT, *(min(max(int(steps), 0), cls.MAX_STEPS) for steps in slots))
+
+    @classmethod
+    def to_rows(cls, records: list) -> list:
+        """1日ごとのデータから step_intraday テーブルの行を作る(15分ごとの歩数が無い日は除く)
+
+        Args:
+            records (list): {'date': 日付, 'step_intraday': SLOTS 個の歩数またはNone, ...} のリスト
+
+        Returns:
+            list: (date, steps) のリスト
+        """
+        return [
+            (record['date'], cls.to_blob(record['step_intraday']))
+            for record in records
+            if record.get('step_intraday') is not None
+        ]
+
+    @classmethod
+    def replace_rows(cls, cursor, rows: list):
+        """日付ごとに15分ごとの歩数を入れ替える(コミットは呼び出し側で行う)
+
+        Args:
+            cursor: sqlite3のカーソル
+            rows (list): to_rows で作った行のリスト
+        """
+        cursor.executemany('''
+            INSERT INTO step_intraday (date, steps)
+            VALUES (?, ?)
+            ON CONFLICT(date) DO UPDATE SET
+                steps = excluded.steps
+        ''', rows)
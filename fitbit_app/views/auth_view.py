@@ -1,24 +1,20 @@
-import threading
 import tkinter as tk
 from tkinter import messagebox
 import re
-from ..controllers.auth_controller import OAuth2Controller
 from ..controllers.view_controller import ViewController
 from ..models.credential import Credential
 from ..models.auth_model import AuthModel
+from .event_bus import UiEventBus
 
 class AuthView(tk.Frame):
     def __init__(self, master):
         super().__init__(master)
-        self.pack()
-
         self.master = master
-        self.master.title("認証フォーム")
 
         self.auth_model = AuthModel()
 
-        # ウィンドウの設定
-        self._set_window_geometry()
+        # 認証サーバーのスレッドからの通知をメインスレッドで処理する
+        self.event_bus = UiEventBus.of(self)
 
         # 入力制限用のvalidatecommandを設定
         self._set_validation_commands()
@@ -29,45 +25,49 @@ class AuthView(tk.Frame):
         # JSONファイルを読み込み
         self._load_credentials()
 
-    def _set_window_geometry(self):
+    def on_show(self):
+        """画面を表示するときに、ウィンドウのタイトルと大きさを設定する"""
+        window = self.winfo_toplevel()
+        window.title("認証フォーム")
+
         # ウィンドウの大きさを指定
         window_width = 350
         window_height = 250
 
         #ウィンドウを画面中央に配置
-        screen_width = self.master.winfo_screenwidth()
-        screen_height = self.master.winfo_screenheight()
+        screen_width = window.winfo_screenwidth()
+        screen_height = window.winfo_screenheight()
         pos_x = (screen_width // 2) - (window_width // 2)
         pos_y = (screen_height // 2) - (window_height // 2)
-        self.master.geometry(f"{window_width}x{window_height}+{pos_x}+{pos_y}")
+        window.geometry(f"{window_width}x{window_height}+{pos_x}+{pos_y}")
 
     def _set_validation_commands(self):
         # 入力制限用のvalidatecommandを設定
-        self.validate_id = self.master.register(self._validate_client_id)
-        self.validate_secret = self.master.register(self._validate_client_secret)
+        self.validate_id = self.register(self._validate_client_id)
+        self.validate_secret = self.register(self._validate_client_secret)
 
     def _create_widgets(self):
         # Client ID 入力欄
-        self.client_id_label = tk.Label(self.master, text="Client ID :")
+        self.client_id_label = tk.Label(self, text="Client ID :")
         self.client_id_label.pack(pady=(10, 0))
-        self.client_id_entry = tk.Entry(self.master, width=35, validate='key', validatecommand=(self.validate_id, '%P'))
+        self.client_id_entry = tk.Entry(self, width=35, validate='key', validatecommand=(self.validate_id, '%P'))
         self.client_id_entry.pack(pady=5)
 
         # Client Secret 入力欄
-        self.client_secret_label = tk.Label(self.master, text="Client Secret :")
+        self.client_secret_label = tk.Label(self, text="Client Secret :")
         self.client_secret_label.pack(pady=(10, 0))
-        self.client_secret_entry = tk.Entry(self.master, width=35, show="*", validate='key', validatecommand=(self.validate_secret, '%P'))
+        self.client_secret_entry = tk.Entry(self, width=35, show="*", validate='key', validatecommand=(self.validate_secret, '%P'))
         self.client_secret_entry.pack(pady=5)
 
         # 保存オプション
         self.save_credentials_var = tk.BooleanVar()
         self.save_credentials_check = tk.Checkbutton(
-            self.master, text="次回の認証のためにクライアント情報を保存する", variable=self.save_credentials_var
+            self, text="次回の認証のためにクライアント情報を保存する", variable=self.save_credentials_var
         )
         self.save_credentials_check.pack(pady=15)
 
         # 認証ボタン
-        self.auth_button = tk.Button(self.master, text="認証", command=self.authenticate, width=20, height=2)
+        self.auth_button = tk.Button(self, text="認証", command=self.authenticate, width=20, height=2)
         self.auth_button.pack(pady=5)
 
     def authenticate(self):
@@ -82,31 +82,40 @@ class AuthView(tk.Frame):
         Credential.client_id = self.client_id
         Credential.client_secret = self.client_secret
 
+        # 認証のモジュール(fitbit, cherrypy, requests)は認証するときに読み込む
+        from ..controllers.auth_controller import OAuth2Controller
         auth_controller = OAuth2Controller(self.error_callback, self.success_callback)
         auth_controller.browser_authorize()
 
     def error_callback(self, error_message: str):
-        """エラー時のコールバック"""
+        """エラー時のコールバック(認証サーバーのスレッドから呼ばれる)"""
         def show_error_message():
             messagebox.showerror("エラー", f"エラー: {error_message}")
-        
-        thread = threading.Thread(target=show_error_message)
-        thread.start()
+
+        # メインスレッドでUI操作を行う
+        self.event_bus.post(show_error_message)
     
     def success_callback(self):
-        """認証成功時のコールバック"""
+        """認証成功時のコールバック(認証サーバーのスレッドから呼ばれる)"""
         def success_task():
             # 保存オプションがオンならJSONファイルに保存する
+            # (トークンも保存しておくと、コマンドラインから認証せずに取得・出力できる)
             if self.save_credentials_var.get():
                 self.auth_model.save_credentials(self.client_id, self.client_secret)
+                self.auth_model.save_token(self.client_id, {
+                    "client_secret": self.client_secret,
+                    "access_token": Credential.access_token,
+                    "refresh_token": Credential.refresh_token,
+                    "expires_at": Credential.expires_at,
+                })
             else:
                 self.auth_model.delete_credentials()
+                self.auth_model.delete_token(self.client_id)
 
-            # メインスレッドでUI操作を行う
-            self.master.after(0, ViewController.switch_to_main_view, self.master)
+            ViewController.switch_to_main_view()
 
-        thread = threading.Thread(target=success_task)
-        thread.start()
+        # チェックボックスの値の読み取りと画面の切り替えは、メインスレッドで行う
+        self.event_bus.post(success_task)
             
 
     def _validate_client_id(self, new_value):
@@ -0,0 +1,75 @@
+import queue
+import sys
+
+class UiEventBus:
+    """ワーカースレッドからTkのメインスレッドへ処理を渡すキュー
+
+    Tkのウィジェットはメインスレッド以外から操作できないので、
+    ワーカースレッドは post で呼び出したい関数をキューに積み、
+    メインスレッドが after で定期的にキューを取り出して実行する。
+    """
+    POLL_INTERVAL_MS = 50
+
+    # 1回の取り出しで実行する最大件数(大量に積まれても画面を止めない)
+    MAX_EVENTS_PER_POLL = 100
+
+    # Tkのルートウィンドウ → イベントバス
+    _buses = {}
+
+    def __init__(self, root):
+        """
+        Args:
+            root: Tkのルートウィンドウ(メインスレッドで作ったもの)
+        """
+        self.root = root
+        self.queue = queue.Queue()
+        self._after_id = None
+
+    @classmethod
+    def of(cls, widget) -> 'UiEventBus':
+        """ウィジェットのルートウィンドウのイベントバスを返す(無ければ作って取り出しを始める)
+           メインスレッドから呼ぶ
+
+        Args:
+            widget: Tkのウィジェット
+        """
+        root = widget._root()
+
+        bus = cls._buses.get(root)
+        if bus is None:
+            bus = cls(root)
+            cls._buses[root] = bus
+            bus.start()
+        return bus
+
+    def start(self):
+        """キューの取り出しを始める"""
+        if self._after_id is None:
+            self._after_id = self.root.after(self.POLL_INTERVAL_MS, self._drain)
+
+    def stop(self):
+        """キューの取り出しをやめる(ルートウィンドウを閉じるとき)"""
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+        self._buses.pop(self.root, None)
+
+    def post(self, func, *args, **kwargs):
+        """メインスレッドで func(*args, **kwargs) を実行する(どのスレッドからでも呼べる)"""
+        self.queue.put((func, args, kwargs))
+
+    def _drain(self):
+        try:
+            for _ in range(self.MAX_EVENTS_PER_POLL):
+                try:
+                    func, args, kwargs = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                # 1つのイベントでエラーになっても、残りのイベントは実行する
+                try:
+                    func(*args, **kwargs)
+                except Exception:
+                    self.root.report_callback_exception(*sys.exc_info())
+        finally:
+            self._after_id = self.root.after(self.POLL_INTERVAL_MS, self._drain)
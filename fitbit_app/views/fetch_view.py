@@ -3,31 +3,21 @@ import tkinter as tk
 from tkinter import messagebox
 from tkcalendar import DateEntry
 from ..controllers.view_controller import ViewController
-from ..controllers.fetch_controller import FetchController
 
 class FetchView(tk.Frame):
     def __init__(self, master):
         super().__init__(master)
-        self.pack()
         self.master = master
-        self.master.title("データ取得画面")
 
-        # ウィンドウの大きさを指定
-        window_width = 350
-        window_height = 300
+        # Fitbitクライアントとレート制限は、画面を切り替えても次の取得で使い回す
+        self.fitbit = None
+        self.rate_limiter = None
 
-        # ウィンドウを画面中央に配置
-        screen_width = self.master.winfo_screenwidth()
-        screen_height = self.master.winfo_screenheight()
-        pos_x = (screen_width // 2) - (window_width // 2)
-        pos_y = (screen_height // 2) - (window_height // 2)
-        self.master.geometry(f"{window_width}x{window_height}+{pos_x}+{pos_y}")
-        
-        label = tk.Label(self.master, text="データ取得画面です。", wraplength=300)
+        label = tk.Label(self, text="データ取得画面です。", wraplength=300)
         label.pack(pady=20)
 
         # 開始日入力フォーム
-        self.start_date_frame = tk.Frame(self.master)
+        self.start_date_frame = tk.Frame(self)
         self.start_date_frame.pack(anchor=tk.CENTER, pady=10)
         self.start_date_label = tk.Label(self.start_date_frame, text="開始日: ")
         self.start_date_label.pack(side=tk.LEFT, padx=5)
@@ -35,19 +25,51 @@ class FetchView(tk.Frame):
         self.start_date_entry.pack(side=tk.LEFT, padx=5)
 
         # 終了日入力フォーム
-        self.end_date_frame = tk.Frame(self.master)
+        self.end_date_frame = tk.Frame(self)
         self.end_date_frame.pack(anchor=tk.CENTER, pady=10)
         self.end_date_label = tk.Label(self.end_date_frame, text="終了日: ")
         self.end_date_label.pack(side=tk.LEFT, padx=5)
         self.end_date_entry = DateEntry(self.end_date_frame, showweeknumbers=False, date_pattern="yyyy/mm/dd", locale='ja_JP')
         self.end_date_entry.pack(side=tk.LEFT, padx=5)
 
-        self.fetch_button = tk.Button(self.master, text="データを取得する", command=self.fetch_data)
+        # 取得済みの日を除いて取得するオプション
+        self.sync_missing_only_var = tk.BooleanVar(value=True)
+        self.sync_missing_only_check = tk.Checkbutton(
+            self, text="取得済みの日は取得しない(直近の日は取得し直す)", variable=self.sync_missing_only_var
+        )
+        self.sync_missing_only_check.pack(pady=(10, 0))
+
+        # 15分ごとの歩数(グラフの時間帯別歩数)も取得するオプション(既定でオン)
+        # (1日ずつ取得するので1日あたり2リクエスト。オフにすると期間APIでまとめて取得し、リクエストは減るが1日の合計だけになる)
+        # (取得済みで15分ごとの歩数が無い日も取得し直す)
+        self.fetch_step_intraday_var = tk.BooleanVar(value=True)
+        self.fetch_step_intraday_check = tk.Checkbutton(
+            self, text="時間帯別の歩数も取得する(1日ずつ取得します)", variable=self.fetch_step_intraday_var
+        )
+        self.fetch_step_intraday_check.pack()
+
+        self.fetch_button = tk.Button(self, text="データを取得する", command=self.fetch_data)
         self.fetch_button.pack(pady=20)
 
-        self.close_button = tk.Button(self.master, text="メイン画面に戻る", command=lambda: ViewController.switch_to_main_view(self.master))
+        self.close_button = tk.Button(self, text="メイン画面に戻る", command=ViewController.switch_to_main_view)
         self.close_button.pack(pady=10)
 
+    def on_show(self):
+        """画面を表示するときに、ウィンドウのタイトルと大きさを設定する"""
+        window = self.winfo_toplevel()
+        window.title("データ取得画面")
+
+        # ウィンドウの大きさを指定
+        window_width = 350
+        window_height = 370
+
+        # ウィンドウを画面中央に配置
+        screen_width = window.winfo_screenwidth()
+        screen_height = window.winfo_screenheight()
+        pos_x = (screen_width // 2) - (window_width // 2)
+        pos_y = (screen_height // 2) - (window_height // 2)
+        window.geometry(f"{window_width}x{window_height}+{pos_x}+{pos_y}")
+
     def fetch_data(self):
         start_date = self.start_date_entry.get_date()
         end_date = self.end_date_entry.get_date()
@@ -62,7 +84,18 @@ class FetchView(tk.Frame):
             end_date = today
             messagebox.showinfo("情報", "未来の日付が指定されているので、今日の日付にします。")
 
-        fetch_controller = FetchController(self.master, start_date, end_date, self.show_error, self.show_success)
+        # 通信のモジュール(fitbit, requests)は取得するときに読み込む
+        from ..controllers.fetch_controller import FetchController
+        fetch_controller = FetchController(
+            self, start_date, end_date, self.show_error, self.show_success,
+            fetch_mode=(
+                FetchController.FETCH_MODE_DAILY if self.fetch_step_intraday_var.get() else FetchController.FETCH_MODE_RANGE
+            ),
+            sync_missing_only=self.sync_missing_only_var.get(),
+            fitbit=self.fitbit, rate_limiter=self.rate_limiter
+        )
+        self.fitbit = fetch_controller.fitbit
+        self.rate_limiter = fetch_controller.rate_limiter
         fetch_controller.start_fetch()
 
     def show_error(self, error_message: str):
@@ -1,33 +1,19 @@
+import os
 import tkinter as tk
 from tkinter import ttk, messagebox
 from datetime import datetime
 from ..controllers.view_controller import ViewController
-from ..controllers.output_month_controller import OutputMonthController
 
 class OutputMonthView(tk.Frame):
     def __init__(self, master):
         super().__init__(master)
-        self.pack()
-
         self.master = master
-        self.master.title("データ出力画面")
-
-        # ウィンドウの大きさを指定
-        window_width = 350
-        window_height = 250
 
-        # ウィンドウを画面中央に配置
-        screen_width = self.master.winfo_screenwidth()
-        screen_height = self.master.winfo_screenheight()
-        pos_x = (screen_width // 2) - (window_width // 2)
-        pos_y = (screen_height // 2) - (window_height // 2)
-        self.master.geometry(f"{window_width}x{window_height}+{pos_x}+{pos_y}")
-        
-        self.label = tk.Label(self.master, text="データ出力画面です。", wraplength=300)
+        self.label = tk.Label(self, text="データ出力画面です。", wraplength=300)
         self.label.pack(pady=20)
 
         # 年月入力用フレーム
-        self.date_frame = tk.Frame(self.master)
+        self.date_frame = tk.Frame(self)
         self.date_frame.pack(anchor=tk.CENTER, pady=10)
 
         # 年選択用コンボボックス
@@ -47,19 +33,87 @@ class OutputMonthView(tk.Frame):
         self.month_label = tk.Label(self.date_frame, text="月", wraplength=5)
         self.month_label.pack(side=tk.LEFT)
 
-        self.output_button = tk.Button(self.master, text="データを出力する", command=self.output_data)
-        self.output_button.pack(pady=20)
+        self.output_button = tk.Button(self, text="データを出力する", command=self.output_data)
+        self.output_button.pack(pady=(10, 20))
 
-        self.close_button = tk.Button(self.master, text="メイン画面に戻る", command=lambda: ViewController.switch_to_main_view(self.master))
+        # 期間出力用(上で選んだ年月から、ここで選んだ年月まで)
+        self.batch_frame = tk.Frame(self)
+        self.batch_frame.pack(anchor=tk.CENTER, pady=5)
+        self.batch_label = tk.Label(self.batch_frame, text="終了:")
+        self.batch_label.pack(side=tk.LEFT, padx=2)
+
+        self.end_year_combobox = ttk.Combobox(self.batch_frame, values=years, state="readonly", width=5)
+        self.end_year_combobox.set(str(current_year))
+        self.end_year_combobox.pack(side=tk.LEFT, padx=2)
+        self.end_year_label = tk.Label(self.batch_frame, text="年", wraplength=5)
+        self.end_year_label.pack(side=tk.LEFT)
+
+        self.end_month_combobox = ttk.Combobox(self.batch_frame, values=months, state="readonly", width=3)
+        self.end_month_combobox.set(str(datetime.now().month))
+        self.end_month_combobox.pack(side=tk.LEFT, padx=2)
+        self.end_month_label = tk.Label(self.batch_frame, text="月", wraplength=5)
+        self.end_month_label.pack(side=tk.LEFT)
+
+        self.combine_var = tk.BooleanVar()
+        self.combine_check = tk.Checkbutton(self, text="1つのPDFにまとめる", variable=self.combine_var)
+        self.combine_check.pack(pady=5)
+
+        self.batch_output_button = tk.Button(self, text="期間をまとめて出力する", command=self.output_batch_data)
+        self.batch_output_button.pack(pady=10)
+
+        self.close_button = tk.Button(self, text="メイン画面に戻る", command=ViewController.switch_to_main_view)
         self.close_button.pack(pady=10)
 
+    def on_show(self):
+        """画面を表示するときに、ウィンドウのタイトルと大きさを設定する"""
+        window = self.winfo_toplevel()
+        window.title("データ出力画面")
+
+        # ウィンドウの大きさを指定
+        window_width = 350
+        window_height = 400
+
+        # ウィンドウを画面中央に配置
+        screen_width = window.winfo_screenwidth()
+        screen_height = window.winfo_screenheight()
+        pos_x = (screen_width // 2) - (window_width // 2)
+        pos_y = (screen_height // 2) - (window_height // 2)
+        window.geometry(f"{window_width}x{window_height}+{pos_x}+{pos_y}")
+
     def output_data(self):
         year = int(self.year_combobox.get())
         month = int(self.month_combobox.get())
-        
-        output_month_controller = OutputMonthController(self.master, year, month, self.show_error)
+
+        # グラフ描画のモジュール(pandas, matplotlib など)は重いので、出力するときに読み込む
+        from ..controllers.output_month_controller import OutputMonthController
+        output_month_controller = OutputMonthController(self, year, month, self.show_error)
         output_month_controller.start_plot()
 
+    def output_batch_data(self):
+        start_year = int(self.year_combobox.get())
+        start_month = int(self.month_combobox.get())
+        end_year = int(self.end_year_combobox.get())
+        end_month = int(self.end_month_combobox.get())
+
+        if (end_year, end_month) < (start_year, start_month):
+            messagebox.showerror("エラー", "終了月が開始月より前です。正しく選択してください。")
+            return
+
+        from ..controllers.output_batch_controller import OutputBatchController
+        output_batch_controller = OutputBatchController(
+            self, start_year, start_month, end_year, end_month,
+            self.show_error, self.show_batch_success, combine=self.combine_var.get()
+        )
+        output_batch_controller.start_export()
+
+    def show_batch_success(self, pdf_paths: list):
+        """期間出力の成功時のコールバック"""
+        # 1つならPDF、複数なら保存先のフォルダを開く
+        if len(pdf_paths) == 1:
+            os.startfile(pdf_paths[0])
+        else:
+            os.startfile(os.path.dirname(pdf_paths[0]))
+
     def show_error(self, error_message: str):
         """エラー時のコールバック"""
         messagebox.showerror("エラー", f"エラー: {error_message}")
\ No newline at end of file
@@ -1,16 +1,25 @@
+import threading
 import tkinter as tk
 from tkinter import ttk
+from ..controllers.progress_reporter import ProgressReporter
 
 class ProgressView(tk.Toplevel):
-    def __init__(self, master, message):
+    def __init__(self, master, message, cancel_token=None):
+        """
+        Args:
+            master: 親ウィンドウ
+            message (str): 表示するメッセージ
+            cancel_token (CancelToken): 渡すとキャンセルボタンを表示する(閉じるボタンでもキャンセルする)
+        """
         super().__init__(master)
         self.message = message
+        self.cancel_token = cancel_token
 
         self.title("進捗状況")
 
         # ウィンドウの大きさを指定
-        window_width = 250
-        window_height = 100
+        window_width = 320
+        window_height = 170 if cancel_token is None else 210
 
         # ウィンドウを画面中央に配置
         screen_width = self.winfo_screenwidth()
@@ -19,14 +28,110 @@ class ProgressView(tk.Toplevel):
         pos_y = (screen_height // 2) - (window_height // 2)
         self.geometry(f"{window_width}x{window_height}+{pos_x}+{pos_y}")
 
-        # 閉じるボタンを無効化
-        self.protocol("WM_DELETE_WINDOW", self.disable_close_button)
+        # キャンセルできないときは閉じるボタンを無効化
+        if cancel_token is None:
+            self.protocol("WM_DELETE_WINDOW", self.disable_close_button)
+        else:
+            self.protocol("WM_DELETE_WINDOW", self.cancel)
 
         self.date_label = ttk.Label(self, text=message, font=("normal", 11))
-        self.date_label.pack(pady=30)
+        self.date_label.pack(pady=(20, 10))
+
+        # 件数が分かるまでは動き続けるバーにする
+        self.progress_bar = ttk.Progressbar(self, length=260, mode='indeterminate')
+        self.progress_bar.pack(pady=5)
+        self.progress_bar.start(15)
+
+        self.count_label = ttk.Label(self, text="")
+        self.count_label.pack()
+        self.rate_label = ttk.Label(self, text="")
+        self.rate_label.pack()
+
+        if cancel_token is not None:
+            self.cancel_button = ttk.Button(self, text="キャンセル", command=self.cancel)
+            self.cancel_button.pack(pady=10)
+
+    def update_progress(self, progress: dict):
+        """進捗を表示する(メインスレッドから呼ぶ)
+
+        Args:
+            progress (dict): ProgressReporter.snapshot の値
+        """
+        if not self.winfo_exists():
+            return
+
+        total = progress['total']
+        if total > 0:
+            if self.progress_bar['mode'] != 'determinate':
+                self.progress_bar.stop()
+                self.progress_bar.configure(mode='determinate', maximum=total)
+            self.progress_bar['value'] = progress['done']
+            self.count_label.configure(text=f"{progress['done']} / {total} 件")
+
+        self.rate_label.configure(text=self._format_rate(progress))
+
+    def _format_rate(self, progress: dict) -> str:
+        """速さ・残り時間・レート制限の残りを1行にする"""
+        texts = []
+
+        if 'requests_per_second' in progress:
+            texts.append(f"{progress['requests_per_second']:.1f} リクエスト/秒")
+        elif progress['items_per_second'] > 0:
+            texts.append(f"{progress['items_per_second']:.1f} 件/秒")
+
+        if progress['eta'] is not None and progress['done'] < progress['total']:
+            minutes, seconds = divmod(int(progress['eta']), 60)
+            texts.append(f"残り {minutes}:{seconds:02}")
+
+        if 'remaining' in progress and 'limit' in progress:
+            texts.append(f"API残り {progress['remaining']}/{progress['limit']}")
+
+        return "  ".join(texts)
+
+    def cancel(self):
+        """処理をキャンセルする(処理が区切りまで進んで止まったら、呼び出し側が close する)"""
+        self.cancel_token.cancel()
+        self.cancel_button.configure(state=tk.DISABLED)
+        self.date_label.configure(text="キャンセルしています...")
 
     def close(self):
         self.destroy()
 
     def disable_close_button(self):
         pass
+
+class ProgressViewReporter(ProgressReporter):
+    """ワーカースレッドからの進捗を、イベントバス経由で ProgressView に表示する
+
+    1件ごとにイベントを積むと大量になるので、表示待ちのイベントが1つある間は積まない。
+    """
+
+    def __init__(self, progress_view: ProgressView, event_bus):
+        """
+        Args:
+            progress_view (ProgressView): 表示先
+            event_bus (UiEventBus): メインスレッドで表示するためのイベントバス
+        """
+        super().__init__()
+        self.progress_view = progress_view
+        self.event_bus = event_bus
+        self._pending = threading.Event()
+
+    def on_start(self):
+        self._request_update()
+
+    def on_advance(self):
+        self._request_update()
+
+    def on_finish(self):
+        self._request_update()
+
+    def _request_update(self):
+        if not self._pending.is_set():
+            self._pending.set()
+            self.event_bus.post(self._update)
+
+    def _update(self):
+        # メインスレッドで実行される
+        self._pending.clear()
+        self.progress_view.update_progress(self.snapshot())
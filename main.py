@@ -1,5 +1,14 @@
-import matplotlib.backends.backend_pdf # pyinstaller でexe化するときに必要
-from fitbit_app.controllers.view_controller import ViewController
+import multiprocessing
+import sys
 
 if __name__ == "__main__":
+    # exe化したときに、期間出力のワーカープロセスがGUIを起動しないようにする
+    multiprocessing.freeze_support()
+
+    # 引数があればコマンドラインで実行する(画面を使わない)
+    if len(sys.argv) > 1:
+        from fitbit_app.cli import main
+        sys.exit(main())
+
+    from fitbit_app.controllers.view_controller import ViewController
     ViewController.start_auth_view()
@@ -0,0 +1,113 @@
+"""DailySummary(日ごとの睡眠と歩数の集計)を確認する
+
+実行(リポジトリのルートで):
+    python -m unittest discover -s tests -v
+"""
+import os
+import sqlite3
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fitbit_app.models.daily_summary import DailySummary
+from fitbit_app.models.fetch_model import FetchModel
+from fitbit_app.models.sleep_segment import SleepSegment
+
+def segment(date_time: str, level: str, seconds: int) -> dict:
+    return {'dateTime': f'{date_time}.000', 'level': level, 'seconds': seconds}
+
+# 3日に起きた主睡眠(2日22:00~3日1:00)と、3日の昼寝
+MAIN_SLEEP = [
+    segment('2024-03-02T22:00:00', 'wake', 600),    # 入眠前
+    segment('2024-03-02T22:10:00', 'light', 3600),
+    segment('2024-03-02T23:10:00', 'wake', 300),    # 中途覚醒
+    segment('2024-03-02T23:15:00', 'deep', 3600),
+    segment('2024-03-03T00:15:00', 'rem', 1800),
+    segment('2024-03-03T00:45:00', 'wake', 900),    # 起床後
+]
+NAP = [segment('2024-03-03T14:00:00', 'light', 1200)]
+
+class DailySummaryTest(unittest.TestCase):
+
+    def summary(self, row: tuple) -> dict:
+        return dict(zip(DailySummary.COLUMNS, row))
+
+    def test_to_row(self):
+        segments = SleepSegment.to_rows('2024-03-03', [MAIN_SLEEP, NAP])
+        summary = self.summary(DailySummary.to_row('2024-03-03', 8000, segments))
+
+        self.assertEqual(summary['date'], '2024-03-03')
+        self.assertEqual(summary['step_count'], 8000)
+        self.assertEqual(summary['sleep_log_count'], 2)
+        self.assertEqual(summary['time_in_bed_seconds'], 12000)
+        self.assertEqual(summary['total_sleep_seconds'], 10200)
+        self.assertEqual(summary['wake_seconds'], 1800)
+        self.assertEqual(summary['light_seconds'], 4800)
+        self.assertEqual(summary['deep_seconds'], 3600)
+        self.assertEqual(summary['rem_seconds'], 1800)
+
+        # 入眠・起床時刻と中途覚醒は主睡眠から(入眠前と起床後に起きていた区間は数えない)
+        self.assertEqual(summary['onset_ts'], SleepSegment.to_timestamp('2024-03-02T22:10:00.000'))
+        self.assertEqual(summary['wake_ts'], SleepSegment.to_timestamp('2024-03-03T00:45:00.000'))
+        self.assertEqual(summary['awakenings'], 1)
+
+    def test_to_row_classic_restless_is_awake(self):
+        segments = SleepSegment.to_rows('2024-03-03', [[
+            segment('2024-03-03T00:00:00', 'asleep', 3600),
+            segment('2024-03-03T01:00:00', 'restless', 600),
+            segment('2024-03-03T01:10:00', 'asleep', 3600),
+        ]])
+        summary = self.summary(DailySummary.to_row('2024-03-03', None, segments))
+
+        self.assertEqual(summary['total_sleep_seconds'], 7200)
+        self.assertEqual(summary['restless_seconds'], 600)
+        self.assertEqual(summary['awakenings'], 1)
+
+    def test_to_row_without_sleep(self):
+        summary = self.summary(DailySummary.to_row('2024-03-04', 5000, []))
+
+        self.assertEqual(summary['sleep_log_count'], 0)
+        self.assertEqual(summary['time_in_bed_seconds'], 0)
+        self.assertIsNone(summary['onset_ts'])
+        self.assertIsNone(summary['wake_ts'])
+        self.assertEqual(summary['awakenings'], 0)
+
+    def test_rebuild_and_ensure_table(self):
+        conn = sqlite3.connect(':memory:')
+        try:
+            conn.execute(FetchModel.CREATE_STEP_TABLE)
+            conn.execute(SleepSegment.CREATE_TABLE)
+            conn.executemany('INSERT INTO step_data (date, step_count) VALUES (?, ?)', [
+                ('2024-03-03', 8000), ('2024-03-04', 5000),
+            ])
+            SleepSegment.replace_rows(
+                conn.cursor(), ['2024-03-02', '2024-03-03'],
+                SleepSegment.to_rows('2024-03-02', [NAP]) + SleepSegment.to_rows('2024-03-03', [MAIN_SLEEP, NAP])
+            )
+            conn.commit()
+
+            # 歩数だけの日・睡眠だけの日も1行にする
+            DailySummary.ensure_table(conn)
+            rows = {
+                row[0]: self.summary(row)
+                for row in conn.execute(f"SELECT {', '.join(DailySummary.COLUMNS)} FROM daily_summary")
+            }
+            self.assertEqual(sorted(rows), ['2024-03-02', '2024-03-03', '2024-03-04'])
+            self.assertIsNone(rows['2024-03-02']['step_count'])
+            self.assertEqual(rows['2024-03-03']['total_sleep_seconds'], 10200)
+            self.assertEqual(rows['2024-03-04']['sleep_log_count'], 0)
+
+            # 集計済みなら作り直さない
+            conn.execute("DELETE FROM step_data WHERE date = '2024-03-04'")
+            DailySummary.ensure_table(conn)
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM daily_summary').fetchone()[0], 3)
+
+            # 作り直すと、保存済みのデータに合わせる
+            self.assertEqual(DailySummary.rebuild(conn), 2)
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM daily_summary').fetchone()[0], 2)
+        finally:
+            conn.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+"""Fitbit APIの代わりのサーバー(benchmarks/fitbit_simulator.py)を相手に、データ取得を通しで確認する
+
+空いているポートでサーバーを起動し、同期・非同期の両方の取得エンジンで数日分を取得して、
+保存した行・トークンの更新(401 expired_token)・429の再試行を確認する。
+
+実行(リポジトリのルートで):
+    python -m unittest discover -s tests -v
+"""
+from datetime import date, timedelta
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.join(REPO_ROOT, 'benchmarks'))
+
+import fitbit_simulator
+from fitbit_app.controllers.fetch_controller import FetchController
+from fitbit_app.models.auth_model import AuthModel
+from fitbit_app.models.credential import Credential
+from fitbit_app.models.database import Database
+
+CLIENT_ID = 'SIMULATOR'
+
+START_DATE = date(2024, 3, 1)
+END_DATE = date(2024, 3, 4)
+
+simulator = None
+api_endpoint = None
+
+def setUpModule():
+    global simulator, api_endpoint
+    # トークンの期限は長くしておき、期限切れは各テストで最初のトークンだけにする
+    simulator = fitbit_simulator.FitbitSimulator(seed=1, token_ttl=3600)
+
+    # サーバーのアクセスログを取得エラーのログ(error_log/fetch_error.log)に書かない
+    logging.getLogger('cherrypy').propagate = False
+    api_endpoint = fitbit_simulator.start(simulator, port=0)
+
+def tearDownModule():
+    fitbit_simulator.stop()
+
+class FetchSimulatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.work_dir = tempfile.mkdtemp(prefix='fitbit_fetch_test_')
+        os.chdir(self.work_dir)
+
+        # 期限切れのアクセストークンから始める(最初のリクエストが401になり、トークンを更新する)
+        self.expired_access_token = f'expired-{self.id()}'
+        with simulator._lock:
+            simulator._token_expires[self.expired_access_token] = 0
+
+        Credential.client_id = CLIENT_ID
+        Credential.client_secret = 'secret'
+        Credential.access_token = self.expired_access_token
+        Credential.refresh_token = 'refresh-token'
+        Credential.expires_at = ''
+
+        # トークンを保存してあるときだけ、更新したトークンを保存する
+        AuthModel().save_token(CLIENT_ID, {
+            'client_secret': 'secret',
+            'access_token': self.expired_access_token,
+            'refresh_token': 'refresh-token',
+            'expires_at': '',
+        })
+
+        simulator.throttle_rate = 0.0
+        self.stats_before = dict(simulator.stats)
+
+    def tearDown(self):
+        Database.close()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_thread_engine_daily(self):
+        self._fetch(FetchController.FETCH_ENGINE_THREAD, FetchController.FETCH_MODE_DAILY)
+        self._assert_saved(step_intraday=True)
+        self._assert_token_refreshed()
+
+    def test_async_engine_daily(self):
+        self._fetch(FetchController.FETCH_ENGINE_ASYNC, FetchController.FETCH_MODE_DAILY)
+        self._assert_saved(step_intraday=True)
+        self._assert_token_refreshed()
+
+    def test_thread_engine_range(self):
+        self._fetch(FetchController.FETCH_ENGINE_THREAD, FetchController.FETCH_MODE_RANGE)
+        self._assert_saved(step_intraday=False)
+        self._assert_token_refreshed()
+
+    def test_async_engine_range(self):
+        self._fetch(FetchController.FETCH_ENGINE_ASYNC, FetchController.FETCH_MODE_RANGE)
+        self._assert_saved(step_intraday=False)
+        self._assert_token_refreshed()
+
+    def test_retry_after_429(self):
+        # 1つずつ送り、乱数を作り直して、どのリクエストが429になるかを毎回同じにする
+        simulator.throttle_rate = 0.3
+        for engine in (FetchController.FETCH_ENGINE_THREAD, FetchController.FETCH_ENGINE_ASYNC):
+            with self.subTest(engine=engine):
+                with simulator._lock:
+                    simulator._rng = random.Random(1)
+                responses_429 = simulator.stats['responses_429']
+
+                self._fetch(engine, FetchController.FETCH_MODE_DAILY, concurrency=1)
+                self.assertGreater(simulator.stats['responses_429'], responses_429)
+                self._assert_saved(step_intraday=True)
+
+    def _fetch(self, engine: str, mode: str, concurrency: int = 4):
+        controller = FetchController(
+            None, START_DATE, END_DATE, None, None,
+            fetch_mode=mode, sync_missing_only=False, fetch_engine=engine,
+            api_endpoint=api_endpoint, concurrency=concurrency
+        )
+        controller.fetch()
+
+    def _assert_saved(self, step_intraday: bool):
+        """保存した行がサーバーの返したデータと一致するか確認する"""
+        dates = [START_DATE + timedelta(days=i) for i in range((END_DATE - START_DATE).days + 1)]
+
+        connection = sqlite3.connect(Database.path(CLIENT_ID))
+        try:
+            step_counts = dict(connection.execute('SELECT date, step_count FROM step_data').fetchall())
+            segment_counts = dict(connection.execute(
+                'SELECT date, COUNT(*) FROM sleep_segment GROUP BY date'
+            ).fetchall())
+            intraday_dates = {row[0] for row in connection.execute('SELECT date FROM step_intraday')}
+            sync_state_count = connection.execute('SELECT COUNT(*) FROM sync_state').fetchone()[0]
+        finally:
+            connection.close()
+
+        expected_step_counts = {
+            current_date.isoformat(): int(simulator.steps_range(current_date, current_date)['activities-steps'][0]['value'])
+            for current_date in dates
+        }
+        self.assertEqual(step_counts, expected_step_counts)
+
+        for current_date in dates:
+            sleep = simulator.sleep_day(current_date)['sleep']
+            expected_segments = sum(len(sleep_log['levels']['data']) for sleep_log in sleep)
+            self.assertEqual(segment_counts.get(current_date.isoformat(), 0), expected_segments, current_date)
+
+        # 15分ごとの歩数は1日ずつ取得したときだけ保存する
+        expected_intraday_dates = {current_date.isoformat() for current_date in dates} if step_intraday else set()
+        self.assertEqual(intraday_dates, expected_intraday_dates)
+
+        # 歩数と睡眠の取得状況
+        self.assertEqual(sync_state_count, len(dates) * 2)
+
+    def _assert_token_refreshed(self):
+        """401 expired_token でトークンを更新し、保存してあるトークンも書き換えたか確認する"""
+        self.assertGreaterEqual(simulator.stats['responses_401'] - self.stats_before['responses_401'], 1)
+        self.assertGreaterEqual(simulator.stats['token_refreshes'] - self.stats_before['token_refreshes'], 1)
+
+        self.assertNotEqual(Credential.access_token, self.expired_access_token)
+        saved_token = AuthModel().load_token(CLIENT_ID)
+        self.assertEqual(saved_token['access_token'], Credential.access_token)
+        self.assertEqual(saved_token['refresh_token'], Credential.refresh_token)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+"""OutputMonthService の睡眠データの変換(1つのデータフレームにする・0時で分割する)を確認する
+
+実行(リポジトリのルートで):
+    python -m unittest discover -s tests -v
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from fitbit_app.models.output_month_service import OutputMonthService
+from fitbit_app.models.sleep_segment import SleepSegment
+
+def segment(date_time: str, level: str, seconds: int) -> dict:
+    return {'dateTime': f'{date_time}.000', 'level': level, 'seconds': seconds}
+
+class OutputMonthServiceSleepTest(unittest.TestCase):
+
+    def setUp(self):
+        self.service = OutputMonthService()
+
+        # 3日に起きた睡眠記録(2日22:00~3日1:10)。深い睡眠の区間が0時をまたぐ
+        self.sleep_rows = SleepSegment.to_rows('2024-03-03', [[
+            segment('2024-03-02T22:00:00', 'light', 3600),
+            segment('2024-03-02T23:00:00', 'deep', 7200),
+            segment('2024-03-03T01:00:00', 'wake', 600),
+        ]])
+
+    def convert(self, sleep_rows: list, first_day: str, last_day: str) -> pd.DataFrame:
+        sleep_df = self.service._convert_sleep_list_to_dataframe(sleep_rows)
+        return self.service._convert_sleep_data_df_to_24h_scale(sleep_df, first_day, last_day)
+
+    def test_sleep_frame(self):
+        sleep_df = self.service._convert_sleep_list_to_dataframe(self.sleep_rows)
+
+        self.assertEqual(list(sleep_df['start']), [
+            pd.Timestamp('2024-03-02 22:00'), pd.Timestamp('2024-03-02 23:00'), pd.Timestamp('2024-03-03 01:00'),
+        ])
+        self.assertEqual(list(sleep_df['seconds']), [3600, 7200, 600])
+        self.assertEqual(list(sleep_df['level']), ['light', 'deep', 'wake'])
+        self.assertEqual(list(sleep_df['level'].cat.categories), list(SleepSegment.LEVELS))
+        self.assertEqual(sleep_df['episode'].dtype, np.int16)
+
+    def test_split_segment_at_midnight(self):
+        sleep_df = self.convert(self.sleep_rows, '2024-03-02', '2024-03-03')
+
+        self.assertEqual(list(zip(
+            sleep_df['date'].dt.strftime('%Y-%m-%d'), sleep_df['offset'], sleep_df['seconds'], sleep_df['level']
+        )), [
+            ('2024-03-02', 22 * 3600, 3600, 'light'),
+            ('2024-03-02', 23 * 3600, 3600, 'deep'),   # 0時までの前半
+            ('2024-03-03', 0, 3600, 'deep'),           # 0時からの後半
+            ('2024-03-03', 3600, 600, 'wake'),
+        ])
+
+        # 分割しても同じ睡眠記録のまま
+        self.assertEqual(set(sleep_df['episode']), {0})
+
+    def test_drop_days_outside_period(self):
+        # 初日の前日の夜の分は描画しない
+        sleep_df = self.convert(self.sleep_rows, '2024-03-03', '2024-03-31')
+
+        self.assertEqual(list(sleep_df['date'].dt.strftime('%Y-%m-%d')), ['2024-03-03', '2024-03-03'])
+        self.assertEqual(list(sleep_df['offset']), [0, 3600])
+        self.assertEqual(list(sleep_df['seconds']), [3600, 600])
+
+    def test_segment_ending_at_midnight_is_not_split(self):
+        sleep_rows = SleepSegment.to_rows('2024-03-03', [[segment('2024-03-02T23:00:00', 'light', 3600)]])
+        sleep_df = self.convert(sleep_rows, '2024-03-01', '2024-03-31')
+
+        self.assertEqual(len(sleep_df), 1)
+        self.assertEqual(sleep_df['offset'].iloc[0], 23 * 3600)
+        self.assertEqual(sleep_df['seconds'].iloc[0], 3600)
+
+    def test_episodes_per_sleep_log_and_date(self):
+        sleep_rows = (
+            SleepSegment.to_rows('2024-03-03', [
+                [segment('2024-03-03T01:00:00', 'asleep', 600)],
+                [segment('2024-03-03T14:00:00', 'asleep', 1200)],
+            ])
+            + SleepSegment.to_rows('2024-03-04', [[segment('2024-03-04T02:00:00', 'asleep', 600)]])
+        )
+        sleep_df = self.convert(sleep_rows, '2024-03-01', '2024-03-31')
+
+        self.assertEqual(list(sleep_df['episode']), [0, 1, 2])
+
+    def test_no_sleep_data(self):
+        sleep_df = self.convert([], '2024-03-01', '2024-03-31')
+
+        self.assertTrue(sleep_df.empty)
+        self.assertEqual(list(sleep_df.columns), ['date', 'offset', 'seconds', 'level', 'episode'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+"""RateLimiter(トークンバケット・429の再試行・レスポンスヘッダーの反映)を、進め方を決められる時計で確認する
+
+実行(リポジトリのルートで):
+    python -m unittest discover -s tests -v
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fitbit.exceptions import HTTPTooManyRequests
+from fitbit_app.controllers.rate_limiter import RateLimiter
+
+class FakeClock:
+    """sleep で進む時計(実際には待たない)"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+def headers(limit: int, remaining: int, reset_seconds: int) -> dict:
+    return {
+        RateLimiter.LIMIT_HEADER: str(limit),
+        RateLimiter.REMAINING_HEADER: str(remaining),
+        RateLimiter.RESET_HEADER: str(reset_seconds),
+    }
+
+def too_many_requests(retry_after: int) -> HTTPTooManyRequests:
+    error = HTTPTooManyRequests('Too Many Requests')
+    error.retry_after_secs = retry_after
+    return error
+
+class RateLimiterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.rate_limiter = RateLimiter(clock=self.clock, sleep=self.clock.sleep)
+
+    def test_burst_without_waiting(self):
+        # 上限の BURST_RATIO までは間隔を空けずに取り出せる
+        burst = RateLimiter.DEFAULT_LIMIT - int(RateLimiter.DEFAULT_LIMIT * RateLimiter.BURST_RATIO)
+        for _ in range(burst):
+            self.assertEqual(self.rate_limiter.try_acquire(), 0)
+
+        self.assertEqual(self.rate_limiter.remaining, RateLimiter.DEFAULT_LIMIT - burst)
+        self.assertEqual(self.rate_limiter.request_count, burst)
+        self.assertEqual(self.rate_limiter.in_flight, burst)
+
+    def test_pace_remaining_tokens_until_reset(self):
+        # 残りが少ないときは、残りのトークンをリセットまでに均等な間隔で取り出す
+        self.rate_limiter.update_from_headers(headers(limit=100, remaining=12, reset_seconds=1000))
+        self.assertEqual(self.rate_limiter.try_acquire(), 0)
+
+        # 取り出した後の残り11のうち、使えるのは SAFETY_MARGIN を除いた9
+        interval = 1000 / (11 - RateLimiter.SAFETY_MARGIN)
+        self.assertAlmostEqual(self.rate_limiter.try_acquire(), interval)
+
+        self.clock.now += interval
+        self.assertEqual(self.rate_limiter.try_acquire(), 0)
+        self.assertEqual(self.rate_limiter.remaining, 10)
+
+    def test_wait_until_reset_when_tokens_run_out(self):
+        self.rate_limiter.update_from_headers(headers(limit=150, remaining=RateLimiter.SAFETY_MARGIN, reset_seconds=300))
+        self.assertEqual(self.rate_limiter.try_acquire(), 300)
+
+        # リセット時刻を過ぎたら上限まで補充する
+        self.clock.now += 300
+        self.assertEqual(self.rate_limiter.try_acquire(), 0)
+        self.assertEqual(self.rate_limiter.remaining, 149)
+
+    def test_acquire_sleeps_until_token_is_available(self):
+        self.rate_limiter.update_from_headers(headers(limit=150, remaining=RateLimiter.SAFETY_MARGIN, reset_seconds=60))
+        self.rate_limiter.acquire()
+
+        self.assertEqual(self.clock.sleeps, [60])
+        self.assertEqual(self.rate_limiter.remaining, 149)
+
+    def test_update_from_headers_subtracts_other_requests_in_flight(self):
+        for _ in range(5):
+            self.rate_limiter.try_acquire()
+
+        # レスポンスを受け取った1つはサーバーが数えているが、残りの4つはまだ数えていない
+        self.rate_limiter.update_from_headers(headers(limit=150, remaining=100, reset_seconds=600))
+        self.assertEqual(self.rate_limiter.remaining, 96)
+        self.assertEqual(self.rate_limiter.reset_at, self.clock.now + 600)
+
+        # 全部のレスポンスを受け取った後は、サーバーの値のまま
+        for _ in range(5):
+            self.rate_limiter.release()
+        self.rate_limiter.update_from_headers(headers(limit=150, remaining=95, reset_seconds=600))
+        self.assertEqual(self.rate_limiter.in_flight, 0)
+        self.assertEqual(self.rate_limiter.remaining, 95)
+
+    def test_update_from_headers_ignores_missing_headers(self):
+        self.rate_limiter.update_from_headers({RateLimiter.REMAINING_HEADER: '10'})
+        self.assertEqual(self.rate_limiter.remaining, RateLimiter.DEFAULT_LIMIT)
+
+    def test_call_retries_after_429(self):
+        responses = [too_many_requests(30), too_many_requests(30), 'ok']
+
+        def request():
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        self.assertEqual(self.rate_limiter.call(request), 'ok')
+
+        # 429のたびに Retry-After の秒数だけ止めてから再試行する
+        self.assertEqual(self.clock.sleeps, [30, 30])
+        self.assertEqual(self.rate_limiter.request_count, 3)
+        self.assertEqual(self.rate_limiter.in_flight, 0)
+
+    def test_call_gives_up_after_max_retries(self):
+        def request():
+            raise too_many_requests(1)
+
+        with self.assertRaises(HTTPTooManyRequests):
+            self.rate_limiter.call(request)
+
+        self.assertEqual(self.rate_limiter.request_count, RateLimiter.MAX_RETRIES + 1)
+        self.assertEqual(self.rate_limiter.in_flight, 0)
+
+    def test_call_releases_token_when_request_fails(self):
+        def request():
+            raise ValueError('connection error')
+
+        with self.assertRaises(ValueError):
+            self.rate_limiter.call(request)
+        self.assertEqual(self.rate_limiter.in_flight, 0)
+
+    def test_pause_blocks_all_requests(self):
+        self.rate_limiter.pause(45)
+        self.assertEqual(self.rate_limiter.try_acquire(), 45)
+
+        self.clock.now += 45
+        self.assertEqual(self.rate_limiter.try_acquire(), 0)
+
+    def test_headroom(self):
+        self.rate_limiter.try_acquire()
+        self.clock.now += 100
+
+        self.assertEqual(self.rate_limiter.headroom(), {
+            'requests': 1,
+            'remaining': RateLimiter.DEFAULT_LIMIT - 1,
+            'limit': RateLimiter.DEFAULT_LIMIT,
+            'reset_in': RateLimiter.WINDOW_SECONDS - 100,
+        })
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+"""SleepMetricsService(夜ごとの睡眠指標・睡眠規則性指数・移動集計)を確認する
+
+実行(リポジトリのルートで):
+    python -m unittest discover -s tests -v
+"""
+from datetime import date, timedelta
+import math
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from fitbit_app.models.credential import Credential
+from fitbit_app.models.database import Database
+from fitbit_app.models.fetch_model import FetchModel
+from fitbit_app.models.sleep_metrics_service import SleepMetricsService
+from fitbit_app.models.sleep_segment import SleepSegment
+
+def segment(date_time: str, level: str, seconds: int) -> dict:
+    return {'dateTime': f'{date_time}.000', 'level': level, 'seconds': seconds}
+
+# 3日に起きた主睡眠(2日22:00~3日1:00)と、3日の昼寝
+MAIN_SLEEP = [
+    segment('2024-03-02T22:00:00', 'wake', 600),    # 入眠前
+    segment('2024-03-02T22:10:00', 'light', 3600),
+    segment('2024-03-02T23:10:00', 'wake', 300),    # 中途覚醒
+    segment('2024-03-02T23:15:00', 'deep', 3600),
+    segment('2024-03-03T00:15:00', 'rem', 1800),
+    segment('2024-03-03T00:45:00', 'wake', 900),    # 起床後
+]
+NAP = [segment('2024-03-03T14:00:00', 'light', 1200)]
+
+def regular_night(wake_date: date) -> list:
+    """前日23:00から7:00まで眠る睡眠記録"""
+    bedtime = f'{(wake_date - timedelta(days=1)).isoformat()}T23:00:00'
+    return SleepSegment.to_rows(wake_date.isoformat(), [[segment(bedtime, 'light', 8 * 3600)]])
+
+class ComputeNightsTest(unittest.TestCase):
+
+    def test_main_sleep_metrics(self):
+        nights = SleepMetricsService.compute_nights(SleepSegment.to_rows('2024-03-03', [MAIN_SLEEP, NAP]))
+        night = nights.loc['2024-03-03']
+
+        self.assertEqual(len(nights), 1)
+        self.assertEqual(night['onset'], np.datetime64('2024-03-02T22:10'))
+        self.assertEqual(night['wake'], np.datetime64('2024-03-03T00:45'))
+        self.assertAlmostEqual(night['time_in_bed_min'], 180)
+        self.assertAlmostEqual(night['total_sleep_min'], 150)
+        self.assertAlmostEqual(night['efficiency'], 150 / 180)
+        self.assertAlmostEqual(night['latency_min'], 10)
+        self.assertAlmostEqual(night['waso_min'], 5)  # 起床後に起きていた区間は含めない
+        self.assertAlmostEqual(night['midpoint_h'], (-110 + 45) / 2 / 60)  # 22:10と0:45の中央(前日なので負)
+        self.assertAlmostEqual(night['rem_pct'], 20)
+        self.assertAlmostEqual(night['light_pct'], 40)
+        self.assertAlmostEqual(night['deep_pct'], 40)
+        self.assertFalse(night['classic'])
+        self.assertAlmostEqual(night['nap_min'], 20)
+
+    def test_classic_sleep_has_no_stage_percentages(self):
+        nights = SleepMetricsService.compute_nights(SleepSegment.to_rows('2024-03-03', [[
+            segment('2024-03-03T00:00:00', 'asleep', 3600),
+            segment('2024-03-03T01:00:00', 'restless', 600),
+            segment('2024-03-03T01:10:00', 'asleep', 3600),
+        ]]))
+        night = nights.loc['2024-03-03']
+
+        self.assertTrue(night['classic'])
+        self.assertAlmostEqual(night['total_sleep_min'], 120)
+        self.assertAlmostEqual(night['waso_min'], 10)
+        self.assertTrue(math.isnan(night['rem_pct']))
+
+    def test_no_sleep_data(self):
+        nights = SleepMetricsService.compute_nights([])
+
+        self.assertTrue(nights.empty)
+        self.assertNotIn('sri', nights.columns)
+
+class RegularityTest(unittest.TestCase):
+
+    def test_regularity(self):
+        is_asleep = np.zeros((5, SleepMetricsService.MINUTES_PER_DAY), dtype=bool)
+        is_asleep[:, :7 * 60] = True
+        is_asleep[3] = ~is_asleep[2]  # 4日目だけ前日と正反対
+        has_sleep_log = np.ones(5, dtype=bool)
+
+        sri = SleepMetricsService._regularity(is_asleep, has_sleep_log)
+
+        # 初日は前日、最終日は翌日の睡眠記録が無いのでNaN
+        self.assertTrue(math.isnan(sri[0]))
+        self.assertEqual(list(sri[1:4]), [100, 100, -100])
+        self.assertTrue(math.isnan(sri[4]))
+
+    def test_regularity_needs_surrounding_sleep_logs(self):
+        is_asleep = np.zeros((5, SleepMetricsService.MINUTES_PER_DAY), dtype=bool)
+        has_sleep_log = np.array([True, True, False, True, True])
+
+        sri = SleepMetricsService._regularity(is_asleep, has_sleep_log)
+        self.assertTrue(np.isnan(sri).all())
+
+class RetrieveMetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.work_dir = tempfile.mkdtemp(prefix='fitbit_metrics_test_')
+        os.chdir(self.work_dir)
+        Credential.client_id = 'TEST'
+
+        # 2月10日~3月10日に毎晩同じ時刻に眠る(3月1日だけ記録が無い)
+        wake_dates = [date(2024, 2, 10) + timedelta(days=i) for i in range(30)]
+        wake_dates.remove(date(2024, 3, 1))
+
+        fetch_model = FetchModel()
+        try:
+            rows = [row for wake_date in wake_dates for row in regular_night(wake_date)]
+            SleepSegment.replace_rows(fetch_model.cursor, [wake_date.isoformat() for wake_date in wake_dates], rows)
+            fetch_model.conn.commit()
+        finally:
+            fetch_model.close()
+
+    def tearDown(self):
+        Database.close()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_retrieve_metrics_across_months(self):
+        service = SleepMetricsService()
+        service.retrieve_metrics('2024-02-25', '2024-03-05')
+        nights, rolling = service.nights, service.rolling
+
+        self.assertEqual(list(nights.index.strftime('%Y-%m-%d')), [
+            (date(2024, 2, 25) + timedelta(days=i)).isoformat() for i in range(10)
+        ])
+        self.assertEqual(nights.index.freqstr, 'D')
+
+        # 記録がある夜は毎晩同じ指標
+        recorded = nights.drop(index=np.datetime64('2024-03-01'))
+        self.assertTrue((recorded['total_sleep_min'] == 480).all())
+        self.assertTrue((recorded['midpoint_h'] == 3).all())
+        self.assertTrue(math.isnan(nights.loc['2024-03-01', 'total_sleep_min']))
+
+        # 規則性は、当日・前日・翌日に記録がそろっている日だけ(3月1日の前後はNaN)
+        self.assertEqual(list(nights.loc['2024-02-25':'2024-02-28', 'sri']), [100] * 4)
+        self.assertTrue(nights.loc['2024-02-29':'2024-03-02', 'sri'].isna().all())
+        self.assertEqual(list(nights.loc['2024-03-03':'2024-03-05', 'sri']), [100] * 3)
+
+        # 移動平均は期間の前の日の夜も使う
+        self.assertTrue((rolling['total_sleep_min_7d'] == 480).all())
+        self.assertTrue((rolling['midpoint_h_std_28d'] == 0).all())
+
+if __name__ == '__main__':
+    unittest.main()